@@ -0,0 +1,144 @@
+import asyncio
+import binascii
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import Q
+from django.http import Http404, JsonResponse
+from django.views.decorators.http import require_GET
+
+from app.models import Event, SpaceCategory, SpaceAllocation, AllocationSource
+from app.space_tree import build_space_tree
+from app.dashboard import aget_event_grid, agrid_version
+from app.conditional import async_venue_layout_condition
+
+from .serializers import EventSerializer, AllocationSerializer
+
+# Async twins of the hot read endpoints, for gate devices and dashboards
+# polling many small GETs. Under an ASGI server (e.g. gunicorn with
+# uvicorn workers) a request waiting on the database no longer holds a
+# worker. Plain Django views: DRF's APIView is synchronous.
+
+
+# =====================================================
+# HELPERS
+# =====================================================
+
+async def get_event(event_id):
+    try:
+        return await Event.objects.select_related('venue').aget(pk=event_id)
+    except Event.DoesNotExist:
+        raise Http404("Event not found.")
+
+
+async def fetch_all(queryset):
+    return [row async for row in queryset]
+
+
+def json_response(data):
+    # Lists (trees, grids) are safe to return at the top level here
+    return JsonResponse(data, safe=False)
+
+
+def page_size(request):
+    """?page_size=, as on the list APIs: PAGE_SIZE by default, at most API_MAX_PAGE_SIZE."""
+    default = settings.REST_FRAMEWORK.get('PAGE_SIZE', 50)
+    size = request.GET.get('page_size', '')
+    size = int(size) if size.isdigit() and int(size) > 0 else default
+    return min(size, getattr(settings, 'API_MAX_PAGE_SIZE', 200))
+
+
+def encode_cursor(allocation):
+    position = f"{allocation.created_at.isoformat()}|{allocation.pk}"
+    return urlsafe_b64encode(position.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """The (created_at, id) a page continues after; raises ValueError if malformed."""
+    try:
+        created_at, pk = urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(created_at), int(pk)
+    except (binascii.Error, UnicodeDecodeError, TypeError):
+        raise ValueError(cursor)
+
+
+# =====================================================
+# EVENTS
+# =====================================================
+
+@require_GET
+async def event_detail(request, event_id):
+    event = await get_event(event_id)
+    return json_response(EventSerializer(event).data)
+
+
+@require_GET
+async def event_allocations(request, event_id):
+    """
+    One page of an event's allocations, newest first, with the keyset
+    ?cursor= and ?page_size= of AllocationListAPI. The event row and the
+    page are fetched concurrently; each allocation then reuses the event
+    instance instead of joining it again.
+    """
+    allocations = SpaceAllocation.objects.filter(event_id=event_id).select_related(
+        'category__parent', 'source'
+    ).order_by('-created_at', '-id')
+    cursor = request.GET.get('cursor')
+    if cursor:
+        try:
+            created_at, pk = decode_cursor(cursor)
+        except ValueError:
+            return JsonResponse({"detail": "Invalid cursor"}, status=404)
+        allocations = allocations.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+    size = page_size(request)
+
+    event, rows = await asyncio.gather(
+        get_event(event_id),
+        fetch_all(allocations[:size + 1]),
+    )
+    next_url = None
+    if len(rows) > size:
+        rows = rows[:size]
+        query = request.GET.copy()
+        query['cursor'] = encode_cursor(rows[-1])
+        next_url = request.build_absolute_uri(f"{request.path}?{query.urlencode()}")
+    for allocation in rows:
+        allocation.event = event
+    return json_response({
+        'event': EventSerializer(event).data,
+        'next': next_url,
+        'results': AllocationSerializer(rows, many=True).data,
+    })
+
+
+@require_GET
+async def event_dashboard_data(request, event_id):
+    """
+    The event dashboard's grid and allocation sources as JSON. The event,
+    its sources and the grid version are looked up concurrently; the grid
+    query only runs on a cache miss.
+    """
+    sources = AllocationSource.objects.filter(event_id=event_id).order_by('id').values('id', 'name')
+    event, sources, version = await asyncio.gather(
+        get_event(event_id),
+        fetch_all(sources),
+        agrid_version(event_id),
+    )
+    grid = await aget_event_grid(event, version)
+    return json_response({
+        'event': EventSerializer(event).data,
+        'sources': sources,
+        'grid': grid,
+    })
+
+
+# =====================================================
+# SPACE CATEGORY TREE
+# =====================================================
+
+@require_GET
+@async_venue_layout_condition('space-tree')
+async def venue_space_tree(request, venue_id):
+    categories = SpaceCategory.objects.filter(venue_id=venue_id).order_by('id')
+    return json_response(build_space_tree(await fetch_all(categories)))
@@ -0,0 +1,26 @@
+from django.core.exceptions import ValidationError as DjangoValidationError
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+
+class QueryParamFilter(BaseFilterBackend):
+    """
+    Applies `?param=value` filters declared on the view as
+    `filter_params = {'param': 'orm__lookup'}`. Only indexed lookups
+    should be declared there.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        lookups = {}
+        for param, lookup in getattr(view, 'filter_params', {}).items():
+            value = request.query_params.get(param)
+            if value not in (None, ''):
+                lookups[lookup] = value
+        if not lookups:
+            return queryset
+
+        try:
+            queryset = queryset.filter(**lookups)
+        except (ValueError, DjangoValidationError) as e:
+            raise ValidationError({"filters": str(e)})
+        return queryset
@@ -0,0 +1,17 @@
+from django.conf import settings
+from rest_framework import pagination
+
+
+class CursorPagination(pagination.CursorPagination):
+    """
+    Keyset pagination for every list API: cost per page stays constant
+    however deep the client scrolls. `?page_size=` is honoured up to
+    settings.API_MAX_PAGE_SIZE.
+    """
+    ordering = '-id'
+    page_size_query_param = 'page_size'
+    max_page_size = getattr(settings, 'API_MAX_PAGE_SIZE', 200)
+
+
+class AllocationCursorPagination(CursorPagination):
+    ordering = ('-created_at', '-id')
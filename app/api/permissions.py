@@ -0,0 +1,28 @@
+from rest_framework.permissions import BasePermission
+
+from app.models import CustomUser
+
+
+def access_rights(user):
+    """
+    The user's CustomUser role. Requests authenticate as auth.User (no
+    AUTH_USER_MODEL swap), so the role is looked up by username.
+    """
+    if hasattr(user, 'access_rights'):
+        return user.access_rights
+    return CustomUser.objects.filter(username=user.username).values_list('access_rights', flat=True).first()
+
+
+class HasAccessRights(BasePermission):
+    """Authenticated users whose CustomUser.access_rights is one of `roles`."""
+    roles = ()
+
+    def has_permission(self, request, view):
+        user = request.user
+        if not (user and user.is_authenticated):
+            return False
+        return user.is_superuser or access_rights(user) in self.roles
+
+
+class IsGateStaff(HasAccessRights):
+    roles = ('GateStaff', 'EventAdmin', 'SuperAdmin')
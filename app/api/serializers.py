@@ -1,17 +1,74 @@
 from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
 from app.models import (
     Venue,
     SpaceCategory,
     Event,
     CustomUser,
     SpaceAllocation,
+    Claim,
 )
+from app.space_tree import build_space_tree
+from app.tokens import InvalidToken, is_signed_token, read_token
+
+# =====================================================
+# SPARSE FIELDSETS
+# =====================================================
+
+def query_param_set(request, name):
+    return {v.strip() for v in request.query_params.get(name, '').split(',') if v.strip()}
+
+
+class SparseFieldsMixin:
+    """
+    On reads, `?fields=a,b` limits the output to those fields, and fields
+    listed in Meta.expandable_fields are dropped unless named in `?expand=`
+    (or in the view's `default_expand`), so they are never computed.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None or request.method not in SAFE_METHODS:
+            return
+
+        fields = query_param_set(request, 'fields')
+        expand = query_param_set(request, 'expand') | set(self.context.get('default_expand', ()))
+        for name in getattr(self.Meta, 'expandable_fields', ()):
+            if name not in expand and name not in fields:
+                self.fields.pop(name, None)
+        if fields:
+            for name in list(self.fields):
+                if name not in fields:
+                    self.fields.pop(name)
+
+    def get_query_paths(self):
+        """
+        ORM paths (e.g. 'event__venue__name') read by the selected fields,
+        or None if a method field hasn't declared them in
+        Meta.method_field_sources.
+        """
+        sources = getattr(self.Meta, 'method_field_sources', {})
+        paths = set()
+        for name, field in self.fields.items():
+            if field.source == '*':
+                if name not in sources:
+                    return None
+                paths.update(sources[name])
+            else:
+                paths.add(field.source.replace('.', '__'))
+        return paths
+
 
 # =====================================================
 # SPACE CATEGORY (TREE, DEV FRIENDLY)
 # =====================================================
 
 class SpaceCategorySerializer(serializers.ModelSerializer):
+    """
+    Serializes a single node and walks its children lazily. Whole trees
+    should go through app.space_tree, which produces the same shape.
+    """
     children = serializers.SerializerMethodField()
     is_leaf = serializers.SerializerMethodField()
     display_name = serializers.SerializerMethodField()
@@ -59,7 +116,7 @@ class SpaceCategorySerializer(serializers.ModelSerializer):
 # VENUE
 # =====================================================
 
-class VenueSerializer(serializers.ModelSerializer):
+class VenueSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     space_tree = serializers.SerializerMethodField()
 
     class Meta:
@@ -73,17 +130,21 @@ class VenueSerializer(serializers.ModelSerializer):
             'total_capacity',
             'space_tree',
         ]
+        # Only built with ?expand=space_tree (or on venue detail)
+        expandable_fields = ['space_tree']
+        method_field_sources = {'space_tree': ()}
 
     def get_space_tree(self, obj):
-        roots = obj.spaces.filter(parent=None)
-        return SpaceCategorySerializer(roots, many=True).data
+        # Built in memory from one flat list; the views prefetch `spaces`
+        # so a whole page of venues costs a single extra query.
+        return build_space_tree(obj.spaces.all())
 
 
 # =====================================================
 # EVENT
 # =====================================================
 
-class EventSerializer(serializers.ModelSerializer):
+class EventSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     venue_name = serializers.CharField(source='venue.name', read_only=True)
 
     class Meta:
@@ -102,7 +163,7 @@ class EventSerializer(serializers.ModelSerializer):
 # USER
 # =====================================================
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = CustomUser
         fields = [
@@ -117,7 +178,7 @@ class UserSerializer(serializers.ModelSerializer):
 # SPACE ALLOCATION
 # =====================================================
 
-class AllocationSerializer(serializers.ModelSerializer):
+class AllocationSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     event_name = serializers.CharField(source='event.name', read_only=True)
     venue_name = serializers.CharField(source='event.venue.name', read_only=True)
     source_name = serializers.CharField(source='source.name', read_only=True)
@@ -146,6 +207,9 @@ class AllocationSerializer(serializers.ModelSerializer):
             'referral_token',
             'created_at',
         ]
+        method_field_sources = {
+            'category': ('category__name', 'category__ticket_tier', 'category__parent__name'),
+        }
 
     def get_category(self, obj):
         return {
@@ -157,3 +221,39 @@ class AllocationSerializer(serializers.ModelSerializer):
                 if obj.category.parent else obj.category.name
             )
         }
+
+
+# =====================================================
+# CLAIM
+# =====================================================
+
+class ClaimSerializer(serializers.ModelSerializer):
+    quantity = serializers.IntegerField(min_value=1)
+
+    class Meta:
+        model = Claim
+        fields = [
+            'id',
+            'allocation',
+            'claimant_name',
+            'department',
+            'quantity',
+            'claimed_at',
+        ]
+        read_only_fields = ['claimed_at']
+
+
+class RedeemSerializer(serializers.Serializer):
+    """Claim by referral token; validating it never touches the database."""
+    referral_token = serializers.CharField(max_length=255)
+    claimant_name = serializers.CharField(max_length=255)
+    department = serializers.CharField(max_length=255, required=False, allow_blank=True)
+    quantity = serializers.IntegerField(min_value=1)
+
+    def validate_referral_token(self, value):
+        if is_signed_token(value):
+            try:
+                read_token(value)
+            except InvalidToken as e:
+                raise serializers.ValidationError(str(e))
+        return value
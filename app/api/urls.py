@@ -1,12 +1,23 @@
 from django.urls import path
+
+from . import async_views
 from .views import (
     VenueListCreateAPI,
     VenueDetailAPI,
     VenueSpaceTreeAPI,
+    VenueValidateAPI,
     EventListCreateAPI,
     EventDetailAPI,
+    EventValidateAPI,
     UserListAPI,
     AllocationListAPI,
+    AllocationBulkAPI,
+    ClaimCreateAPI,
+    ClaimRedeemAPI,
+    ClaimImportAPI,
+    GateSnapshotAPI,
+    GateDeltaAPI,
+    FillRateAPI,
     MetaEnumsAPI,
 )
 
@@ -16,16 +27,37 @@ urlpatterns = [
     path('venues/', VenueListCreateAPI.as_view()),
     path('venues/<int:pk>/', VenueDetailAPI.as_view()),
     path('venues/<int:venue_id>/space-tree/', VenueSpaceTreeAPI.as_view()),
+    path('venues/<int:venue_id>/validate/', VenueValidateAPI.as_view()),
 
     # Events
     path('events/', EventListCreateAPI.as_view()),
     path('events/<int:pk>/', EventDetailAPI.as_view()),
+    path('events/<int:event_id>/validate/', EventValidateAPI.as_view()),
 
     # Users
     path('users/', UserListAPI.as_view()),
 
     # Allocations
     path('allocations/', AllocationListAPI.as_view()),
+    path('events/<int:event_id>/allocations/bulk/', AllocationBulkAPI.as_view()),
+
+    # Claims
+    path('claims/', ClaimCreateAPI.as_view()),
+    path('claims/redeem/', ClaimRedeemAPI.as_view()),
+    path('claims/import/', ClaimImportAPI.as_view()),
+
+    # Gate sync
+    path('events/<int:event_id>/gate/snapshot/', GateSnapshotAPI.as_view()),
+    path('events/<int:event_id>/gate/delta/', GateDeltaAPI.as_view()),
+
+    # Analytics
+    path('events/<int:event_id>/fill-rate/', FillRateAPI.as_view()),
+
+    # Async reads (ASGI)
+    path('async/events/<int:event_id>/', async_views.event_detail),
+    path('async/events/<int:event_id>/allocations/', async_views.event_allocations),
+    path('async/events/<int:event_id>/dashboard/', async_views.event_dashboard_data),
+    path('async/venues/<int:venue_id>/space-tree/', async_views.venue_space_tree),
 
     # Meta
     path('meta/enums/', MetaEnumsAPI.as_view()),
@@ -1,9 +1,15 @@
 from rest_framework import generics
-from rest_framework.permissions import AllowAny, AllowAny
+from rest_framework.permissions import AllowAny, AllowAny, SAFE_METHODS
 from rest_framework.response import Response
+from rest_framework import status
 from rest_framework.views import APIView
+from rest_framework.parsers import MultiPartParser
+from django.core.exceptions import FieldDoesNotExist, ValidationError
 from django.db import transaction
+from django.db.models import Prefetch
 from django.shortcuts import get_object_or_404
+from django.http import HttpResponse
+from django.utils.decorators import method_decorator
 
 from app.models import (
     Venue,
@@ -12,53 +18,106 @@ from app.models import (
     CustomUser,
     SpaceAllocation,
 )
-
+from app.reservations import reserve_seats
+from app.tokens import resolve_token
+from app.gate import build_snapshot, build_delta
+from app.capacity import posted_tree_violations, venue_violations, event_violations
+from app.rollups import LEVELS, fill_rate
+from app.bulk_allocation import MAX_CELLS, allocate_bulk
+from app.idempotency import idempotent
+from app.claim_import import import_claims, iter_rows
+from app.space_tree import venue_space_tree, save_space_tree
+from app.conditional import venue_layout_condition, static_condition, gate_condition
+
+from .pagination import AllocationCursorPagination
+from .permissions import IsGateStaff
 from .serializers import (
     VenueSerializer,
     EventSerializer,
     UserSerializer,
     AllocationSerializer,
     SpaceCategorySerializer,
+    ClaimSerializer,
+    RedeemSerializer,
 )
 
 # =====================================================
 # HELPER FUNCTIONS (MUST BE ABOVE THE VIEWS)
 # =====================================================
 
-def calculate_seats_with_children(hierarchy):
-    total = 0
-    for node in hierarchy:
-        total += node.get("seats_count", 0)
-
-        children = node.get("children", [])
-        if children:
-            total += calculate_seats_with_children(children)
-
-    return total
-
-
-def create_recursive(hierarchy, venue, parent=None):
-    for node in hierarchy:
-        category = SpaceCategory.objects.create(
-            venue=venue,
-            parent=parent,
-            name=node["name"],
-            category_type=node["category_type"],
-            ticket_tier=node.get("ticket_tier"),
-            seats_count=node.get("seats_count", 0),
-        )
+def sparse_queryset(queryset, paths):
+    """
+    Narrows a queryset to the ORM paths a serializer will read: only() the
+    columns, select_related() just the relations they cross. Returns None
+    if a path can't be resolved, in which case the caller keeps its queryset.
+    """
+    only = {queryset.model._meta.pk.name}
+    relations = set()
+    for path in paths:
+        parts = path.split('__')
+        model = queryset.model
+        for i, part in enumerate(parts):
+            try:
+                field = model._meta.get_field(part)
+            except FieldDoesNotExist:
+                return None
+            if not field.concrete or field.many_to_many:
+                return None
+            if field.is_relation and i < len(parts) - 1:
+                model = field.related_model
+                continue
+            only.add(path)
+            if i:
+                relations.add('__'.join(parts[:i]))
+            break
+    return queryset.select_related(None).select_related(*relations).only(*only)
+
+
+class SparseFieldsetMixin:
+    """
+    Pairs with SparseFieldsMixin serializers: reads load only what the
+    requested fields need, and `expand_prefetches` run only when their
+    field is expanded.
+    """
+    default_expand = ()
+    expand_prefetches = {}
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['default_expand'] = self.default_expand
+        return context
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.method not in SAFE_METHODS:
+            return queryset
+
+        serializer = self.get_serializer()
+        prefetches = [p for name, p in self.expand_prefetches.items() if name in serializer.fields]
+        if prefetches:
+            queryset = queryset.prefetch_related(*prefetches)
+
+        paths = serializer.get_query_paths()
+        sparse = sparse_queryset(queryset, paths) if paths is not None else None
+        return sparse if sparse is not None else queryset
 
-        children = node.get("children", [])
-        if children:
-            create_recursive(children, venue, category)
 
 # =====================================================
 # VENUES
 # =====================================================
 
-class VenueListCreateAPI(generics.ListCreateAPIView):
+SPACE_TREE_PREFETCH = {
+    'space_tree': Prefetch('spaces', queryset=SpaceCategory.objects.order_by('id')),
+}
+
+
+class VenueListCreateAPI(SparseFieldsetMixin, generics.ListCreateAPIView):
     queryset = Venue.objects.all()
     serializer_class = VenueSerializer
+    expand_prefetches = SPACE_TREE_PREFETCH
+    filter_params = {
+        'venue_type': 'venue_type',
+    }
 
     def get_permissions(self):
         if self.request.method == 'GET':
@@ -66,9 +125,15 @@ class VenueListCreateAPI(generics.ListCreateAPIView):
         return [AllowAny()]
 
 
-class VenueDetailAPI(generics.RetrieveUpdateDestroyAPIView):
+class VenueDetailAPI(SparseFieldsetMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = Venue.objects.all()
     serializer_class = VenueSerializer
+    default_expand = ('space_tree',)
+    expand_prefetches = SPACE_TREE_PREFETCH
+
+    @method_decorator(venue_layout_condition('detail', venue_kwarg='pk'))
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
 
     def get_permissions(self):
         if self.request.method == 'GET':
@@ -88,38 +153,52 @@ class VenueSpaceTreeAPI(generics.GenericAPIView):
             return [AllowAny()]
         return [AllowAny()]
 
+    @method_decorator(venue_layout_condition('space-tree'))
     def get(self, request, venue_id):
-        categories = SpaceCategory.objects.filter(
-            venue_id=venue_id,
-            parent=None
-        )
-        serializer = self.serializer_class(categories, many=True)
-        return Response(serializer.data)
+        return Response(venue_space_tree(venue_id))
 
     @transaction.atomic
     def post(self, request, venue_id):
         venue = get_object_or_404(Venue, id=venue_id)
         hierarchy = request.data
 
-        total_seats = calculate_seats_with_children(hierarchy)
-        if total_seats > venue.total_capacity:
+        violations = posted_tree_violations(hierarchy, venue.total_capacity)
+        if violations:
             return Response(
-                {"error": "Total seats exceed venue capacity"},
+                {"error": "Capacity rules violated", "violations": [v.as_dict() for v in violations]},
                 status=400
             )
 
-        venue.spaces.all().delete()
-        create_recursive(hierarchy, venue)
+        try:
+            changes = save_space_tree(venue, hierarchy)
+        except ValidationError as e:
+            return Response({"error": "Capacity rules violated", "violations": e.messages}, status=400)
+
+        return Response({"status": "Space hierarchy saved successfully", "changes": changes})
+
+
+class VenueValidateAPI(APIView):
+    """Every capacity rule the stored layout breaks, in one pass."""
+    permission_classes = [AllowAny]
+
+    def get(self, request, venue_id):
+        venue = get_object_or_404(Venue, id=venue_id)
+        violations = venue_violations(venue)
+        return Response({"valid": not violations, "violations": [v.as_dict() for v in violations]})
 
-        return Response({"status": "Space hierarchy saved successfully"})
 
 # =====================================================
 # EVENTS
 # =====================================================
 
-class EventListCreateAPI(generics.ListCreateAPIView):
+class EventListCreateAPI(SparseFieldsetMixin, generics.ListCreateAPIView):
     queryset = Event.objects.select_related('venue')
     serializer_class = EventSerializer
+    filter_params = {
+        'venue': 'venue_id',
+        'start_after': 'start_datetime__gte',
+        'start_before': 'start_datetime__lt',
+    }
 
     def get_permissions(self):
         if self.request.method == 'GET':
@@ -127,7 +206,7 @@ class EventListCreateAPI(generics.ListCreateAPIView):
         return [AllowAny()]
 
 
-class EventDetailAPI(generics.RetrieveUpdateDestroyAPIView):
+class EventDetailAPI(SparseFieldsetMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = Event.objects.all()
     serializer_class = EventSerializer
 
@@ -137,25 +216,48 @@ class EventDetailAPI(generics.RetrieveUpdateDestroyAPIView):
         return [AllowAny()]
 
 
+class EventValidateAPI(APIView):
+    """Layout, allocation, claim and ledger violations for one event."""
+    permission_classes = [AllowAny]
+
+    def get(self, request, event_id):
+        event = get_object_or_404(Event.objects.select_related('venue'), id=event_id)
+        violations = event_violations(event)
+        return Response({"valid": not violations, "violations": [v.as_dict() for v in violations]})
+
+
 # =====================================================
 # USERS
 # =====================================================
 
-class UserListAPI(generics.ListAPIView):
+class UserListAPI(SparseFieldsetMixin, generics.ListAPIView):
     queryset = CustomUser.objects.all()
     serializer_class = UserSerializer
     permission_classes = [AllowAny]
+    filter_params = {
+        'access_rights': 'access_rights',
+    }
 
 
 # =====================================================
 # ALLOCATIONS
 # =====================================================
 
-class AllocationListAPI(generics.ListCreateAPIView):
+@method_decorator(idempotent, name='dispatch')
+class AllocationListAPI(SparseFieldsetMixin, generics.ListCreateAPIView):
     queryset = SpaceAllocation.objects.select_related(
-        'event', 'category', 'source'
+        'event__venue', 'category__parent', 'source'
     )
     serializer_class = AllocationSerializer
+    pagination_class = AllocationCursorPagination
+    filter_params = {
+        'event': 'event_id',
+        'venue': 'event__venue_id',
+        'category': 'category_id',
+        'source': 'source_id',
+        'created_after': 'created_at__gte',
+        'created_before': 'created_at__lt',
+    }
 
     def get_permissions(self):
         if self.request.method == 'GET':
@@ -163,19 +265,218 @@ class AllocationListAPI(generics.ListCreateAPIView):
         return [AllowAny()]
 
 
+@method_decorator(idempotent, name='dispatch')
+class AllocationBulkAPI(APIView):
+    """
+    Allocates a matrix of cells for one event in a single transaction:
+    {"cells": [{"source": name, "category": id, "quantity": n}, ...],
+    "dry_run": false}. All cells are accepted (201) or none are: 409 if
+    zones lack seats, 400 for malformed cells. Either way the report
+    lists every cell.
+    """
+    permission_classes = [AllowAny]
+
+    def post(self, request, event_id):
+        event = get_object_or_404(Event.objects.select_related('venue'), pk=event_id)
+        cells = request.data.get('cells')
+        if not isinstance(cells, list) or not cells:
+            return Response({"error": "'cells' must be a non-empty list."}, status=400)
+        if len(cells) > MAX_CELLS:
+            return Response({"error": f"At most {MAX_CELLS} cells per request."}, status=400)
+
+        report = allocate_bulk(event, cells, dry_run=bool(request.data.get('dry_run')))
+        if report.errors:
+            return Response(report.as_dict(), status=400 if report.invalid else 409)
+        return Response(report.as_dict(), status=201 if report.accepted else 200)
+
+
+# =====================================================
+# CLAIMS
+# =====================================================
+
+@method_decorator(idempotent, name='dispatch')
+class ClaimCreateAPI(generics.CreateAPIView):
+    serializer_class = ClaimSerializer
+    permission_classes = [AllowAny]
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        reservation = reserve_seats(
+            data['allocation'].id,
+            data['quantity'],
+            data['claimant_name'],
+            data.get('department') or '',
+        )
+        if reservation.sold_out:
+            return Response(
+                {
+                    "error": "Sold out",
+                    "requested": reservation.requested,
+                    "remaining": reservation.remaining or 0,
+                },
+                status=status.HTTP_409_CONFLICT
+            )
+
+        return Response(
+            self.get_serializer(reservation.claim).data,
+            status=status.HTTP_201_CREATED
+        )
+
+
+@method_decorator(idempotent, name='dispatch')
+class ClaimRedeemAPI(APIView):
+    """
+    Redeems seats with a referral token. Signed tokens are verified in
+    memory, so the only database work is the reservation itself.
+    """
+    permission_classes = [AllowAny]
+
+    def post(self, request):
+        serializer = RedeemSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        allocation_id = resolve_token(data['referral_token'])
+        if allocation_id is None:
+            return Response({"error": "Unknown referral token"}, status=status.HTTP_404_NOT_FOUND)
+
+        reservation = reserve_seats(
+            allocation_id,
+            data['quantity'],
+            data['claimant_name'],
+            data.get('department') or '',
+        )
+        if reservation.remaining is None and reservation.sold_out:
+            # Signed for an allocation that has since been deleted
+            return Response({"error": "Unknown referral token"}, status=status.HTTP_404_NOT_FOUND)
+        if reservation.sold_out:
+            return Response(
+                {
+                    "error": "Sold out",
+                    "requested": reservation.requested,
+                    "remaining": reservation.remaining,
+                },
+                status=status.HTTP_409_CONFLICT
+            )
+
+        return Response(ClaimSerializer(reservation.claim).data, status=status.HTTP_201_CREATED)
+
+
+@method_decorator(idempotent, name='dispatch')
+class ClaimImportAPI(APIView):
+    """
+    Bulk-imports a guest list (CSV or XLSX upload in the `file` field).
+    An optional `referral_token` field applies to rows without one.
+    """
+    permission_classes = [AllowAny]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({"error": "Upload a CSV or XLSX file as 'file'."}, status=400)
+
+        report = import_claims(
+            iter_rows(upload, upload.name),
+            default_token=request.data.get('referral_token'),
+        )
+        return Response(report.as_dict(), status=400 if report.file_error else 200)
+
+
+# =====================================================
+# GATE SYNC
+# =====================================================
+
+def gate_response(sequence, payload):
+    response = HttpResponse(payload, content_type='application/octet-stream')
+    response['X-Gate-Sequence'] = str(sequence)
+    return response
+
+
+class GateSnapshotAPI(APIView):
+    """
+    Binary manifest of an event's tokens and claims for offline gate
+    devices (layout in app.gate). Unchanged since the device's copy: 304.
+    """
+    permission_classes = [IsGateStaff]
+
+    @method_decorator(gate_condition())
+    def get(self, request, event_id):
+        get_object_or_404(Event.objects.only('id'), pk=event_id)
+        return gate_response(*build_snapshot(event_id))
+
+
+class GateDeltaAPI(APIView):
+    """Claim and token changes after ?since=<sequence>, in the same binary framing."""
+    permission_classes = [IsGateStaff]
+
+    def get(self, request, event_id):
+        since = request.query_params.get('since', '')
+        if not since.isdigit():
+            return Response({"error": "'since' must be a sequence number."}, status=400)
+        get_object_or_404(Event.objects.only('id'), pk=event_id)
+        return gate_response(*build_delta(event_id, int(since)))
+
+
+# =====================================================
+# ANALYTICS
+# =====================================================
+
+class FillRateAPI(APIView):
+    """
+    Claim-rate curves for an event, read from the claim rollups.
+
+    ?level=minute|hour|day, ?by=category|source|zone|event, and
+    optionally ?category=<id> (its subtree) and ?source=<id>.
+    """
+    permission_classes = [AllowAny]
+    by_choices = ('category', 'source', 'zone', 'event')
+
+    def get(self, request, event_id):
+        level = request.query_params.get('level', 'minute')
+        by = request.query_params.get('by', 'category')
+        if level not in LEVELS:
+            return Response({"error": f"'level' must be one of {', '.join(LEVELS)}."}, status=400)
+        if by not in self.by_choices:
+            return Response({"error": f"'by' must be one of {', '.join(self.by_choices)}."}, status=400)
+
+        category_id = request.query_params.get('category')
+        source_id = request.query_params.get('source')
+        if category_id and not category_id.isdigit():
+            return Response({"error": "'category' must be an id."}, status=400)
+        if source_id and not source_id.isdigit():
+            return Response({"error": "'source' must be an id."}, status=400)
+        category = None
+        if category_id:
+            category = get_object_or_404(SpaceCategory.objects.only('path'), pk=category_id, venue__events=event_id)
+
+        series = fill_rate(
+            event_id, LEVELS[level], by=by, category=category,
+            source_id=int(source_id) if source_id else None,
+        )
+        return Response({"event": event_id, "level": level, "by": by, "series": series})
+
+
 # =====================================================
 # META / ENUMS
 # =====================================================
 
+META_ENUMS = {
+    "category_types": ["Tier", "Block", "Section"],
+    "ticket_tiers": ["VVIP", "VIP", "Regular"],
+    "rules": {
+        "seats_exist_only_on_leaf_nodes": True,
+        "parent_seats_should_be_zero": True
+    }
+}
+
+
 class MetaEnumsAPI(APIView):
     permission_classes = [AllowAny]
 
+    @method_decorator(static_condition(META_ENUMS))
     def get(self, request):
-        return Response({
-            "category_types": ["Tier", "Block", "Section"],
-            "ticket_tiers": ["VVIP", "VIP", "Regular"],
-            "rules": {
-                "seats_exist_only_on_leaf_nodes": True,
-                "parent_seats_should_be_zero": True
-            }
-        })
+        return Response(META_ENUMS)
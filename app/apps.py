@@ -6,4 +6,5 @@ class AppConfig(AppConfig):
     name = 'app'
 
     def ready(self):
-        import app.signals  # ensures signals are registered
\ No newline at end of file
+        import app.signals  # ensures signals are registered
+        import app.checks  # registers the system checks
\ No newline at end of file
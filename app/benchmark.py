@@ -0,0 +1,244 @@
+# app/benchmark.py
+import asyncio
+import statistics
+import subprocess
+from dataclasses import dataclass, field
+from time import perf_counter
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .models import Venue, SpaceCategory, Event, SpaceAllocation, Claim
+
+
+# -----------------------------
+# Cases
+# -----------------------------
+@dataclass
+class Case:
+    name: str
+    path: str
+    method: str = 'get'
+    data: dict = field(default_factory=dict)
+    # Clear the cache before each run to time the uncached path
+    cold: bool = False
+
+
+def build_cases():
+    """Endpoints to time, pointed at the largest venue/event in the database."""
+    venue = Venue.objects.annotate(size=Count('spaces')).order_by('-size', 'id').first()
+    event = Event.objects.filter(venue=venue).annotate(
+        size=Count('spaceallocation')
+    ).order_by('-size', 'id').first() if venue else None
+    if event is None:
+        raise ValueError("No events found; run generate_data first.")
+    allocation = SpaceAllocation.objects.filter(event=event).order_by('-remaining_quantity').first()
+
+    cases = [
+        Case('api_venues', '/api/venues/'),
+        Case('api_venues_expanded', '/api/venues/?expand=space_tree'),
+        Case('api_venue_detail', f'/api/venues/{venue.id}/'),
+        Case('api_space_tree', f'/api/venues/{venue.id}/space-tree/'),
+        Case('api_allocations', '/api/allocations/'),
+        Case('api_allocations_event', f'/api/allocations/?event={event.id}'),
+        Case('venue_hierarchy', f'/venues/{venue.id}/hierarchy/'),
+        Case('event_dashboard', f'/event-dashboard/{event.id}/', cold=True),
+        Case('event_dashboard_cached', f'/event-dashboard/{event.id}/'),
+        Case('allocation_sources_page', '/allocation-sources/'),
+        Case('allocation_sources_event', f'/allocation-sources/?event={event.id}'),
+        Case('gate_snapshot', f'/api/events/{event.id}/gate/snapshot/'),
+    ]
+    if allocation:
+        cases += [
+            Case('process_claim', '/process-claim/', 'post', {
+                'event_id': event.id, 'category_id': allocation.category_id,
+                'source_id': allocation.source_id, 'quantity': 1, 'claimant_name': 'Benchmark',
+            }),
+            Case('api_claim_redeem', '/api/claims/redeem/', 'post', {
+                'referral_token': allocation.referral_token, 'claimant_name': 'Benchmark', 'quantity': 1,
+            }),
+        ]
+    return cases
+
+
+# -----------------------------
+# Runner
+# -----------------------------
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))]
+
+
+def time_case(client, case, runs, warmup):
+    timings, queries, sizes, statuses = [], [], [], set()
+    for i in range(warmup + runs):
+        if case.cold:
+            cache.clear()
+        # Writes are rolled back so every run (and every benchmark) sees the same data
+        with transaction.atomic():
+            with CaptureQueriesContext(connection) as captured:
+                start = perf_counter()
+                response = getattr(client, case.method)(case.path, case.data)
+                body = b''.join(response) if response.streaming else response.content
+                elapsed = perf_counter() - start
+            transaction.set_rollback(True)
+        if i >= warmup:
+            timings.append(elapsed * 1000)
+            queries.append(len(captured))
+            sizes.append(len(body))
+            statuses.add(response.status_code)
+
+    return {
+        'name': case.name,
+        'method': case.method.upper(),
+        'path': case.path,
+        'status': sorted(statuses),
+        'runs': runs,
+        'latency_ms': {
+            'min': round(min(timings), 3),
+            'median': round(statistics.median(timings), 3),
+            'p95': round(percentile(timings, 95), 3),
+            'max': round(max(timings), 3),
+        },
+        'queries': {'min': min(queries), 'max': max(queries)},
+        'bytes': max(sizes),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(runs=5, warmup=1, only=None):
+    """Times each case in-process with the test client; returns a JSON-ready report."""
+    user, _ = get_user_model().objects.get_or_create(
+        username='benchmark', defaults={'is_staff': True, 'is_superuser': True},
+    )
+    # Session for the HTML views, bearer token for the API
+    client = Client(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(user).access_token}")
+    client.force_login(user)
+
+    cases = [c for c in build_cases() if not only or c.name in only]
+    return {
+        'revision': git_revision(),
+        'timestamp': timezone.now().isoformat(),
+        'database': connection.vendor,
+        'dataset': {
+            'venues': Venue.objects.count(),
+            'categories': SpaceCategory.objects.count(),
+            'events': Event.objects.count(),
+            'allocations': SpaceAllocation.objects.count(),
+            'claims': Claim.objects.count(),
+        },
+        'results': [time_case(client, case, runs, warmup) for case in cases],
+    }
+
+
+def compare(baseline, report):
+    """Rows of (name, baseline median, median, change %, baseline queries, queries)."""
+    before = {r['name']: r for r in baseline.get('results', [])}
+    rows = []
+    for result in report['results']:
+        old = before.get(result['name'])
+        if old is None:
+            continue
+        old_ms, new_ms = old['latency_ms']['median'], result['latency_ms']['median']
+        change = (new_ms - old_ms) / old_ms * 100 if old_ms else 0.0
+        rows.append((result['name'], old_ms, new_ms, change, old['queries']['max'], result['queries']['max']))
+    return rows
+
+
+# -----------------------------
+# Throughput (sync vs ASGI workers)
+# -----------------------------
+def throughput_cases():
+    """(name, sync path, async path) for the read endpoints with async twins."""
+    event = Event.objects.annotate(size=Count('spaceallocation')).order_by('-size', 'id').first()
+    if event is None:
+        raise ValueError("No events found; run generate_data first.")
+    return [
+        ('event_detail', f'/api/events/{event.id}/', f'/api/async/events/{event.id}/'),
+        ('space_tree', f'/api/venues/{event.venue_id}/space-tree/',
+         f'/api/async/venues/{event.venue_id}/space-tree/'),
+        # Both serve the first page at the default page size
+        ('allocations_event', f'/api/allocations/?event={event.id}',
+         f'/api/async/events/{event.id}/allocations/'),
+        # The sync dashboard is an HTML page behind a session login
+        ('event_dashboard', None, f'/api/async/events/{event.id}/dashboard/'),
+    ]
+
+
+async def measure_throughput(client, path, concurrency=50, requests=1000):
+    """
+    Sends `requests` GETs through `concurrency` workers sharing one
+    httpx.AsyncClient and reports requests per second and latency.
+    """
+    latencies, statuses = [], {}
+    remaining = iter(range(requests))
+
+    async def worker():
+        for _ in remaining:
+            start = perf_counter()
+            response = await client.get(path)
+            latencies.append((perf_counter() - start) * 1000)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    start = perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = perf_counter() - start
+    return {
+        'path': path,
+        'requests': requests,
+        'concurrency': concurrency,
+        'rps': round(requests / elapsed, 1),
+        'latency_ms': {
+            'median': round(statistics.median(latencies), 3),
+            'p95': round(percentile(latencies, 95), 3),
+            'max': round(max(latencies), 3),
+        },
+        'status': {str(code): count for code, count in sorted(statuses.items())},
+    }
+
+
+def run_throughput(sync_url, async_url, concurrency=50, requests=1000, only=None):
+    """
+    Load-tests running servers over HTTP: the sync endpoints on `sync_url`
+    (e.g. gunicorn sync workers on ticket_system.wsgi) against their async
+    twins on `async_url` (e.g. gunicorn -k uvicorn.workers.UvicornWorker
+    on ticket_system.asgi). Start both with the same worker count.
+    """
+    import httpx
+
+    async def run(base_url, path):
+        limits = httpx.Limits(max_connections=concurrency)
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+            await client.get(path)  # warm up
+            return await measure_throughput(client, path, concurrency, requests)
+
+    results = []
+    for name, sync_path, async_path in throughput_cases():
+        if only and name not in only:
+            continue
+        results.append({
+            'name': name,
+            'sync': asyncio.run(run(sync_url, sync_path)) if sync_path else None,
+            'async': asyncio.run(run(async_url, async_path)),
+        })
+    return {
+        'revision': git_revision(),
+        'timestamp': timezone.now().isoformat(),
+        'sync_url': sync_url,
+        'async_url': async_url,
+        'results': results,
+    }
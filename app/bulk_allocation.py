@@ -0,0 +1,161 @@
+# app/bulk_allocation.py
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+
+from .models import AllocationSource, SpaceAllocation, EventInventory
+from .inventory import lock_zones
+from .tokens import assign_tokens
+from .dashboard import invalidate_event_grid
+from .live import publish_inventory_delta
+from .gate import record_bulk_tokens
+
+MAX_CELLS = 10000
+
+
+# -----------------------------
+# Report
+# -----------------------------
+@dataclass
+class BulkAllocationReport:
+    cells: list = field(default_factory=list)  # one dict per cell, in request order
+    accepted: bool = False
+    # Malformed cells or unknown categories, as opposed to capacity shortfalls
+    invalid: bool = False
+
+    @property
+    def errors(self):
+        return [cell for cell in self.cells if 'error' in cell]
+
+    def add_error(self, index, message, invalid=True):
+        self.cells[index]['error'] = message
+        self.invalid = self.invalid or invalid
+
+    def as_dict(self):
+        return {
+            'accepted': self.accepted,
+            'allocations': sum(1 for cell in self.cells if 'allocation' in cell),
+            'seats': sum(cell['quantity'] for cell in self.cells if 'allocation' in cell),
+            'failed_cells': len(self.errors),
+            'cells': self.cells,
+        }
+
+
+# -----------------------------
+# Cells
+# -----------------------------
+def _parse_cell(values):
+    """A cell is {"source": name, "category": id, "quantity": n} or [name, id, n]."""
+    if isinstance(values, (list, tuple)) and len(values) == 3:
+        values = dict(zip(('source', 'category', 'quantity'), values))
+    if not isinstance(values, dict):
+        raise ValueError("Expected {source, category, quantity}.")
+    source = str(values.get('source') or '').strip()
+    if not source:
+        raise ValueError("Missing source.")
+    try:
+        category_id = int(values.get('category'))
+        quantity = int(values.get('quantity'))
+    except (TypeError, ValueError):
+        raise ValueError("Category and quantity must be whole numbers.")
+    if quantity < 1:
+        raise ValueError("Quantity must be at least 1.")
+    return source, category_id, quantity
+
+
+# -----------------------------
+# Bulk allocation
+# -----------------------------
+def allocate_bulk(event, cells, dry_run=False):
+    """
+    Allocates a matrix of (source name, category, quantity) cells for an
+    event, all or nothing.
+
+    The ledger rows of the cells' zones and of their ancestors are created
+    if missing and then locked. The batch is checked at every level: a
+    zone's cells and its descendants' cells together must fit in what its
+    subtree has left. Missing sources (one per source name and category,
+    as on the allocation sources page) and the allocations are
+    bulk-created, tokens are signed in one bulk UPDATE, and the ledger is
+    bumped in one more. If any cell fails, or on a dry run, nothing is
+    written. The report lists every cell.
+    """
+    report = BulkAllocationReport(cells=[{'index': index} for index in range(len(cells))])
+    parsed = []
+    for index, values in enumerate(cells):
+        try:
+            source, category_id, quantity = _parse_cell(values)
+        except ValueError as e:
+            report.add_error(index, str(e))
+            continue
+        report.cells[index].update(source=source, category=category_id, quantity=quantity)
+        parsed.append((index, source, category_id, quantity))
+
+    with transaction.atomic():
+        category_ids = {category_id for _, _, category_id, _ in parsed}
+        # Locked until commit, so concurrent allocations under the same
+        # zones (the cells' categories and their ancestors) can't overbook them
+        zones = lock_zones(event.id, event.venue_id, category_ids)
+
+        requested = defaultdict(int)  # per cell category, for the ledger
+        for index, _, category_id, quantity in parsed:
+            if category_id not in zones.lineage:
+                report.add_error(index, f"Category {category_id} is not part of {event.venue.name}.")
+                continue
+            requested[category_id] += quantity
+            zones.add(category_id, quantity)
+        for index, _, category_id, quantity in parsed:
+            full = zones.full_zone(category_id) if category_id in zones.lineage else None
+            if full is not None:
+                report.add_error(
+                    index,
+                    f"Insufficient seats: {zones.available[full]} left in {zones.names[full]}, "
+                    f"the batch asks for {zones.requested[full]}.",
+                    invalid=False,
+                )
+
+        if report.errors or dry_run:
+            transaction.set_rollback(True)
+            return report
+
+        # Reuse the oldest source per (name, category), like get_or_create would
+        wanted = {(source, category_id) for _, source, category_id, _ in parsed}
+        sources = {}
+        for pk, name, category_id in AllocationSource.objects.filter(
+            event=event, name__in={name for name, _ in wanted}, ticket_category_id__in=category_ids,
+        ).order_by('-id').values_list('id', 'name', 'ticket_category_id'):
+            sources[(name, category_id)] = pk
+        created = AllocationSource.objects.bulk_create([
+            AllocationSource(name=name, event=event, venue_id=event.venue_id, ticket_category_id=category_id)
+            for name, category_id in sorted(wanted - sources.keys())
+        ])
+        sources.update({(s.name, s.ticket_category_id): s.pk for s in created})
+
+        allocations = SpaceAllocation.objects.bulk_create([
+            SpaceAllocation(
+                event=event, source_id=sources[(source, category_id)], category_id=category_id,
+                total_quantity=quantity, remaining_quantity=quantity,
+            )
+            for _, source, category_id, quantity in parsed
+        ], batch_size=1000)
+        assign_tokens(allocations)
+
+        # bulk_create skips the signals: log the tokens for gate devices, bump
+        # the ledger, then the caches and live dashboards
+        record_bulk_tokens(allocations)
+        EventInventory.objects.filter(event_id=event.id, category_id__in=requested).update(
+            allocated=F('allocated') + Case(
+                *(When(category_id=pk, then=Value(total)) for pk, total in requested.items()),
+                default=Value(0),
+            )
+        )
+        invalidate_event_grid(event.id)
+        for category_id, total in requested.items():
+            publish_inventory_delta(event.id, category_id, allocated=total)
+
+    for (index, *_), allocation in zip(parsed, allocations):
+        report.cells[index].update(allocation=allocation.pk, referral_token=allocation.referral_token)
+    report.accepted = True
+    return report
@@ -0,0 +1,174 @@
+# app/capacity.py
+from collections import defaultdict
+from dataclasses import asdict, dataclass
+from itertools import count
+from typing import Optional
+
+from django.db.models import F, Sum
+
+from .models import Venue, SpaceCategory, SpaceAllocation, EventInventory
+
+
+# -----------------------------
+# Violations
+# -----------------------------
+@dataclass
+class Violation:
+    rule: str
+    message: str
+    limit: int = 0
+    actual: int = 0
+    category: Optional[int] = None
+    allocation: Optional[int] = None
+
+    def as_dict(self):
+        return {k: v for k, v in asdict(self).items() if v is not None}
+
+
+# -----------------------------
+# Tree rules
+# -----------------------------
+def check_tree(nodes, capacity):
+    """
+    Capacity rules over a flat tree of (key, name, parent_key, seats) rows:
+
+    - venue_capacity: leaf seats may not exceed the venue's total_capacity;
+    - parent_below_children: a parent with seats of its own must hold at
+      least the seats of its subtree (a parent left at 0 just rolls up).
+
+    Returns (violations, {key: subtree leaf seats}). Integer keys are
+    reported as category ids.
+    """
+    children = defaultdict(list)
+    for key, _, parent, _ in nodes:
+        children[parent].append(key)
+
+    # Walk the levels top-down once, then roll seats up bottom-up
+    order, level = [], children[None]
+    while level:
+        order.extend(level)
+        level = [kid for key in level for kid in children.get(key, ())]
+    seats_of = {key: seats for key, _, _, seats in nodes}
+    subtree = {}
+    for key in reversed(order):
+        kids = children.get(key)
+        subtree[key] = sum(subtree[k] for k in kids) if kids else seats_of[key]
+
+    violations = []
+    for key, name, _, seats in nodes:
+        if children.get(key) and seats and seats < subtree.get(key, 0):
+            violations.append(Violation(
+                'parent_below_children',
+                f"'{name}' has {seats} seats but its subtree holds {subtree[key]}.",
+                limit=seats, actual=subtree[key],
+                category=key if isinstance(key, int) else None,
+            ))
+
+    total = sum(subtree[key] for key in children[None])
+    if total > capacity:
+        violations.append(Violation(
+            'venue_capacity',
+            f"Total seats ({total}) exceed venue capacity ({capacity}).",
+            limit=capacity, actual=total,
+        ))
+    return violations, subtree
+
+
+def posted_tree_violations(hierarchy, capacity, seats_key='seats_count'):
+    """Checks a posted (nested) tree before it is saved."""
+    keys = count()
+    nodes = []
+    level = [(node, None) for node in hierarchy]
+    while level:
+        next_level = []
+        for node, parent in level:
+            key = f"new-{next(keys)}"
+            nodes.append((key, node.get('name', ''), parent, node.get(seats_key) or 0))
+            next_level.extend((child, key) for child in node.get('children') or [])
+        level = next_level
+    return check_tree(nodes, capacity)[0]
+
+
+def _venue_nodes(venue_id):
+    return list(SpaceCategory.objects.filter(venue_id=venue_id).values_list(
+        'id', 'name', 'parent_id', 'seats_count'
+    ))
+
+
+# -----------------------------
+# Batch validation
+# -----------------------------
+def venue_violations(venue):
+    """Every tree rule violation of a stored venue layout (one query)."""
+    return check_tree(_venue_nodes(venue.id), venue.total_capacity)[0]
+
+
+def event_violations(event):
+    """
+    Every capacity violation of an event, in one pass:
+
+    - the venue's tree rules;
+    - category_overallocated: allocations in a category's subtree exceed
+      its seats (one grouped aggregate over the event's allocations);
+    - allocation_overclaimed: claims exceed an allocation's quantity
+      (aggregated and filtered in the database);
+    - ledger_drift: EventInventory counters disagree with the rows above.
+    """
+    venue = event.venue
+    nodes = _venue_nodes(venue.id)
+    violations, subtree = check_tree(nodes, venue.total_capacity)
+    names = {key: name for key, name, _, _ in nodes}
+    parents = {key: parent for key, _, parent, _ in nodes}
+
+    allocated = dict(
+        SpaceAllocation.objects.filter(event=event).values('category_id').annotate(
+            total=Sum('total_quantity')
+        ).values_list('category_id', 'total')
+    )
+    in_subtree = defaultdict(int)
+    for category_id, total in allocated.items():
+        key = category_id
+        while key is not None:
+            in_subtree[key] += total
+            key = parents.get(key)
+
+    for key, total in sorted(in_subtree.items()):
+        if total > subtree.get(key, 0):
+            violations.append(Violation(
+                'category_overallocated',
+                f"'{names.get(key, key)}' has {subtree.get(key, 0)} seats but {total} are allocated.",
+                limit=subtree.get(key, 0), actual=total, category=key,
+            ))
+
+    overclaimed = SpaceAllocation.objects.filter(event=event).annotate(
+        claimed=Sum('claims__quantity')
+    ).filter(claimed__gt=F('total_quantity')).values_list('id', 'category_id', 'total_quantity', 'claimed')
+    for pk, category_id, total, claimed in overclaimed:
+        violations.append(Violation(
+            'allocation_overclaimed',
+            f"Allocation {pk} has {claimed} seats claimed against {total} allocated.",
+            limit=total, actual=claimed, category=category_id, allocation=pk,
+        ))
+
+    for category_id, ledger_allocated in EventInventory.objects.filter(event=event).values_list(
+        'category_id', 'allocated'
+    ):
+        if ledger_allocated != allocated.get(category_id, 0):
+            violations.append(Violation(
+                'ledger_drift',
+                f"Inventory for '{names.get(category_id, category_id)}' records {ledger_allocated} "
+                f"allocated seats, allocations sum to {allocated.get(category_id, 0)}; "
+                f"run rebuild_inventory.",
+                limit=allocated.get(category_id, 0), actual=ledger_allocated, category=category_id,
+            ))
+    return violations
+
+
+def venue_event_violations(venue_id):
+    """Allocation violations for every event at a venue (after a layout change)."""
+    venue = Venue.objects.get(pk=venue_id)
+    violations = []
+    for event in venue.events.all():
+        event.venue = venue
+        violations.extend(v for v in event_violations(event) if v.rule == 'category_overallocated')
+    return violations
@@ -0,0 +1,36 @@
+# app/checks.py
+from django.conf import settings
+from django.core import checks
+
+from .throttling import parse_rate
+
+LOCAL_CACHES = ('django.core.cache.backends.locmem.LocMemCache', 'django.core.cache.backends.dummy.DummyCache')
+
+
+def _per_worker_throttling():
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    rates = [scope for scope, rate in getattr(settings, 'THROTTLE_RATES', {}).items() if parse_rate(rate)]
+    return backend in LOCAL_CACHES and bool(rates)
+
+
+MESSAGE = "THROTTLE_RATES are set but the default cache is not shared between workers."
+HINT = (
+    "Each worker keeps its own token buckets, so the effective limit grows with the worker "
+    "count. Point CACHE_BACKEND/CACHE_LOCATION at Redis or Memcached (or a database/file "
+    "cache on one host), or set the rates to \"\" to disable throttling."
+)
+
+
+@checks.register(checks.Tags.caches)
+def check_throttle_cache(app_configs, **kwargs):
+    """Warns in development; `check --deploy` reports the same as an error."""
+    if _per_worker_throttling():
+        return [checks.Warning(MESSAGE, hint=HINT, id='app.W001')]
+    return []
+
+
+@checks.register(checks.Tags.caches, deploy=True)
+def check_throttle_cache_deploy(app_configs, **kwargs):
+    if _per_worker_throttling():
+        return [checks.Error(MESSAGE, hint=HINT, id='app.E001')]
+    return []
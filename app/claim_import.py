@@ -0,0 +1,215 @@
+# app/claim_import.py
+import csv
+import io
+from collections import defaultdict
+from dataclasses import dataclass, field
+from xml.etree.ElementTree import ParseError
+from zipfile import BadZipFile
+
+from django.db import transaction
+from django.db.models import F
+
+from .models import SpaceAllocation, Claim
+from .inventory import record_bulk_claims
+from .dashboard import invalidate_event_grid
+from .live import publish_inventory_delta
+from . import gate, rollups
+
+CHUNK_SIZE = 1000
+
+
+# -----------------------------
+# Import report
+# -----------------------------
+class ImportFileError(ValueError):
+    """The upload can't be read at all (wrong encoding, corrupt workbook)."""
+
+
+@dataclass
+class ImportReport:
+    imported_rows: int = 0
+    imported_seats: int = 0
+    errors: list = field(default_factory=list)  # [{'row': n, 'error': msg}], in row order
+    # Set when reading stopped early; rows before it may have been imported
+    file_error: str = None
+
+    def add_error(self, row_number, message):
+        self.errors.append({'row': row_number, 'error': message})
+
+    def as_dict(self):
+        return {
+            'imported_rows': self.imported_rows,
+            'imported_seats': self.imported_seats,
+            'failed_rows': len(self.errors),
+            'errors': self.errors,
+            'file_error': self.file_error,
+        }
+
+
+# -----------------------------
+# Row readers (streaming)
+# -----------------------------
+def _normalise(header):
+    return [str(h or '').strip().lower().replace(' ', '_') for h in header]
+
+
+def iter_csv_rows(fileobj):
+    """Yields (row_number, dict) from a binary CSV file, one line at a time."""
+    reader = csv.reader(io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline=''))
+    try:
+        header = _normalise(next(reader, []))
+        for number, values in enumerate(reader, start=2):
+            if any(v.strip() for v in values):
+                yield number, dict(zip(header, values))
+    except UnicodeDecodeError:
+        raise ImportFileError(f"The file is not UTF-8 text (stopped after line {reader.line_num}).")
+    except csv.Error as e:
+        raise ImportFileError(f"The file is not valid CSV (line {reader.line_num}): {e}.")
+
+
+def iter_xlsx_rows(fileobj):
+    """Yields (row_number, dict) from the first sheet, using openpyxl read-only mode."""
+    from openpyxl import load_workbook
+    from openpyxl.utils.exceptions import InvalidFileException
+
+    try:
+        # A non-workbook zip fails with KeyError on its missing parts
+        workbook = load_workbook(fileobj, read_only=True, data_only=True)
+    except (InvalidFileException, BadZipFile, KeyError, OSError):
+        raise ImportFileError("The file is not a valid XLSX workbook.")
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = _normalise(next(rows, []))
+        for number, values in enumerate(rows, start=2):
+            if any(v not in (None, '') for v in values):
+                yield number, dict(zip(header, values))
+    except ParseError:
+        raise ImportFileError("The workbook's first sheet is corrupt.")
+    finally:
+        workbook.close()
+
+
+def iter_rows(fileobj, filename):
+    if filename.lower().endswith(('.xlsx', '.xlsm')):
+        return iter_xlsx_rows(fileobj)
+    return iter_csv_rows(fileobj)
+
+
+# -----------------------------
+# Import
+# -----------------------------
+def _parse_row(values, default_token):
+    token = str(values.get('referral_token') or default_token or '').strip()
+    name = str(values.get('claimant_name') or '').strip()
+    department = str(values.get('department') or '').strip()
+    if not token:
+        raise ValueError("Missing referral_token.")
+    if not name:
+        raise ValueError("Missing claimant_name.")
+    try:
+        quantity = int(str(values.get('quantity') or '').strip())
+    except ValueError:
+        raise ValueError("Quantity must be a whole number.")
+    if quantity < 1:
+        raise ValueError("Quantity must be at least 1.")
+    return token, name, department, quantity
+
+
+def _import_chunk(chunk, default_token, report):
+    parsed = []
+    for number, values in chunk:
+        try:
+            parsed.append((number, *_parse_row(values, default_token)))
+        except ValueError as e:
+            report.add_error(number, str(e))
+
+    # One query validates the whole chunk against allocation inventory
+    allocations = {
+        a['referral_token']: a
+        for a in SpaceAllocation.objects.filter(
+            referral_token__in={row[1] for row in parsed}
+        ).values('id', 'referral_token', 'remaining_quantity', 'event_id', 'category_id', 'source_id')
+    }
+
+    accepted = defaultdict(list)
+    taken = defaultdict(int)
+    for number, token, name, department, quantity in parsed:
+        allocation = allocations.get(token)
+        if allocation is None:
+            report.add_error(number, f"Unknown referral token '{token}'.")
+            continue
+        left = allocation['remaining_quantity'] - taken[token]
+        if quantity > left:
+            report.add_error(number, f"Insufficient seats: {left} left on '{token}'.")
+            continue
+        taken[token] += quantity
+        accepted[token].append((number, name, department, quantity))
+
+    with transaction.atomic():
+        claims = []
+        ledger = defaultdict(int)
+        for token, rows in accepted.items():
+            allocation = allocations[token]
+            # One conditional decrement per allocation; if a concurrent booking
+            # got there first, this allocation's rows are rejected, not oversold.
+            if not SpaceAllocation.objects.filter(
+                pk=allocation['id'],
+                remaining_quantity__gte=taken[token],
+            ).update(remaining_quantity=F('remaining_quantity') - taken[token]):
+                for number, *_ in rows:
+                    report.add_error(number, f"Seats on '{token}' changed during import; retry this row.")
+                continue
+
+            claims.extend(
+                Claim(allocation_id=allocation['id'], claimant_name=name, department=department, quantity=quantity)
+                for number, name, department, quantity in rows
+            )
+            ledger[(allocation['event_id'], allocation['category_id'])] += taken[token]
+            report.imported_rows += len(rows)
+            report.imported_seats += taken[token]
+
+        Claim.objects.bulk_create(claims, batch_size=CHUNK_SIZE)
+        record_bulk_claims(ledger)
+        gate.record_bulk_claims(claims, {a['id']: a['event_id'] for a in allocations.values()})
+        zones = {a['id']: a for a in allocations.values()}
+        rollups.record_claims(
+            (zones[c.allocation_id]['event_id'], zones[c.allocation_id]['category_id'],
+             zones[c.allocation_id]['source_id'], c.claimed_at, 1, c.quantity)
+            for c in claims
+        )
+        for event_id, category_id in ledger:
+            publish_inventory_delta(event_id, category_id, claimed=ledger[(event_id, category_id)])
+        for event_id in {event_id for event_id, _ in ledger}:
+            invalidate_event_grid(event_id)
+
+
+def import_claims(rows, default_token=None, chunk_size=CHUNK_SIZE):
+    """
+    Imports claims from an iterable of (row_number, dict) rows, `chunk_size`
+    rows at a time, so memory stays flat whatever the file size.
+
+    Rows need `claimant_name` and `quantity`, plus `referral_token` unless
+    `default_token` is given for the whole file; `department` is optional.
+    Each chunk commits on its own. Rejected rows are listed in the report,
+    and an unreadable file (ImportFileError from the row reader) sets its
+    `file_error`, keeping every row read before it.
+    """
+    report = ImportReport()
+    rows = iter(rows)
+    chunk = []
+    while True:
+        try:
+            row = next(rows, None)
+        except ImportFileError as e:
+            report.file_error = str(e)
+            row = None
+        if row is not None:
+            chunk.append(row)
+        if chunk and (row is None or len(chunk) == chunk_size):
+            _import_chunk(chunk, default_token, report)
+            chunk = []
+        if row is None:
+            break
+    # Parse, inventory and race rejections were added in that order
+    report.errors.sort(key=lambda error: error['row'])
+    return report
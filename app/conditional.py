@@ -0,0 +1,99 @@
+# app/conditional.py
+import hashlib
+from functools import wraps
+
+from django.http import Http404
+from django.views.decorators.http import condition
+
+from .models import Venue
+from .gate import manifest_version
+
+
+# -----------------------------
+# Venue layout versions
+# -----------------------------
+def _layout_state(request, venue_id):
+    """(layout_version, layout_updated_at) for a venue, fetched once per request."""
+    cache = getattr(request, '_venue_layout_state', None)
+    if cache is None:
+        cache = request._venue_layout_state = {}
+    if venue_id not in cache:
+        cache[venue_id] = Venue.objects.filter(pk=venue_id).values_list(
+            'layout_version', 'layout_updated_at'
+        ).first()
+    return cache[venue_id]
+
+
+def venue_layout_condition(kind, venue_kwarg='venue_id'):
+    """
+    Conditional-GET decorator for views rendering a venue's layout.
+
+    The strong ETag combines the venue id, its layout version, the
+    representation `kind` and the query string (?fields=/?expand= change
+    the body). A matching If-None-Match/If-Modified-Since gets a 304
+    after a single-row lookup, before the view touches the tree.
+    """
+
+    def etag(request, *args, **kwargs):
+        state = _layout_state(request, kwargs[venue_kwarg])
+        if state is None:
+            return None
+        query = hashlib.sha1(request.META.get('QUERY_STRING', '').encode()).hexdigest()[:8]
+        return f"venue-{kwargs[venue_kwarg]}-v{state[0]}-{kind}-{query}"
+
+    def last_modified(request, *args, **kwargs):
+        state = _layout_state(request, kwargs[venue_kwarg])
+        return state[1] if state else None
+
+    return condition(etag_func=etag, last_modified_func=last_modified)
+
+
+def async_venue_layout_condition(kind, venue_kwarg='venue_id'):
+    """
+    venue_layout_condition for async views, which also 404s unknown venues.
+
+    Django's condition() calls its validators synchronously, so the state
+    row is fetched with the async ORM first and left in the per-request
+    cache those validators read.
+    """
+    conditional = venue_layout_condition(kind, venue_kwarg)
+
+    def decorator(view):
+        wrapped = conditional(view)
+
+        @wraps(view)
+        async def inner(request, *args, **kwargs):
+            venue_id = kwargs[venue_kwarg]
+            state = await Venue.objects.filter(pk=venue_id).values_list(
+                'layout_version', 'layout_updated_at'
+            ).afirst()
+            if state is None:
+                raise Http404("Venue not found.")
+            request._venue_layout_state = {venue_id: state}
+            return await wrapped(request, *args, **kwargs)
+
+        return inner
+
+    return decorator
+
+
+# -----------------------------
+# Static payloads
+# -----------------------------
+def static_condition(payload):
+    """Conditional-GET decorator for views whose body never changes at runtime."""
+    digest = hashlib.sha1(repr(payload).encode()).hexdigest()[:16]
+    return condition(etag_func=lambda request, *args, **kwargs: digest)
+
+
+# -----------------------------
+# Gate manifests
+# -----------------------------
+def gate_condition(event_kwarg='event_id'):
+    """Conditional-GET decorator keyed on an event's claim-change log (sequence and size)."""
+
+    def etag(request, *args, **kwargs):
+        event_id = kwargs[event_kwarg]
+        return f"gate-{event_id}-{manifest_version(event_id)}"
+
+    return condition(etag_func=etag)
@@ -0,0 +1,159 @@
+# app/dashboard.py
+from time import time_ns
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import FilteredRelation, Q
+
+from .models import SpaceCategory
+
+GRID_TIMEOUT = getattr(settings, 'EVENT_GRID_CACHE_TIMEOUT', 300)
+
+
+# -----------------------------
+# Grid computation
+# -----------------------------
+def grid_rows(event):
+    """The venue's categories joined to the event's ledger rows, top level first."""
+    return SpaceCategory.objects.filter(venue_id=event.venue_id).annotate(
+        ledger=FilteredRelation('inventory', condition=Q(inventory__event_id=event.id)),
+    ).order_by('depth', 'parent_id', 'id').values(
+        'id', 'name', 'parent_id', 'depth', 'seats_count', 'ledger__allocated', 'ledger__claimed',
+    )
+
+
+def roll_up_grid(rows):
+    """Rolls grid_rows() up from the deepest level to the roots, in memory."""
+    by_id = {row['id']: row for row in rows}
+    parents = {row['parent_id'] for row in rows}
+
+    for row in rows:
+        # Leaves hold the seats; tiers start empty and collect their children's
+        row['total'] = 0 if row['id'] in parents else row['seats_count']
+        row['allocated'] = row['ledger__allocated'] or 0
+        row['claimed'] = row['ledger__claimed'] or 0
+
+    for row in sorted(rows, key=lambda r: r['depth'], reverse=True):
+        parent = by_id.get(row['parent_id'])
+        if parent is not None:
+            parent['total'] += row['total']
+            parent['allocated'] += row['allocated']
+            parent['claimed'] += row['claimed']
+
+    grid = []
+    for row in rows:
+        parent = by_id.get(row['parent_id'])
+        grid.append({
+            'category_id': row['id'],
+            'name': row['name'],
+            'parent_id': row['parent_id'],
+            'parent_name': parent['name'] if parent else None,
+            'depth': row['depth'],
+            'total': row['total'],
+            'allocated': row['allocated'],
+            'claimed': row['claimed'],
+            # Remaining overall for the subtree
+            'available': row['total'] - row['allocated'],
+            'is_parent': row['parent_id'] is None,
+        })
+    return grid
+
+
+def compute_event_grid(event):
+    """
+    Per-category totals for an event: total, allocated, claimed, available.
+
+    Every tier reports its whole subtree: one query reads the venue's
+    categories joined to the event's ledger rows, then figures are rolled
+    up from the deepest level to the roots in memory.
+    """
+    return roll_up_grid(list(grid_rows(event)))
+
+
+# -----------------------------
+# Cache (shared between workers: see CACHES)
+# -----------------------------
+def grid_version_key(event_id):
+    return f"event-grid-version:{event_id}"
+
+
+def grid_cache_key(event_id, version):
+    return f"event-grid:{event_id}:{version}"
+
+
+def _fresh_version():
+    # A version key evicted and started again must not revive old grids
+    return time_ns()
+
+
+def grid_version(event_id):
+    """The event's grid version, bumped by invalidate_event_grid()."""
+    key = grid_version_key(event_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _fresh_version(), None)
+        version = cache.get(key)
+    return version
+
+
+async def agrid_version(event_id):
+    key = grid_version_key(event_id)
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, _fresh_version(), None)
+        version = await cache.aget(key)
+    return version
+
+
+def get_event_grid(event):
+    """
+    Returns the event's grid from the cache, computing it on a miss.
+
+    Grids are stored under the event's grid version, read before the rows:
+    a reader that computed from rows a write has since replaced stores its
+    grid under a version nobody reads any more. Entries are also stamped
+    with the venue's layout_version, so layout edits invalidate them
+    implicitly. `event.venue` should already be loaded.
+    """
+    key = grid_cache_key(event.id, grid_version(event.id))
+    layout = event.venue.layout_version
+    cached = cache.get(key)
+    if cached is not None and cached[0] == layout:
+        return cached[1]
+
+    grid = compute_event_grid(event)
+    cache.set(key, (layout, grid), GRID_TIMEOUT)
+    return grid
+
+
+async def aget_event_grid(event, version=None):
+    """
+    get_event_grid for async views. Pass `version` if it was already
+    fetched (e.g. alongside the event) to skip that lookup.
+    """
+    if version is None:
+        version = await agrid_version(event.id)
+    key = grid_cache_key(event.id, version)
+    layout = event.venue.layout_version
+    cached = await cache.aget(key)
+    if cached is not None and cached[0] == layout:
+        return cached[1]
+
+    grid = roll_up_grid([row async for row in grid_rows(event)])
+    await cache.aset(key, (layout, grid), GRID_TIMEOUT)
+    return grid
+
+
+def _bump_grid_version(event_id):
+    try:
+        cache.incr(grid_version_key(event_id))
+    except ValueError:
+        pass  # No version yet: the next reader starts a fresh one
+
+
+def invalidate_event_grid(event_id):
+    # Bump now and again once the write commits, so a grid computed from
+    # rows read mid-transaction is stored under a version already retired.
+    _bump_grid_version(event_id)
+    transaction.on_commit(lambda: _bump_grid_version(event_id))
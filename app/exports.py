@@ -0,0 +1,92 @@
+# app/exports.py
+import csv
+import tempfile
+
+from .models import SpaceCategory, SpaceAllocation, Claim
+
+CHUNK_SIZE = 2000
+
+
+# -----------------------------
+# Row sources
+# -----------------------------
+def category_paths(venue_id):
+    """{category_id: 'Tier / Block / Section'} for a venue, from one query."""
+    rows = list(SpaceCategory.objects.filter(venue_id=venue_id).values_list('id', 'name', 'path'))
+    names = {pk: name for pk, name, _ in rows}
+    paths = {}
+    for pk, name, path in rows:
+        ids = [int(i) for i in path.strip('/').split('/') if i] or [pk]
+        paths[pk] = " / ".join(names.get(i, '?') for i in ids)
+    return paths
+
+
+def allocation_rows(event):
+    """Header plus one row per allocation of the event, streamed from the DB."""
+    paths = category_paths(event.venue_id)
+    venue = event.venue.name
+    yield ['Allocation ID', 'Source', 'Category', 'Venue', 'Allocated', 'Remaining',
+           'Claimed', 'Referral Token', 'Created At']
+    rows = SpaceAllocation.objects.filter(event=event).order_by('id').values_list(
+        'id', 'source__name', 'category_id', 'total_quantity', 'remaining_quantity',
+        'referral_token', 'created_at',
+    )
+    for pk, source, category_id, total, remaining, token, created_at in rows.iterator(chunk_size=CHUNK_SIZE):
+        remaining = total if remaining is None else remaining
+        yield [pk, source, paths.get(category_id, ''), venue, total, remaining,
+               total - remaining, token, created_at.isoformat()]
+
+
+def claim_rows(event):
+    """Header plus one row per claim of the event, streamed from the DB."""
+    paths = category_paths(event.venue_id)
+    venue = event.venue.name
+    yield ['Claim ID', 'Claimed At', 'Claimant', 'Department', 'Quantity', 'Source',
+           'Category', 'Venue', 'Referral Token']
+    rows = Claim.objects.filter(allocation__event=event).order_by('id').values_list(
+        'id', 'claimed_at', 'claimant_name', 'department', 'quantity',
+        'allocation__source__name', 'allocation__category_id', 'allocation__referral_token',
+    )
+    for pk, claimed_at, name, department, quantity, source, category_id, token in rows.iterator(chunk_size=CHUNK_SIZE):
+        yield [pk, claimed_at.isoformat(), name, department or '', quantity, source,
+               paths.get(category_id, ''), venue, token]
+
+
+EXPORTS = {
+    'claims': claim_rows,
+    'allocations': allocation_rows,
+}
+
+
+# -----------------------------
+# Writers
+# -----------------------------
+class Echo:
+    """File-like object whose write() hands the line back to the caller."""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(rows):
+    writer = csv.writer(Echo())
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def write_xlsx(rows, title):
+    """
+    Writes rows with openpyxl write-only mode into a temporary file and
+    returns it rewound; the sheet is never held in memory.
+    """
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title=title[:31])
+    for row in rows:
+        sheet.append(row)
+
+    out = tempfile.TemporaryFile()
+    workbook.save(out)
+    out.seek(0)
+    return out
@@ -0,0 +1,192 @@
+# app/gate.py
+import hashlib
+import struct
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Count, Max, OuterRef, Subquery
+
+from .models import SpaceAllocation, Claim, ClaimChange
+
+# Binary layout (little-endian), read by gate devices:
+#
+#   snapshot: header  '<4sBIQIII'  magic b'GATE', version, event_id, sequence,
+#                                  token count, claim count, seats claimed
+#             tokens  '<8sII'      sha256(token)[:8], allocation_id, remaining
+#                                  (sorted by digest, for binary search)
+#             claims  '<III'       claim_id, allocation_id, quantity
+#                                  (sorted by claim_id)
+#
+#   delta:    header  '<4sBIQQI'   magic b'GDLT', version, event_id, since,
+#                                  sequence, change count
+#             changes '<BIII8s'    action, claim_id, allocation_id, quantity,
+#                                  token digest (in sequence order)
+#
+# Delta actions: 1 upsert claim, 2 remove claim (digest zeroed); 3 upsert
+# token (claim_id 0, quantity = the allocation's remaining seats at that
+# point), 4 remove token (claim_id 0, digest zeroed: match on
+# allocation_id).
+#
+# A device loads a snapshot, then applies deltas since its sequence.
+# Sequence numbers are allocated at insert but become visible at commit,
+# so a change can appear below a sequence a device already has: each
+# delta therefore starts GATE_DELTA_LOOKBACK_SECONDS before `since` and may
+# repeat changes. Apply them in order; replaying a change (keyed by
+# claim_id, or allocation_id for tokens) is harmless.
+VERSION = 2
+SNAPSHOT_HEADER = struct.Struct('<4sBIQIII')
+TOKEN = struct.Struct('<8sII')
+CLAIM = struct.Struct('<III')
+DELTA_HEADER = struct.Struct('<4sBIQQI')
+CHANGE = struct.Struct('<BIII8s')
+NO_DIGEST = bytes(8)
+
+CHUNK_SIZE = 5000
+
+
+# -----------------------------
+# Change log (called from app.signals / app.claim_import)
+# -----------------------------
+def record_claim_change(event_id, claim, action=ClaimChange.UPSERT):
+    ClaimChange.objects.create(
+        event_id=event_id,
+        claim_id=claim.pk,
+        allocation_id=claim.allocation_id,
+        quantity=claim.quantity,
+        action=action,
+    )
+
+
+def record_bulk_claims(claims, event_ids):
+    """Logs claims written with bulk_create; `event_ids` maps allocation_id to event_id."""
+    ClaimChange.objects.bulk_create(
+        [
+            ClaimChange(
+                event_id=event_ids[claim.allocation_id],
+                claim_id=claim.pk,
+                allocation_id=claim.allocation_id,
+                quantity=claim.quantity,
+                action=ClaimChange.UPSERT,
+            )
+            for claim in claims
+        ],
+        batch_size=1000,
+    )
+
+
+def record_token_change(allocation, action=ClaimChange.UPSERT_TOKEN):
+    ClaimChange.objects.create(
+        event_id=allocation.event_id,
+        claim_id=0,
+        allocation_id=allocation.pk,
+        quantity=(allocation.remaining_quantity or 0) if action == ClaimChange.UPSERT_TOKEN else 0,
+        action=action,
+    )
+
+
+def record_bulk_tokens(allocations):
+    """Logs allocations written with bulk_create (see app.bulk_allocation)."""
+    ClaimChange.objects.bulk_create(
+        [
+            ClaimChange(
+                event_id=allocation.event_id,
+                claim_id=0,
+                allocation_id=allocation.pk,
+                quantity=allocation.remaining_quantity or 0,
+                action=ClaimChange.UPSERT_TOKEN,
+            )
+            for allocation in allocations
+        ],
+        batch_size=1000,
+    )
+
+
+def current_sequence(event_id):
+    return ClaimChange.objects.filter(event_id=event_id).aggregate(seq=Max('id'))['seq'] or 0
+
+
+def manifest_version(event_id):
+    """
+    The newest sequence and the number of changes: a change committing
+    below the newest sequence still moves the version (gate ETags).
+    """
+    row = ClaimChange.objects.filter(event_id=event_id).aggregate(seq=Max('id'), count=Count('id'))
+    return f"{row['seq'] or 0}.{row['count']}"
+
+
+def delta_floor(event_id, since):
+    """
+    The sequence a delta for `since` starts after: the newest change at or
+    below it inserted GATE_DELTA_LOOKBACK_SECONDS before `since` was (0 if
+    none). Walks back on the (event, id) index over the window only.
+    """
+    inserted = ClaimChange.objects.filter(pk=since, event_id=event_id).values_list('created_at', flat=True).first()
+    if inserted is None:
+        return since
+    lookback = timedelta(seconds=getattr(settings, 'GATE_DELTA_LOOKBACK_SECONDS', 60))
+    return ClaimChange.objects.filter(
+        event_id=event_id, id__lte=since, created_at__lte=inserted - lookback,
+    ).order_by('-id').values_list('id', flat=True).first() or 0
+
+
+# -----------------------------
+# Snapshot / delta
+# -----------------------------
+def token_digest(token):
+    return hashlib.sha256(token.encode()).digest()[:8]
+
+
+def build_snapshot(event_id):
+    """
+    Returns (sequence, bytes) for an event's tokens and claims.
+
+    The sequence is read first: a change landing while the rows are read,
+    or committing late below it, is then also served by the next delta
+    (see delta_floor), which is safe to replay.
+    """
+    sequence = current_sequence(event_id)
+
+    tokens = sorted(
+        (token_digest(token), pk, remaining or 0)
+        for pk, token, remaining in SpaceAllocation.objects.filter(
+            event_id=event_id, referral_token__isnull=False,
+        ).values_list('pk', 'referral_token', 'remaining_quantity').iterator(chunk_size=CHUNK_SIZE)
+    )
+    claims = Claim.objects.filter(allocation__event_id=event_id).order_by('id').values_list(
+        'id', 'allocation_id', 'quantity'
+    )
+
+    body = bytearray()
+    count = seats = 0
+    for row in claims.iterator(chunk_size=CHUNK_SIZE):
+        body += CLAIM.pack(*row)
+        count += 1
+        seats += row[2]
+
+    header = SNAPSHOT_HEADER.pack(b'GATE', VERSION, event_id, sequence, len(tokens), count, seats)
+    return sequence, b''.join([header, *(TOKEN.pack(*t) for t in tokens), bytes(body)])
+
+
+def build_delta(event_id, since):
+    """
+    Returns (sequence, bytes) with the event's claim and token changes
+    after `since`, re-sending the lookback window before it. Token
+    upserts carry the allocation's token digest.
+    """
+    token = SpaceAllocation.objects.filter(pk=OuterRef('allocation_id')).values('referral_token')[:1]
+    floor = delta_floor(event_id, since) if since else 0
+    changes = ClaimChange.objects.filter(event_id=event_id, id__gt=floor).order_by('id').annotate(
+        token=Subquery(token),
+    ).values_list('id', 'action', 'claim_id', 'allocation_id', 'quantity', 'token')
+    body = bytearray()
+    count = 0
+    sequence = since
+    for pk, action, claim_id, allocation_id, quantity, token in changes.iterator(chunk_size=CHUNK_SIZE):
+        digest = token_digest(token) if action == ClaimChange.UPSERT_TOKEN and token else NO_DIGEST
+        body += CHANGE.pack(action, claim_id, allocation_id, quantity, digest)
+        count += 1
+        sequence = max(sequence, pk)
+
+    header = DELTA_HEADER.pack(b'GDLT', VERSION, event_id, since, sequence, count)
+    return sequence, header + bytes(body)
@@ -0,0 +1,181 @@
+# app/idempotency.py
+import hashlib
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.contrib import messages
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+
+from .models import IdempotencyKey
+from .throttling import user_ident
+
+HEADER = 'Idempotency-Key'
+FORM_FIELD = 'idempotency_key'
+# Differ between two submissions of the same form, so they aren't fingerprinted
+IGNORED_FIELDS = {FORM_FIELD, 'csrfmiddlewaretoken'}
+
+
+# -----------------------------
+# Request identity
+# -----------------------------
+def _digest(*parts):
+    return hashlib.sha256('\x1f'.join(parts).encode()).hexdigest()
+
+
+def request_key(request):
+    """The Idempotency-Key header, or the idempotency_key field of a posted form."""
+    key = request.headers.get(HEADER)
+    if key is None and request.content_type in ('application/x-www-form-urlencoded', 'multipart/form-data'):
+        key = request.POST.get(FORM_FIELD)
+    return (key or '').strip()
+
+
+def request_scope(request):
+    """
+    Keys are per endpoint and per caller: the session user, else the
+    bearer token's user_id claim (a refreshed token is the same caller).
+    """
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        identity = f"user:{user.pk}"
+    else:
+        identity = user_ident(request) or 'anonymous'
+    return _digest(request.path, identity)
+
+
+def request_fingerprint(request):
+    if request.content_type in ('application/x-www-form-urlencoded', 'multipart/form-data'):
+        # Forms are compared field by field; uploads by name and size (the
+        # body of a large upload is not read twice)
+        fields = sorted(
+            (name, value) for name, values in request.POST.lists() if name not in IGNORED_FIELDS
+            for value in values
+        )
+        files = sorted((name, f.name, str(f.size)) for name, f in request.FILES.items())
+        return _digest(request.method, repr(fields), repr(files))
+    return _digest(request.method, request.body.decode('utf-8', 'replace'))
+
+
+# -----------------------------
+# Storage
+# -----------------------------
+def reserve(scope, key, fingerprint):
+    """
+    Takes the key for this request. Returns (record, True) if the caller
+    should run the view, or (record, False) for an earlier record to reply
+    from. The row is committed before the view runs, so a concurrent
+    retry finds it.
+
+    An expired record is taken over, and so is a reservation for the same
+    request still without a response after IDEMPOTENCY_LOCK_SECONDS: its
+    worker was killed (timeout, deploy) before it could store or release.
+    """
+    now = timezone.now()
+    expires_at = now + timedelta(seconds=getattr(settings, 'IDEMPOTENCY_KEY_TTL', 86400))
+    try:
+        with transaction.atomic():
+            return IdempotencyKey.objects.create(
+                scope=scope, key=key, fingerprint=fingerprint, expires_at=expires_at,
+            ), True
+    except IntegrityError:
+        pass
+
+    lease = timedelta(seconds=getattr(settings, 'IDEMPOTENCY_LOCK_SECONDS', 60))
+    abandoned = Q(status_code__isnull=True, fingerprint=fingerprint, created_at__lte=now - lease)
+    if IdempotencyKey.objects.filter(Q(expires_at__lte=now) | abandoned, scope=scope, key=key).update(
+        fingerprint=fingerprint, status_code=None, content_type='', location='', body=b'',
+        created_at=now, expires_at=expires_at,
+    ):
+        return IdempotencyKey.objects.get(scope=scope, key=key), True
+    return IdempotencyKey.objects.filter(scope=scope, key=key).first(), False
+
+
+def _owned(record):
+    # created_at changes on takeover: a worker that outlived its lease
+    # must not overwrite or free the new owner's reservation
+    return IdempotencyKey.objects.filter(pk=record.pk, created_at=record.created_at)
+
+
+def store(record, response):
+    if hasattr(response, 'render') and not response.is_rendered:
+        response.render()
+    _owned(record).update(
+        status_code=response.status_code,
+        content_type=response.get('Content-Type', ''),
+        location=response.get('Location', ''),
+        body=response.content,
+    )
+
+
+def release(record):
+    _owned(record).filter(status_code__isnull=True).delete()
+
+
+def purge_expired():
+    """Deletes expired records (one DELETE on the expires_at index); returns how many."""
+    return IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).delete()[0]
+
+
+# -----------------------------
+# Replies
+# -----------------------------
+def replay(request, record):
+    response = HttpResponse(bytes(record.body), status=record.status_code, content_type=record.content_type or None)
+    if record.location:
+        response['Location'] = record.location
+        # Form posts redirect; say why nothing new happened
+        messages.info(request, "This was already submitted; nothing was changed.", fail_silently=True)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(view):
+    """
+    Makes POSTs carrying an Idempotency-Key header (or idempotency_key
+    form field) run once per key. The first response is stored for
+    IDEMPOTENCY_KEY_TTL seconds, and retries with the same key get it
+    back without the view running again. A retry that arrives while the
+    first request is still running gets 409 (until its lease runs out,
+    see reserve()). A key reused for a different
+    request gets 422. Server errors and exceptions free the key for
+    another try.
+    """
+
+    @wraps(view)
+    def inner(request, *args, **kwargs):
+        key = request_key(request) if request.method == 'POST' else ''
+        if not key:
+            return view(request, *args, **kwargs)
+        if len(key) > 255:
+            return JsonResponse({"error": f"{HEADER} is longer than 255 characters."}, status=400)
+
+        fingerprint = request_fingerprint(request)
+        record, owner = reserve(request_scope(request), key, fingerprint)
+        if record is None:
+            # Purged between the insert and the lookup; let the client retry
+            return JsonResponse({"error": "Retry the request."}, status=409)
+        if not owner:
+            if record.fingerprint != fingerprint:
+                return JsonResponse({"error": f"{HEADER} was already used for a different request."}, status=422)
+            if record.status_code is None:
+                response = JsonResponse({"error": "A request with this key is still in progress."}, status=409)
+                response['Retry-After'] = '1'
+                return response
+            return replay(request, record)
+
+        try:
+            response = view(request, *args, **kwargs)
+        except Exception:
+            release(record)
+            raise
+        if response.status_code >= 500 or getattr(response, 'streaming', False):
+            release(record)
+        else:
+            store(record, response)
+        return response
+
+    return inner
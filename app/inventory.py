@@ -0,0 +1,202 @@
+# app/inventory.py
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+from django.db import transaction
+from django.db.models import F, Sum, Subquery
+
+from .models import SpaceCategory, SpaceAllocation, Claim, EventInventory
+
+
+# -----------------------------
+# Lookups
+# -----------------------------
+def get_inventory(event_id, category_id):
+    """Returns the ledger row for an (event, category) pair, creating it if needed."""
+    inventory, _ = EventInventory.objects.get_or_create(
+        event_id=event_id,
+        category_id=category_id,
+        defaults={
+            'capacity': SpaceCategory.objects.filter(
+                pk=category_id
+            ).with_subtree_seats().values_list('subtree_seats', flat=True).first() or 0,
+        },
+    )
+    return inventory
+
+
+@dataclass
+class Zones:
+    """
+    Room left in some categories and in all their ancestors for one event
+    (see lock_zones). A zone's room is its subtree's seats less everything
+    allocated anywhere in that subtree: a tier holds its blocks.
+    """
+    lineage: dict    # category_id -> [category_id, parent_id, ..., root_id]
+    names: dict      # zone_id -> name
+    available: dict  # zone_id -> seats left in its subtree
+    requested: dict = field(default_factory=lambda: defaultdict(int))
+
+    def add(self, category_id, quantity):
+        """Asks for `quantity` seats in a category, and so in each of its ancestors."""
+        for key in self.lineage[category_id]:
+            self.requested[key] += quantity
+
+    def full_zone(self, category_id):
+        """The nearest zone at or above the category that can't hold what was asked; None if all can."""
+        return next(
+            (key for key in self.lineage[category_id] if self.requested[key] > self.available[key]), None,
+        )
+
+
+def lock_zones(event_id, venue_id, category_ids, lock=True):
+    """
+    Reads the room left in `category_ids` (those of the venue; others are
+    left out of `lineage`) and in their ancestors. With `lock`, their
+    ledger rows are created if missing and locked in category order, so
+    allocations under the same zones queue behind each other and can't
+    deadlock; call it inside the transaction that writes the allocations.
+    """
+    lineage = {
+        pk: [int(key) for key in path.strip('/').split('/')][::-1]
+        for pk, path in SpaceCategory.objects.filter(
+            venue_id=venue_id, pk__in=category_ids,
+        ).values_list('id', 'path')
+    }
+    zone_ids = {key for keys in lineage.values() for key in keys}
+    zones = {
+        row['id']: row
+        for row in SpaceCategory.objects.filter(pk__in=zone_ids).with_subtree_seats().values(
+            'id', 'name', 'subtree_seats',
+        )
+    }
+    if lock and zones:
+        EventInventory.objects.bulk_create(
+            [EventInventory(event_id=event_id, category_id=pk, capacity=row['subtree_seats']) for pk, row in zones.items()],
+            ignore_conflicts=True,
+        )
+        list(EventInventory.objects.select_for_update().filter(
+            event_id=event_id, category_id__in=zone_ids,
+        ).order_by('category_id').values_list('id', flat=True))
+
+    # Ledger rows count a category's own allocations; sum them up the paths
+    in_subtree = defaultdict(int)
+    for path, allocated in EventInventory.objects.filter(
+        event_id=event_id, category__venue_id=venue_id, allocated__gt=0,
+    ).values_list('category__path', 'allocated'):
+        for key in path.strip('/').split('/'):
+            if int(key) in zone_ids:
+                in_subtree[int(key)] += allocated
+    return Zones(
+        lineage=lineage,
+        names={pk: row['name'] for pk, row in zones.items()},
+        available={pk: row['subtree_seats'] - in_subtree[pk] for pk, row in zones.items()},
+    )
+
+
+def inventory_map(event_id):
+    """Returns {category_id: EventInventory} for every ledger row of an event."""
+    return {
+        inv.category_id: inv
+        for inv in EventInventory.objects.filter(event_id=event_id)
+    }
+
+
+# -----------------------------
+# Counter updates (called from app.signals)
+# -----------------------------
+def record_allocation(event_id, category_id, quantity):
+    # Only create rows on the way up: a delete may be cascading from the
+    # event or category itself, and the row must not be resurrected.
+    if quantity > 0:
+        get_inventory(event_id, category_id)
+    EventInventory.objects.filter(
+        event_id=event_id,
+        category_id=category_id
+    ).update(allocated=F('allocated') + quantity)
+
+
+def record_claim(allocation_id, quantity):
+    # Resolve the allocation's event/category inside the UPDATE itself
+    allocation = SpaceAllocation.objects.filter(pk=allocation_id)
+    EventInventory.objects.filter(
+        event_id=Subquery(allocation.values('event_id')[:1]),
+        category_id=Subquery(allocation.values('category_id')[:1]),
+    ).update(claimed=F('claimed') + quantity)
+
+
+def record_bulk_claims(totals):
+    """
+    Counter update for claims written with bulk_create (no signals):
+    `totals` maps (event_id, category_id) to the seats claimed.
+    """
+    for (event_id, category_id), quantity in totals.items():
+        EventInventory.objects.filter(
+            event_id=event_id,
+            category_id=category_id
+        ).update(claimed=F('claimed') + quantity)
+
+
+def sync_capacity(category, include_self=True):
+    """
+    Refreshes ledger capacity for `category` and its ancestors, whose
+    subtree seat totals change along with it.
+    """
+    nodes = SpaceCategory.objects.ancestors(category, include_self=include_self).with_subtree_seats()
+    for pk, seats in nodes.values_list('pk', 'subtree_seats'):
+        EventInventory.objects.filter(category_id=pk).update(capacity=seats)
+
+
+def sync_venue_capacity(venue_id):
+    """Refreshes ledger capacity for every category of a venue that has ledger rows."""
+    nodes = SpaceCategory.objects.filter(
+        venue_id=venue_id,
+        inventory__isnull=False,
+    ).distinct().with_subtree_seats()
+    for pk, seats in nodes.values_list('pk', 'subtree_seats'):
+        EventInventory.objects.filter(category_id=pk).exclude(capacity=seats).update(capacity=seats)
+
+
+# -----------------------------
+# Backfill
+# -----------------------------
+@transaction.atomic
+def rebuild_inventory(event_ids=None):
+    """
+    Recomputes the ledger from SpaceAllocation and Claim with grouped
+    aggregates. Returns the number of rows written.
+    """
+    allocations = SpaceAllocation.objects.all()
+    claims = Claim.objects.all()
+    ledger = EventInventory.objects.all()
+    if event_ids is not None:
+        allocations = allocations.filter(event_id__in=event_ids)
+        claims = claims.filter(allocation__event_id__in=event_ids)
+        ledger = ledger.filter(event_id__in=event_ids)
+
+    rows = {}
+    for row in allocations.values('event_id', 'category_id').annotate(total=Sum('total_quantity')):
+        rows[(row['event_id'], row['category_id'])] = EventInventory(
+            event_id=row['event_id'],
+            category_id=row['category_id'],
+            allocated=row['total'] or 0,
+        )
+
+    capacities = dict(
+        SpaceCategory.objects.filter(
+            pk__in={category_id for _, category_id in rows}
+        ).with_subtree_seats().values_list('pk', 'subtree_seats')
+    )
+    for (_, category_id), inventory in rows.items():
+        inventory.capacity = capacities.get(category_id, 0)
+
+    for row in claims.values('allocation__event_id', 'allocation__category_id').annotate(
+        total=Sum('quantity')
+    ):
+        inventory = rows.get((row['allocation__event_id'], row['allocation__category_id']))
+        if inventory:
+            inventory.claimed = row['total'] or 0
+
+    ledger.delete()
+    EventInventory.objects.bulk_create(rows.values(), batch_size=1000)
+    return len(rows)
@@ -0,0 +1,91 @@
+# app/live.py
+import asyncio
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+
+# -----------------------------
+# Brokers
+# -----------------------------
+class InProcessBroker:
+    """
+    Fans messages out to subscribers of the same process.
+
+    Enough for a single ASGI worker (and for tests). Multi-worker
+    deployments point LIVE_BROKER at a class with the same two methods
+    backed by an external pub/sub (e.g. Redis).
+    """
+
+    max_queue = 100
+
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def publish(self, channel, message):
+        """Called from sync code (on_commit hooks), possibly off the event loop's thread."""
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._deliver, queue, message)
+            except RuntimeError:
+                # Loop already closed; its subscriber is gone
+                pass
+
+    def _deliver(self, queue, message):
+        try:
+            queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # Slow client: drop the backlog and ask it to reload instead
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait({'type': 'resync'})
+
+    async def subscribe(self, channel, heartbeat=None):
+        """Yields messages published on `channel`, or None after `heartbeat` idle seconds."""
+        subscriber = (asyncio.get_running_loop(), asyncio.Queue(maxsize=self.max_queue))
+        with self._lock:
+            self._subscribers[channel].add(subscriber)
+        try:
+            while True:
+                try:
+                    yield await asyncio.wait_for(subscriber[1].get(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield None
+        finally:
+            with self._lock:
+                self._subscribers[channel].discard(subscriber)
+                if not self._subscribers[channel]:
+                    del self._subscribers[channel]
+
+
+_broker = None
+
+
+def get_broker():
+    """The process-wide broker named by the LIVE_BROKER setting."""
+    global _broker
+    if _broker is None:
+        _broker = import_string(getattr(settings, 'LIVE_BROKER', 'app.live.InProcessBroker'))()
+    return _broker
+
+
+# -----------------------------
+# Inventory deltas
+# -----------------------------
+def event_channel(event_id):
+    return f"event-{event_id}"
+
+
+def publish_inventory_delta(event_id, category_id, allocated=0, claimed=0):
+    """
+    Queues a ledger delta for the event's live dashboards. It is only sent
+    once the surrounding transaction commits; rolled-back writes are never seen.
+    """
+    message = {'type': 'inventory', 'category': category_id, 'allocated': allocated, 'claimed': claimed}
+    transaction.on_commit(lambda: get_broker().publish(event_channel(event_id), message))
@@ -0,0 +1,46 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app.benchmark import run_benchmarks, compare
+
+
+class Command(BaseCommand):
+    help = (
+        "Times the API and HTML endpoints against the current database and "
+        "writes latency and query counts to JSON (see generate_data)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5, help="Timed requests per endpoint.")
+        parser.add_argument('--warmup', type=int, default=1, help="Untimed requests per endpoint.")
+        parser.add_argument('--only', action='append', help="Only run this case (may be repeated).")
+        parser.add_argument('--output', default='benchmark.json', help="Where to write the report.")
+        parser.add_argument('--compare', help="Earlier report to compare medians and query counts with.")
+
+    def handle(self, *args, **options):
+        try:
+            report = run_benchmarks(runs=options['runs'], warmup=options['warmup'], only=options['only'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        with open(options['output'], 'w') as f:
+            json.dump(report, f, indent=2)
+
+        for r in report['results']:
+            self.stdout.write(
+                f"{r['name']:<28} {r['latency_ms']['median']:>10.2f} ms  "
+                f"p95 {r['latency_ms']['p95']:>10.2f} ms  {r['queries']['max']:>5} queries  {r['bytes']:>9} B"
+            )
+
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+            self.stdout.write(f"\nCompared with {baseline.get('revision') or options['compare']}:")
+            for name, old_ms, new_ms, change, old_q, new_q in compare(baseline, report):
+                style = self.style.ERROR if change > 10 or new_q > old_q else self.style.SUCCESS
+                self.stdout.write(style(
+                    f"{name:<28} {old_ms:>10.2f} -> {new_ms:>10.2f} ms ({change:+.1f}%)  queries {old_q} -> {new_q}"
+                ))
+
+        self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}."))
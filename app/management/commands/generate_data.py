@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from app.synthetic import generate_dataset
+
+
+class Command(BaseCommand):
+    help = (
+        "Generates a synthetic dataset: venues with deep space trees, events, "
+        "allocations and claims. Scale up with --events/--allocations/--claims."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--venues', type=int, default=2)
+        parser.add_argument('--tiers', type=int, default=4, help="Tiers per venue.")
+        parser.add_argument('--blocks', type=int, default=25, help="Blocks per tier.")
+        parser.add_argument('--sections', type=int, default=40, help="Sections per block.")
+        parser.add_argument('--events', type=int, default=100)
+        parser.add_argument('--sources', type=int, default=5, help="Allocation sources per event.")
+        parser.add_argument('--allocations', type=int, default=200, help="Allocations per event.")
+        parser.add_argument('--claims', type=int, default=10, help="Maximum claims per allocation.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        counts = generate_dataset(
+            venues=options['venues'],
+            tiers=options['tiers'],
+            blocks=options['blocks'],
+            sections=options['sections'],
+            events=options['events'],
+            sources=options['sources'],
+            allocations=options['allocations'],
+            claims=options['claims'],
+            seed=options['seed'],
+            batch_size=options['batch_size'],
+            log=self.stdout.write,
+        )
+        summary = ", ".join(f"{count} {name.replace('_', ' ')}" for name, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(f"Generated {summary}."))
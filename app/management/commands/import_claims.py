@@ -0,0 +1,46 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app.claim_import import import_claims, iter_rows, CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    help = "Imports claims from a CSV or XLSX guest list, streaming it in chunks."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV or XLSX file to import.")
+        parser.add_argument(
+            '--referral-token',
+            help="Referral token for rows that don't carry their own.",
+        )
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+        parser.add_argument(
+            '--errors',
+            help="Write rejected rows to this CSV file instead of the console.",
+        )
+
+    def handle(self, *args, **options):
+        with open(options['path'], 'rb') as f:
+            report = import_claims(
+                iter_rows(f, options['path']),
+                default_token=options['referral_token'],
+                chunk_size=options['chunk_size'],
+            )
+
+        if options['errors']:
+            with open(options['errors'], 'w', newline='') as out:
+                writer = csv.DictWriter(out, fieldnames=['row', 'error'])
+                writer.writeheader()
+                writer.writerows(report.errors)
+        else:
+            for error in report.errors:
+                self.stderr.write(f"Row {error['row']}: {error['error']}")
+
+        summary = (
+            f"Imported {report.imported_rows} claims ({report.imported_seats} seats); "
+            f"{len(report.errors)} rows rejected."
+        )
+        if report.file_error:
+            raise CommandError(f"{report.file_error} {summary}")
+        self.stdout.write(self.style.SUCCESS(summary))
@@ -0,0 +1,52 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app.benchmark import run_throughput
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares requests per second of the sync read endpoints on a WSGI "
+        "server with their async twins on an ASGI server. Both servers must "
+        "be running against the same database (see generate_data), with "
+        "throttling off (THROTTLE_IP_RATE= THROTTLE_EVENT_RATE=)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sync-url', default='http://127.0.0.1:8000',
+                            help="Server running ticket_system.wsgi.")
+        parser.add_argument('--async-url', default='http://127.0.0.1:8001',
+                            help="Server running ticket_system.asgi.")
+        parser.add_argument('--concurrency', type=int, default=50, help="Requests in flight.")
+        parser.add_argument('--requests', type=int, default=1000, help="Requests per endpoint and server.")
+        parser.add_argument('--only', action='append', help="Only run this case (may be repeated).")
+        parser.add_argument('--output', default='loadtest.json', help="Where to write the report.")
+
+    def handle(self, *args, **options):
+        import httpx
+
+        try:
+            report = run_throughput(
+                options['sync_url'], options['async_url'],
+                concurrency=options['concurrency'], requests=options['requests'], only=options['only'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        except httpx.TransportError as e:
+            raise CommandError(f"Could not reach a server: {e}")
+
+        with open(options['output'], 'w') as f:
+            json.dump(report, f, indent=2)
+
+        for r in report['results']:
+            sync, asynchronous = r['sync'], r['async']
+            line = f"{r['name']:<20} async {asynchronous['rps']:>9.1f} req/s  p95 {asynchronous['latency_ms']['p95']:>9.2f} ms"
+            if sync:
+                line += (
+                    f"   sync {sync['rps']:>9.1f} req/s  p95 {sync['latency_ms']['p95']:>9.2f} ms"
+                    f"   x{asynchronous['rps'] / sync['rps']:.2f}"
+                )
+            self.stdout.write(line)
+
+        self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}."))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from app.inventory import rebuild_inventory
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the per-(event, category) inventory ledger from allocations and claims."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--event',
+            type=int,
+            action='append',
+            dest='events',
+            help="Only rebuild this event (may be repeated).",
+        )
+
+    def handle(self, *args, **options):
+        rows = rebuild_inventory(options['events'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} inventory rows."))
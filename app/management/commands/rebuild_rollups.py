@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from app.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the minute/hour/day claim rollups from the claims table."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--event',
+            type=int,
+            action='append',
+            dest='events',
+            help="Only rebuild this event (may be repeated).",
+        )
+
+    def handle(self, *args, **options):
+        rows = rebuild_rollups(options['events'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} rollup rows."))
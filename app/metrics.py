@@ -0,0 +1,119 @@
+# app/metrics.py
+import threading
+from collections import defaultdict
+
+# In-process registry rendered in the Prometheus text format. Each worker
+# keeps its own figures; Prometheus sums them across scrape targets.
+
+
+# -----------------------------
+# Metric types
+# -----------------------------
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + '}'
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] += amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for labels, value in sorted(values.items()):
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self._series = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, *labels, value):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def samples(self):
+        with self._lock:
+            series = {labels: list(values) for labels, values in self._series.items()}
+        names = self.labelnames + ('le',)
+        for labels, values in sorted(series.items()):
+            for bound, count in zip(self.buckets, values):
+                le = '+Inf' if bound == float('inf') else str(bound)
+                yield f"{self.name}_bucket{_labels(names, labels + (le,))} {count}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(values[-2])}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {values[-1]}"
+
+
+# -----------------------------
+# Registry
+# -----------------------------
+REQUESTS = Counter(
+    'app_http_requests_total', 'Requests handled, by view, method and status.',
+    ('view', 'method', 'status'),
+)
+REQUEST_DURATION = Histogram(
+    'app_http_request_duration_seconds', 'Time to produce the response, by view.',
+    ('view',), (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+SQL_QUERIES = Histogram(
+    'app_sql_queries_per_request', 'SQL statements executed per request, by view.',
+    ('view',), (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000),
+)
+SQL_DURATION = Histogram(
+    'app_sql_duration_seconds', 'Total SQL time per request, by view.',
+    ('view',), (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+RESPONSE_SIZE = Histogram(
+    'app_http_response_size_bytes', 'Response body size (non-streaming), by view.',
+    ('view',), (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304),
+)
+
+THROTTLED = Counter(
+    'app_http_requests_throttled_total', 'Requests refused with 429, by view and exhausted scope.',
+    ('view', 'scope'),
+)
+
+REGISTRY = [REQUESTS, REQUEST_DURATION, SQL_QUERIES, SQL_DURATION, RESPONSE_SIZE, THROTTLED]
+
+
+def render(registry=REGISTRY):
+    lines = []
+    for metric in registry:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.samples())
+    return '\n'.join(lines) + '\n'
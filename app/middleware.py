@@ -0,0 +1,214 @@
+# app/middleware.py
+import logging
+from contextlib import ExitStack
+from math import ceil
+from time import perf_counter, time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.http import JsonResponse
+from django.urls import Resolver404, resolve
+
+from . import metrics
+from .replicas import routing
+from .throttling import athrottle, request_buckets, throttle
+
+logger = logging.getLogger('app.metrics')
+
+
+# -----------------------------
+# SQL recorder
+# -----------------------------
+class QueryRecorder:
+    """Collects (seconds, sql) for every statement run while active, on all databases."""
+
+    def __init__(self):
+        self.queries = []
+        self._stack = ExitStack()
+
+    def __enter__(self):
+        for connection in connections.all():
+            self._stack.enter_context(connection.execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc):
+        self._stack.close()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((perf_counter() - start, sql))
+
+    @property
+    def total_time(self):
+        return sum(duration for duration, _ in self.queries)
+
+
+# -----------------------------
+# Middleware
+# -----------------------------
+class QueryMetricsMiddleware:
+    """
+    Records per-view query count, SQL time, response time and payload
+    size into app.metrics. Requests slower than the view's threshold
+    (METRICS_SLOW_REQUEST_MS, overridable per view name) log their
+    slowest statements to the 'app.metrics' logger.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with QueryRecorder() as recorder:
+            start = perf_counter()
+            response = self.get_response(request)
+        self.observe(request, response, recorder, perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        # Async views (and sync ones under ASGI) query from the request's
+        # sync_to_async thread, whose connections aren't the event loop's:
+        # install the wrappers there
+        recorder = QueryRecorder()
+        await sync_to_async(recorder.__enter__)()
+        try:
+            start = perf_counter()
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(recorder.__exit__)(None, None, None)
+        self.observe(request, response, recorder, perf_counter() - start)
+        return response
+
+    def observe(self, request, response, recorder, elapsed):
+        match = request.resolver_match
+        view = (match.view_name or match._func_path) if match else 'unmatched'
+
+        metrics.REQUESTS.inc(view, request.method, response.status_code)
+        metrics.REQUEST_DURATION.observe(view, value=elapsed)
+        metrics.SQL_QUERIES.observe(view, value=len(recorder.queries))
+        metrics.SQL_DURATION.observe(view, value=recorder.total_time)
+        if not response.streaming:
+            metrics.RESPONSE_SIZE.observe(view, value=len(response.content))
+
+        thresholds = getattr(settings, 'METRICS_SLOW_VIEWS', {})
+        threshold = thresholds.get(view, getattr(settings, 'METRICS_SLOW_REQUEST_MS', 500))
+        if threshold is not None and elapsed * 1000 > threshold:
+            slowest = sorted(recorder.queries, key=lambda q: q[0], reverse=True)
+            slowest = slowest[:getattr(settings, 'METRICS_SLOW_QUERY_LOG', 5)]
+            logger.warning(
+                "Slow request %s %s (view %s): %.0f ms, %d queries, %.0f ms SQL\n%s",
+                request.method, request.path, view, elapsed * 1000,
+                len(recorder.queries), recorder.total_time * 1000,
+                '\n'.join(f"  {duration * 1000:.1f} ms  {sql}" for duration, sql in slowest),
+            )
+
+
+# -----------------------------
+# Read replicas
+# -----------------------------
+class ReplicaRoutingMiddleware:
+    """
+    Lets GET/HEAD requests read from the replicas (see app.replicas). A
+    request that writes sets a cookie pinning the client to the primary
+    for PRIMARY_PIN_SECONDS, so it reads its own writes despite
+    replication lag.
+    """
+
+    sync_capable = True
+    async_capable = True
+    cookie_name = 'pin_primary'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with routing(self.replica_reads(request)) as state:
+            response = self.get_response(request)
+        return self.pin(response, state)
+
+    async def __acall__(self, request):
+        with routing(self.replica_reads(request)) as state:
+            response = await self.get_response(request)
+        return self.pin(response, state)
+
+    def replica_reads(self, request):
+        if request.method not in ('GET', 'HEAD', 'OPTIONS'):
+            return False
+        pinned_until = request.COOKIES.get(self.cookie_name, '')
+        return not (pinned_until.isdigit() and int(pinned_until) > time())
+
+    def pin(self, response, state):
+        if state.wrote:
+            seconds = getattr(settings, 'PRIMARY_PIN_SECONDS', 10)
+            response.set_cookie(
+                self.cookie_name, str(int(time() + seconds)), max_age=seconds, httponly=True, samesite='Lax',
+            )
+        return response
+
+
+# -----------------------------
+# Throttling
+# -----------------------------
+class ThrottleMiddleware:
+    """
+    Token-bucket rate limits (see app.throttling) on THROTTLE_PATHS: per
+    user, or per IP without one, and per event. Runs before the session
+    and auth middleware, so a refused request costs a URL resolve and one
+    cache read, and never reaches the ORM.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        buckets = self.buckets(request)
+        denied = throttle(buckets) if buckets else None
+        return self.refuse(request, *denied) if denied else self.get_response(request)
+
+    async def __acall__(self, request):
+        buckets = self.buckets(request)
+        denied = await athrottle(buckets) if buckets else None
+        return self.refuse(request, *denied) if denied else await self.get_response(request)
+
+    def buckets(self, request):
+        if not request.path_info.startswith(tuple(getattr(settings, 'THROTTLE_PATHS', ()))):
+            return None
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return None
+        # Lets QueryMetricsMiddleware label refused requests with their view
+        request.resolver_match = match
+        return request_buckets(request, match.kwargs)
+
+    def refuse(self, request, scope, wait):
+        match = request.resolver_match
+        metrics.THROTTLED.inc(match.view_name or match._func_path, scope)
+        retry_after = max(1, ceil(wait))
+        response = JsonResponse(
+            {"detail": f"Request was throttled ({scope} limit). Expected available in {retry_after} seconds."},
+            status=429,
+        )
+        response['Retry-After'] = str(retry_after)
+        return response
@@ -0,0 +1,55 @@
+# Generated by Django 6.0 on 2026-10-18 00:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def backfill_inventory(apps, schema_editor):
+    SpaceAllocation = apps.get_model('app', 'SpaceAllocation')
+    Claim = apps.get_model('app', 'Claim')
+    EventInventory = apps.get_model('app', 'EventInventory')
+
+    rows = {}
+    for row in SpaceAllocation.objects.values('event_id', 'category_id', 'category__seats_count').annotate(
+        total=Sum('total_quantity')
+    ):
+        rows[(row['event_id'], row['category_id'])] = EventInventory(
+            event_id=row['event_id'],
+            category_id=row['category_id'],
+            capacity=row['category__seats_count'],
+            allocated=row['total'] or 0,
+        )
+    for row in Claim.objects.values('allocation__event_id', 'allocation__category_id').annotate(
+        total=Sum('quantity')
+    ):
+        inventory = rows.get((row['allocation__event_id'], row['allocation__category_id']))
+        if inventory:
+            inventory.claimed = row['total'] or 0
+    EventInventory.objects.bulk_create(rows.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventInventory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('capacity', models.PositiveIntegerField(default=0)),
+                ('allocated', models.PositiveIntegerField(default=0)),
+                ('claimed', models.PositiveIntegerField(default=0)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inventory', to='app.spacecategory')),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inventory', to='app.event')),
+            ],
+            options={
+                'verbose_name_plural': 'Event inventory',
+                'unique_together': {('event', 'category')},
+            },
+        ),
+        migrations.RunPython(backfill_inventory, migrations.RunPython.noop),
+    ]
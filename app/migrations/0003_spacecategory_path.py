@@ -0,0 +1,41 @@
+# Generated by Django 6.0 on 2026-10-18 01:20
+
+from django.db import migrations, models
+
+
+def backfill_paths(apps, schema_editor):
+    SpaceCategory = apps.get_model('app', 'SpaceCategory')
+
+    # Walk the forest level by level so each parent's path is known first
+    paths = {}
+    level = list(SpaceCategory.objects.filter(parent=None))
+    depth = 0
+    while level:
+        for category in level:
+            category.path = f"{paths.get(category.parent_id, '/')}{category.pk}/"
+            category.depth = depth
+            paths[category.pk] = category.path
+        SpaceCategory.objects.bulk_update(level, ['path', 'depth'], batch_size=1000)
+        level = list(SpaceCategory.objects.filter(parent_id__in=[c.pk for c in level]))
+        depth += 1
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0002_eventinventory'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='spacecategory',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='spacecategory',
+            name='path',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=255),
+        ),
+        migrations.RunPython(backfill_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 6.0 on 2026-10-18 02:10
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0003_spacecategory_path'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='event',
+            name='start_datetime',
+            field=models.DateTimeField(db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='spaceallocation',
+            name='created_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='spaceallocation',
+            index=models.Index(fields=['event', 'category'], name='app_spaceal_event_i_2101ff_idx'),
+        ),
+    ]
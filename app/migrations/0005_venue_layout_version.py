@@ -0,0 +1,24 @@
+# Generated by Django 6.0 on 2026-10-18 02:40
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0004_list_api_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='venue',
+            name='layout_updated_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.AddField(
+            model_name='venue',
+            name='layout_version',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+    ]
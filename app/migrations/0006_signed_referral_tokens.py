@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-18 03:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0005_venue_layout_version'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='spaceallocation',
+            name='referral_token',
+            field=models.CharField(blank=True, max_length=255, null=True, unique=True),
+        ),
+    ]
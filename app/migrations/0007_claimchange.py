@@ -0,0 +1,28 @@
+# Generated by Django 6.0 on 2026-10-18 03:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0006_signed_referral_tokens'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClaimChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('claim_id', models.PositiveIntegerField()),
+                ('allocation_id', models.PositiveIntegerField()),
+                ('quantity', models.PositiveIntegerField()),
+                ('action', models.PositiveSmallIntegerField(choices=[(1, 'Upsert'), (2, 'Remove')])),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='claim_changes', to='app.event')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['event', 'id'], name='app_claimch_event_i_4053c4_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 6.0 on 2026-10-18 04:31
+
+from django.db import migrations, models
+
+
+def check_existing_rows(apps, schema_editor):
+    # Name the offending rows instead of failing on an anonymous CHECK error
+    EventInventory = apps.get_model('app', 'EventInventory')
+    Claim = apps.get_model('app', 'Claim')
+    bad = list(EventInventory.objects.filter(
+        models.Q(allocated__gt=models.F('capacity')) | models.Q(claimed__gt=models.F('allocated'))
+    ).values_list('event_id', 'category_id')[:20])
+    if bad or Claim.objects.filter(quantity__lt=1).exists():
+        raise RuntimeError(
+            "Existing data breaks the new capacity constraints (event, category): "
+            f"{bad}. Fix the allocations/claims (GET /api/events/<id>/validate/ lists them) "
+            "and run `manage.py rebuild_inventory`, then migrate again."
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0007_claimchange'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_existing_rows, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='claim',
+            constraint=models.CheckConstraint(condition=models.Q(('quantity__gte', 1)), name='claim_quantity_positive'),
+        ),
+        migrations.AddConstraint(
+            model_name='eventinventory',
+            constraint=models.CheckConstraint(condition=models.Q(('allocated__lte', models.F('capacity'))), name='inventory_allocated_within_capacity'),
+        ),
+        migrations.AddConstraint(
+            model_name='eventinventory',
+            constraint=models.CheckConstraint(condition=models.Q(('claimed__lte', models.F('allocated'))), name='inventory_claimed_within_allocated'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 6.0 on 2026-10-18 04:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0008_capacity_constraints'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClaimRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('level', models.PositiveSmallIntegerField(choices=[(1, 'Minute'), (2, 'Hour'), (3, 'Day')])),
+                ('bucket', models.DateTimeField()),
+                ('claims', models.IntegerField(default=0)),
+                ('seats', models.IntegerField(default=0)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='app.spacecategory')),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='claim_rollups', to='app.event')),
+                ('source', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='app.allocationsource')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('event', 'level', 'bucket', 'category', 'source'), name='claim_rollup_bucket')],
+            },
+        ),
+    ]
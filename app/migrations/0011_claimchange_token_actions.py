@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-18 04:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0010_idempotency_keys'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='claimchange',
+            name='action',
+            field=models.PositiveSmallIntegerField(choices=[(1, 'Upsert'), (2, 'Remove'), (3, 'Upsert token'), (4, 'Remove token')]),
+        ),
+    ]
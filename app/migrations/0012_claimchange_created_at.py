@@ -0,0 +1,19 @@
+# Generated by Django 6.0 on 2026-10-18 04:35
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0011_claimchange_token_actions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='claimchange',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0 on 2026-10-18 04:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0012_claimchange_created_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='customuser',
+            name='access_rights',
+            field=models.CharField(choices=[('SuperAdmin', 'SuperAdmin'), ('EventAdmin', 'EventAdmin'), ('GateStaff', 'GateStaff')], db_index=True, default='GateStaff', max_length=20, verbose_name='Access Rights'),
+        ),
+        migrations.AlterField(
+            model_name='venue',
+            name='venue_type',
+            field=models.CharField(db_index=True, max_length=100),
+        ),
+    ]
@@ -1,8 +1,11 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import functions
 from django.contrib.auth.models import AbstractUser, Group, Permission
 from django.utils import timezone
 from django.core.exceptions import ValidationError
 
+from .tokens import make_token
+
 # -----------------------------
 # Custom User
 # -----------------------------
@@ -17,7 +20,8 @@ class CustomUser(AbstractUser):
         max_length=20,
         choices=ROLE_CHOICES,
         default='GateStaff',
-        verbose_name='Access Rights'
+        verbose_name='Access Rights',
+        db_index=True,  # ?access_rights= on the user list
     )
     groups = models.ManyToManyField(
         Group,
@@ -40,15 +44,70 @@ class Venue(models.Model):
     name = models.CharField(max_length=255)
     address = models.TextField(blank=True)
     location = models.TextField(blank=True)  # Optional GPS/location info
-    venue_type = models.CharField(max_length=100)  # Indoor/Outdoor/Hybrid
+    venue_type = models.CharField(max_length=100, db_index=True)  # Indoor/Outdoor/Hybrid; ?venue_type= filter
     total_capacity = models.PositiveIntegerField()  # Total number of seats
 
+    # Bumped on every venue or layout write; drives ETag/Last-Modified
+    layout_version = models.PositiveIntegerField(default=1, editable=False)
+    layout_updated_at = models.DateTimeField(default=timezone.now, editable=False)
+
     def __str__(self):
         return f"{self.name} (Capacity: {self.total_capacity})"
 
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            self.layout_version += 1
+            self.layout_updated_at = timezone.now()
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def touch_layout(cls, venue_id):
+        """Marks a venue's layout as changed without loading it."""
+        cls.objects.filter(pk=venue_id).update(
+            layout_version=models.F('layout_version') + 1,
+            layout_updated_at=timezone.now(),
+        )
+
 # -----------------------------
 # SpaceCategory
 # -----------------------------
+class SpaceCategoryQuerySet(models.QuerySet):
+    """
+    Hierarchy queries backed by the materialized `path` ("/<root id>/.../<id>/").
+    Every method below is a single SQL statement.
+    """
+
+    def leaves(self):
+        return self.filter(~models.Exists(SpaceCategory.objects.filter(parent=models.OuterRef('pk'))))
+
+    def descendants(self, node, include_self=False):
+        if not node.path:
+            raise ValueError("Node has no hierarchy path; save it first.")
+        qs = self.filter(path__startswith=node.path)
+        return qs if include_self else qs.exclude(pk=node.pk)
+
+    def ancestors(self, node, include_self=False):
+        ids = [int(i) for i in node.path.strip('/').split('/') if i]
+        if not include_self:
+            ids = ids[:-1]
+        return self.filter(pk__in=ids).order_by('depth')
+
+    def subtree_seat_total(self, node):
+        """Seats held by the leaves under (and including) `node`."""
+        return self.descendants(node, include_self=True).leaves().aggregate(
+            total=models.Sum('seats_count')
+        )['total'] or 0
+
+    def with_subtree_seats(self):
+        """Annotates `subtree_seats`: the leaf seat total of each node's subtree."""
+        subtree = SpaceCategory.objects.filter(
+            path__startswith=models.OuterRef('path')
+        ).leaves().values('venue').annotate(total=models.Sum('seats_count')).values('total')
+        return self.annotate(
+            subtree_seats=functions.Coalesce(models.Subquery(subtree), 0)
+        )
+
+
 class SpaceCategory(models.Model):
     venue = models.ForeignKey(Venue, related_name='spaces', on_delete=models.CASCADE)
     # ADD THESE TWO FIELDS:
@@ -59,24 +118,76 @@ class SpaceCategory(models.Model):
     ticket_tier = models.CharField(max_length=100, blank=True)
     seats_count = models.PositiveIntegerField()
 
+    # Hierarchy index, maintained in save()
+    path = models.CharField(max_length=255, blank=True, editable=False, db_index=True)
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
+
+    objects = SpaceCategoryQuerySet.as_manager()
+
     class Meta:
         unique_together = ('venue', 'name')
 
     def __str__(self):
         return f"{self.venue.name} - {self.name} ({self.seats_count} seats)"
 
+    def build_path(self):
+        return f"{self.parent.path if self.parent else '/'}{self.pk}/"
+
+    def save(self, *args, **kwargs):
+        old_path = self.path
+        super().save(*args, **kwargs)
+
+        new_path = self.build_path()
+        if new_path == old_path:
+            return
+        self.path = new_path
+        self.depth = new_path.count('/') - 2
+        SpaceCategory.objects.filter(pk=self.pk).update(path=self.path, depth=self.depth)
+
+        if old_path:
+            # Re-parented: move the whole subtree in one UPDATE
+            SpaceCategory.objects.filter(path__startswith=old_path).exclude(pk=self.pk).update(
+                path=functions.Concat(
+                    models.Value(new_path),
+                    functions.Substr('path', len(old_path) + 1),
+                ),
+                depth=models.F('depth') + (new_path.count('/') - old_path.count('/')),
+            )
+
     def clean(self):
-        # Validation to ensure we don't exceed venue capacity
-        total_allocated = sum([c.seats_count for c in self.venue.spaces.exclude(id=self.id)])
-        if total_allocated + self.seats_count > self.venue.total_capacity:
+        # Validation to ensure we don't exceed venue capacity. Only leaf seats
+        # count; parent tiers merely roll up the seats of their subtree.
+        others = SpaceCategory.objects.filter(venue=self.venue).exclude(pk=self.pk)
+        own_seats = self.seats_count
+        if self.parent_id:
+            # The parent stops being a leaf once it has this child
+            others = others.exclude(pk=self.parent_id)
+        if self.pk and self.path:
+            others = others.exclude(path__startswith=self.path)
+            if SpaceCategory.objects.descendants(self).exists():
+                own_seats = SpaceCategory.objects.subtree_seat_total(self)
+
+        total_allocated = others.leaves().aggregate(total=models.Sum('seats_count'))['total'] or 0
+        if total_allocated + own_seats > self.venue.total_capacity:
             raise ValidationError(f"Exceeds venue capacity of {self.venue.total_capacity}")
+
+        # Shrinking a leaf must leave room for what events already allocated
+        # here and in every tier above (one query over their ledger rows)
+        if self.pk and self.path and own_seats == self.seats_count:
+            stored = SpaceCategory.objects.filter(pk=self.pk).values_list('seats_count', flat=True).first()
+            shrink = (stored or 0) - self.seats_count
+            if shrink > 0 and EventInventory.objects.filter(
+                category__in=SpaceCategory.objects.ancestors(self, include_self=True),
+                allocated__gt=models.F('capacity') - shrink,
+            ).exists():
+                raise ValidationError("Seats already allocated for an event exceed the reduced capacity.")
 # -----------------------------
 # Event
 # -----------------------------
 class Event(models.Model):
     name = models.CharField(max_length=255)
     venue = models.ForeignKey(Venue, on_delete=models.CASCADE, related_name='events')
-    start_datetime = models.DateTimeField()
+    start_datetime = models.DateTimeField(db_index=True)
     end_datetime = models.DateTimeField()
 
     def __str__(self):
@@ -101,18 +212,17 @@ class AllocationSource(models.Model):
         if self.ticket_category.venue != self.venue:
             raise ValidationError("Ticket category does not belong to selected venue.")
 
-        # Ensure tickets_allocated does not exceed available seats
-        allocated_seats = sum([
-            alloc.tickets_allocated
-            for alloc in AllocationSource.objects.filter(
-                event=self.event,
-                ticket_category=self.ticket_category
-            ).exclude(id=self.id)
-        ])
-        available_seats = self.ticket_category.seats_count - allocated_seats
-        if self.tickets_allocated > available_seats:
+        # Ensure tickets_allocated fits in the category and in each of its
+        # ancestors (a read: the allocation itself is checked under lock)
+        from .inventory import lock_zones
+
+        zones = lock_zones(self.event_id, self.venue_id, [self.ticket_category_id], lock=False)
+        zones.add(self.ticket_category_id, self.tickets_allocated)
+        full = zones.full_zone(self.ticket_category_id)
+        if full is not None:
             raise ValidationError(
-                f"Cannot allocate {self.tickets_allocated} tickets. Only {available_seats} seats left in {self.ticket_category.name}."
+                f"Cannot allocate {self.tickets_allocated} tickets. "
+                f"Only {zones.available[full]} seats left in {zones.names[full]}."
             )
 
 # -----------------------------
@@ -124,24 +234,109 @@ class SpaceAllocation(models.Model):
     category = models.ForeignKey(SpaceCategory, on_delete=models.CASCADE)
     total_quantity = models.PositiveIntegerField()
     remaining_quantity = models.PositiveIntegerField(blank=True, null=True)
-    referral_token = models.CharField(max_length=255, unique=True)
-    created_at = models.DateTimeField(default=timezone.now)
+    # Signed (see app.tokens) and filled in on first save when left empty
+    referral_token = models.CharField(max_length=255, unique=True, null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['event', 'category']),
+        ]
 
     def update_remaining(self):
-        """Calculates and saves the remaining seats based on Claims."""
+        """
+        Recalculates and saves the remaining seats from all Claims.
+
+        Claims no longer call this on save (see app.reservations); it is kept
+        for reconciling an allocation whose counter has drifted.
+        """
         # Sum of all quantities in Claim objects linked to this allocation
         total_claimed = self.claims.aggregate(total=models.Sum('quantity'))['total'] or 0
         self.remaining_quantity = self.total_quantity - total_claimed
         self.save()
 
+    def check_capacity(self):
+        """
+        Raises ValidationError if a new or grown allocation doesn't fit in
+        its category or in one of the category's ancestors. Locks their
+        ledger rows (see inventory.lock_zones) until the caller's
+        transaction ends. Bulk writes call lock_zones themselves.
+        """
+        from .inventory import lock_zones
+
+        previous = 0
+        if not self._state.adding and self.pk:
+            previous = SpaceAllocation.objects.filter(pk=self.pk).values_list('total_quantity', flat=True).first() or 0
+        if self.total_quantity <= previous:
+            return
+        zones = lock_zones(self.event_id, self.event.venue_id, [self.category_id])
+        if self.category_id not in zones.lineage:
+            raise ValidationError("The category is not part of the event's venue.")
+        zones.add(self.category_id, self.total_quantity - previous)
+        full = zones.full_zone(self.category_id)
+        if full is not None:
+            raise ValidationError(f"Insufficient seats. Only {zones.available[full]} left in {zones.names[full]}.")
+
     def save(self, *args, **kwargs):
         if self.remaining_quantity is None:
             self.remaining_quantity = self.total_quantity
-        super().save(*args, **kwargs)
+        if not self.referral_token:
+            # NULL until the pk exists; unique allows any number of NULLs
+            self.referral_token = None
+        # The capacity check's locks, the insert and the post_save ledger
+        # update share one transaction, also in autocommit mode. delete()
+        # already runs its signals inside the collector's transaction.
+        with transaction.atomic():
+            self.check_capacity()
+            super().save(*args, **kwargs)
+            if self.referral_token is None:
+                self.referral_token = make_token(self.pk, self.event_id)
+                SpaceAllocation.objects.filter(pk=self.pk).update(referral_token=self.referral_token)
 
     def __str__(self):
         return f"{self.source.name} - {self.category.name}"
 
+# -----------------------------
+# EventInventory
+# -----------------------------
+class EventInventory(models.Model):
+    """
+    Running seat counters for one category at one event.
+
+    Maintained by the SpaceAllocation/Claim signals (see app.inventory) so
+    capacity checks and dashboards read one row instead of aggregating.
+    """
+    event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='inventory')
+    category = models.ForeignKey(SpaceCategory, on_delete=models.CASCADE, related_name='inventory')
+    capacity = models.PositiveIntegerField(default=0)   # Category seats
+    allocated = models.PositiveIntegerField(default=0)  # Sum of SpaceAllocation.total_quantity
+    claimed = models.PositiveIntegerField(default=0)    # Sum of Claim.quantity
+
+    class Meta:
+        unique_together = ('event', 'category')
+        verbose_name_plural = "Event inventory"
+        # Per-row backstops for any write path (signal, bulk import, admin).
+        # They can't see a subtree: a tier overbooked through its blocks is
+        # refused by the locked check in SpaceAllocation.save() and
+        # allocate_bulk (see inventory.lock_zones)
+        constraints = [
+            models.CheckConstraint(
+                condition=models.Q(allocated__lte=models.F('capacity')),
+                name='inventory_allocated_within_capacity',
+            ),
+            models.CheckConstraint(
+                condition=models.Q(claimed__lte=models.F('allocated')),
+                name='inventory_claimed_within_allocated',
+            ),
+        ]
+
+    @property
+    def available(self):
+        return self.capacity - self.allocated
+
+    def __str__(self):
+        return f"{self.event.name} - {self.category.name} ({self.available}/{self.capacity} available)"
+
 # -----------------------------
 # Claim
 # -----------------------------
@@ -154,13 +349,105 @@ class Claim(models.Model):
     quantity = models.PositiveIntegerField()
     claimed_at = models.DateTimeField(default=timezone.now)
 
-    def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
-        # This now works because we added the method above!
-        self.allocation.update_remaining()
+    # Seats are taken from `allocation.remaining_quantity` by
+    # app.reservations.reserve_seats, not here.
+
+    class Meta:
+        constraints = [
+            models.CheckConstraint(condition=models.Q(quantity__gte=1), name='claim_quantity_positive'),
+        ]
+
+
+# -----------------------------
+# Gate sync log
+# -----------------------------
+class ClaimChange(models.Model):
+    """
+    Append-only log of claim and token (allocation) writes per event; the
+    pk is the sequence number gate devices sync from (see app.gate). Ids
+    are stored plainly so removals outlive the claim or allocation row.
+    Token changes have claim_id 0 and carry the allocation's remaining
+    seats as `quantity`.
+    """
+    UPSERT = 1
+    REMOVE = 2
+    UPSERT_TOKEN = 3
+    REMOVE_TOKEN = 4
+    ACTION_CHOICES = (
+        (UPSERT, 'Upsert'), (REMOVE, 'Remove'), (UPSERT_TOKEN, 'Upsert token'), (REMOVE_TOKEN, 'Remove token'),
+    )
+
+    event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='claim_changes')
+    claim_id = models.PositiveIntegerField()
+    allocation_id = models.PositiveIntegerField()
+    quantity = models.PositiveIntegerField()
+    action = models.PositiveSmallIntegerField(choices=ACTION_CHOICES)
+    # Insert time; bounds the window deltas re-send (see gate.build_delta)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['event', 'id']),
+        ]
+
 
+# -----------------------------
+# Claim rollups
+# -----------------------------
+class ClaimRollup(models.Model):
+    """
+    Net claims and seats per time bucket and (event, category, source),
+    kept at minute, hour and day level by app.rollups as claims are
+    written, so fill-rate history never scans the claims table. `bucket`
+    is the bucket's start in UTC.
+    """
+    MINUTE = 1
+    HOUR = 2
+    DAY = 3
+    LEVEL_CHOICES = ((MINUTE, 'Minute'), (HOUR, 'Hour'), (DAY, 'Day'))
 
+    event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='claim_rollups')
+    level = models.PositiveSmallIntegerField(choices=LEVEL_CHOICES)
+    bucket = models.DateTimeField()
+    category = models.ForeignKey(SpaceCategory, on_delete=models.CASCADE, related_name='+')
+    source = models.ForeignKey(AllocationSource, on_delete=models.CASCADE, related_name='+')
+    # Net of removals, so either may go down
+    claims = models.IntegerField(default=0)
+    seats = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # Also the index behind fill-rate reads: event, level, then time
+            models.UniqueConstraint(
+                fields=['event', 'level', 'bucket', 'category', 'source'],
+                name='claim_rollup_bucket',
+            ),
+        ]
 
 
+# -----------------------------
+# Idempotency keys
+# -----------------------------
+class IdempotencyKey(models.Model):
+    """
+    First response to a POST sent with an Idempotency-Key (see
+    app.idempotency), replayed to retries until `expires_at`. A row
+    without a status is a request still in progress.
+    """
+    # sha256 of the endpoint path and the caller's identity
+    scope = models.CharField(max_length=64)
+    key = models.CharField(max_length=255)
+    # sha256 of the request, so a key reused for another request is refused
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    content_type = models.CharField(max_length=255, blank=True)
+    location = models.CharField(max_length=2048, blank=True)
+    body = models.BinaryField(default=b'')
+    created_at = models.DateTimeField(default=timezone.now)
+    expires_at = models.DateTimeField(db_index=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'key'], name='idempotency_key_scope'),
+        ]
 
@@ -0,0 +1,72 @@
+# app/replicas.py
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+# -----------------------------
+# Per-request routing state
+# -----------------------------
+class RoutingState:
+    def __init__(self, replica_reads):
+        # Set by ReplicaRoutingMiddleware: safe method and not pinned
+        self.replica_reads = replica_reads
+        # Set by the router on the first write; later reads use the primary
+        self.wrote = False
+
+
+# A mutable object rather than flags, so writes made in sync_to_async
+# threads are seen by the request that spawned them
+_state = ContextVar('replica_routing', default=None)
+
+
+def routing_state():
+    return _state.get()
+
+
+@contextmanager
+def routing(replica_reads):
+    state = RoutingState(replica_reads)
+    token = _state.set(state)
+    try:
+        yield state
+    finally:
+        _state.reset(token)
+
+
+# -----------------------------
+# Router
+# -----------------------------
+class PrimaryReplicaRouter:
+    """
+    Sends reads to a random DATABASE_REPLICAS alias only inside a request
+    marked replica_reads, until that request writes, and never while the
+    primary has a transaction open in this thread. Everything else
+    (commands, signals outside requests, writes) uses the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        replicas = getattr(settings, 'DATABASE_REPLICAS', [])
+        if state is None or not state.replica_reads or state.wrote or not replicas:
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive the schema through replication
+        return db == DEFAULT_DB_ALIAS
@@ -0,0 +1,61 @@
+# app/reservations.py
+from dataclasses import dataclass
+from typing import Optional
+
+from django.db import transaction
+from django.db.models import F
+
+from .models import SpaceAllocation, Claim
+
+
+# -----------------------------
+# Reservation result
+# -----------------------------
+@dataclass
+class Reservation:
+    allocation_id: int
+    requested: int
+    reserved: int = 0
+    remaining: Optional[int] = None
+    claim: Optional[Claim] = None
+
+    @property
+    def sold_out(self):
+        return self.reserved == 0
+
+
+# -----------------------------
+# Reservation engine
+# -----------------------------
+def reserve_seats(allocation_id, quantity, claimant_name, department=''):
+    """
+    Reserves `quantity` seats on an allocation and records the Claim.
+
+    The seats are taken with a single conditional UPDATE, so two concurrent
+    callers can never both pass the availability check. When the allocation
+    cannot cover the request nothing is written and the returned
+    Reservation is sold out (`remaining` is None if the allocation is gone).
+    """
+    if quantity < 1:
+        raise ValueError("Quantity must be at least 1.")
+
+    with transaction.atomic():
+        taken = SpaceAllocation.objects.filter(
+            pk=allocation_id,
+            remaining_quantity__gte=quantity,
+        ).update(remaining_quantity=F('remaining_quantity') - quantity)
+
+        if not taken:
+            remaining = SpaceAllocation.objects.filter(
+                pk=allocation_id
+            ).values_list('remaining_quantity', flat=True).first()
+            return Reservation(allocation_id, quantity, remaining=remaining)
+
+        claim = Claim.objects.create(
+            allocation_id=allocation_id,
+            claimant_name=claimant_name,
+            department=department,
+            quantity=quantity,
+        )
+
+    return Reservation(allocation_id, quantity, reserved=quantity, claim=claim)
@@ -0,0 +1,148 @@
+# app/rollups.py
+from collections import defaultdict
+from datetime import timezone as dt_timezone
+
+from django.db import connections, router, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDay, TruncHour, TruncMinute
+
+from .models import Claim, ClaimRollup
+
+LEVELS = {'minute': ClaimRollup.MINUTE, 'hour': ClaimRollup.HOUR, 'day': ClaimRollup.DAY}
+
+CHUNK_SIZE = 100
+
+
+# -----------------------------
+# Buckets
+# -----------------------------
+def bucket_start(when, level):
+    when = when.astimezone(dt_timezone.utc).replace(second=0, microsecond=0)
+    if level >= ClaimRollup.HOUR:
+        when = when.replace(minute=0)
+    if level >= ClaimRollup.DAY:
+        when = when.replace(hour=0)
+    return when
+
+
+# -----------------------------
+# Incremental updates (called from app.signals / app.claim_import)
+# -----------------------------
+def record_claims(changes):
+    """
+    Adds `changes`, an iterable of (event_id, category_id, source_id,
+    when, claims, seats), to every level's bucket in one upsert, inside
+    the caller's transaction (so a rolled back claim never counts).
+    """
+    totals = defaultdict(lambda: [0, 0])
+    for event_id, category_id, source_id, when, claims, seats in changes:
+        for level in LEVELS.values():
+            key = (event_id, level, bucket_start(when, level), category_id, source_id)
+            totals[key][0] += claims
+            totals[key][1] += seats
+    if not totals:
+        return
+
+    connection = connections[router.db_for_write(ClaimRollup)]
+    table = connection.ops.quote_name(ClaimRollup._meta.db_table)
+    columns = ['event_id', 'level', 'bucket', 'category_id', 'source_id', 'claims', 'seats']
+    rows = [
+        (event_id, level, connection.ops.adapt_datetimefield_value(bucket), category_id, source_id, claims, seats)
+        for (event_id, level, bucket, category_id, source_id), (claims, seats) in totals.items()
+    ]
+    # INSERT ... ON CONFLICT DO UPDATE (PostgreSQL and SQLite) adds to the
+    # bucket in a single statement; the ORM's update_conflicts can only overwrite
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), CHUNK_SIZE):
+            chunk = rows[start:start + CHUNK_SIZE]
+            cursor.execute(
+                f"INSERT INTO {table} ({', '.join(columns)}) VALUES "
+                + ', '.join(['(' + ', '.join(['%s'] * len(columns)) + ')'] * len(chunk))
+                + f" ON CONFLICT (event_id, level, bucket, category_id, source_id) DO UPDATE SET"
+                f" claims = {table}.claims + excluded.claims, seats = {table}.seats + excluded.seats",
+                [value for row in chunk for value in row],
+            )
+
+
+# -----------------------------
+# Backfill
+# -----------------------------
+@transaction.atomic
+def rebuild_rollups(event_ids=None):
+    """
+    Recomputes the rollups from Claim with one grouped aggregate per
+    level, bucketed by claimed_at. Removals are not kept by the claims
+    table, so rebuilt history shows live claims only. Returns rows written.
+    """
+    claims = Claim.objects.all()
+    rollups = ClaimRollup.objects.all()
+    if event_ids is not None:
+        claims = claims.filter(allocation__event_id__in=event_ids)
+        rollups = rollups.filter(event_id__in=event_ids)
+    rollups.delete()
+
+    truncs = {ClaimRollup.MINUTE: TruncMinute, ClaimRollup.HOUR: TruncHour, ClaimRollup.DAY: TruncDay}
+    rows = []
+    for level, trunc in truncs.items():
+        grouped = claims.values(
+            event_id=F('allocation__event_id'),
+            category_id=F('allocation__category_id'),
+            source_id=F('allocation__source_id'),
+            bucket=trunc('claimed_at', tzinfo=dt_timezone.utc),
+        ).annotate(claim_count=Count('id'), seat_count=Sum('quantity')).order_by()
+        rows.extend(
+            ClaimRollup(
+                event_id=row['event_id'], level=level, bucket=row['bucket'],
+                category_id=row['category_id'], source_id=row['source_id'],
+                claims=row['claim_count'], seats=row['seat_count'],
+            )
+            for row in grouped
+        )
+    ClaimRollup.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+# -----------------------------
+# Fill-rate curves
+# -----------------------------
+def fill_rate(event_id, level=ClaimRollup.MINUTE, by='category', category=None, source_id=None):
+    """
+    Claim-rate curves for an event from its rollups, in one query on the
+    (event, level, bucket) index. `by` groups the series per 'category',
+    'source' or 'zone' (category and source) or sums them into one
+    'event' series; `category` (a SpaceCategory) keeps its subtree only.
+    Each point carries the bucket's claims and seats and the running
+    seat total.
+    """
+    rows = ClaimRollup.objects.filter(event_id=event_id, level=level)
+    if category is not None:
+        rows = rows.filter(category__path__startswith=category.path)
+    if source_id is not None:
+        rows = rows.filter(source_id=source_id)
+
+    keys = {
+        'category': ('category_id',),
+        'source': ('source_id',),
+        'zone': ('category_id', 'source_id'),
+        'event': (),
+    }[by]
+    series = {}
+    for row in rows.order_by('bucket').values('bucket', 'category_id', 'source_id', 'claims', 'seats'):
+        key = tuple(row[k] for k in keys)
+        entry = series.get(key)
+        if entry is None:
+            entry = series[key] = {
+                **{k.removesuffix('_id'): row[k] for k in keys}, 'total_seats': 0, 'points': [],
+            }
+        entry['total_seats'] += row['seats']
+        points = entry['points']
+        if points and points[-1]['bucket'] == row['bucket']:
+            points[-1]['claims'] += row['claims']
+            points[-1]['seats'] += row['seats']
+            points[-1]['total_seats'] = entry['total_seats']
+        else:
+            points.append({
+                'bucket': row['bucket'], 'claims': row['claims'],
+                'seats': row['seats'], 'total_seats': entry['total_seats'],
+            })
+    return [series[key] for key in sorted(series)]
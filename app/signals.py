@@ -15,3 +15,112 @@ def create_default_superuser(sender, **kwargs):
             
         )
         print("Default superuser 'admin' created with password 'admin123'.")
+
+
+# -----------------------------
+# Inventory ledger
+# -----------------------------
+from django.db.models import QuerySet
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.utils import timezone
+from .models import Venue, SpaceCategory, Event, AllocationSource, SpaceAllocation, Claim, ClaimChange
+from . import inventory, gate, rollups
+from .dashboard import invalidate_event_grid
+from .live import publish_inventory_delta
+
+
+@receiver(pre_save, sender=SpaceAllocation)
+def remember_allocation_quantity(sender, instance, **kwargs):
+    instance._previous_quantity = None
+    if not instance._state.adding and instance.pk:
+        instance._previous_quantity = SpaceAllocation.objects.filter(
+            pk=instance.pk
+        ).values_list('total_quantity', flat=True).first()
+
+
+@receiver(post_save, sender=SpaceAllocation)
+def allocation_saved(sender, instance, created, **kwargs):
+    invalidate_event_grid(instance.event_id)
+    # New token or changed seats: gate manifests (ETag and deltas) move on
+    gate.record_token_change(instance)
+    previous = 0 if created else getattr(instance, '_previous_quantity', None)
+    if previous is None:
+        return
+    delta = instance.total_quantity - previous
+    if delta:
+        inventory.record_allocation(instance.event_id, instance.category_id, delta)
+        publish_inventory_delta(instance.event_id, instance.category_id, allocated=delta)
+
+
+@receiver(post_delete, sender=SpaceAllocation)
+def allocation_deleted(sender, instance, origin=None, **kwargs):
+    invalidate_event_grid(instance.event_id)
+    inventory.record_allocation(instance.event_id, instance.category_id, -instance.total_quantity)
+    publish_inventory_delta(instance.event_id, instance.category_id, allocated=-instance.total_quantity)
+    # The event's (or venue's) gate log is being deleted with it
+    if not deleting(origin, Event, Venue):
+        gate.record_token_change(instance, ClaimChange.REMOVE_TOKEN)
+
+
+def deleting(origin, *models):
+    """Whether a cascade started from deleting one of `models` (post_delete's `origin`)."""
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return issubclass(model, models)
+
+
+def claim_changed(claim, quantity, action, when=None, rollup=True):
+    zone = SpaceAllocation.objects.filter(
+        pk=claim.allocation_id
+    ).values_list('event_id', 'category_id', 'source_id').first()
+    if zone:
+        event_id, category_id, source_id = zone
+        invalidate_event_grid(event_id)
+        gate.record_claim_change(event_id, claim, action)
+        if quantity:
+            publish_inventory_delta(event_id, category_id, claimed=quantity)
+            if rollup:
+                claims = 1 if quantity > 0 else -1
+                rollups.record_claims([(event_id, category_id, source_id, when or timezone.now(), claims, quantity)])
+
+
+@receiver(post_save, sender=Claim)
+def claim_saved(sender, instance, created, **kwargs):
+    if created:
+        inventory.record_claim(instance.allocation_id, instance.quantity)
+    claim_changed(instance, instance.quantity if created else 0, ClaimChange.UPSERT, when=instance.claimed_at)
+
+
+@receiver(post_delete, sender=Claim)
+def claim_deleted(sender, instance, origin=None, **kwargs):
+    inventory.record_claim(instance.allocation_id, -instance.quantity)
+    # The event's (or venue's) gate log and rollups are being deleted with it
+    if deleting(origin, Event, Venue):
+        return
+    # Rollups of a deleted category or source go with it; a removal counts
+    # when it happens, so running totals track occupancy
+    claim_changed(
+        instance, -instance.quantity, ClaimChange.REMOVE,
+        rollup=not deleting(origin, SpaceCategory, AllocationSource),
+    )
+
+
+@receiver(post_save, sender=SpaceCategory)
+def category_saved(sender, instance, created, **kwargs):
+    Venue.touch_layout(instance.venue_id)
+    # A new node has no path (or ledger rows) yet; its ancestors still change
+    if created:
+        if instance.parent_id:
+            inventory.sync_capacity(instance.parent)
+    else:
+        inventory.sync_capacity(instance)
+
+
+@receiver(post_delete, sender=SpaceCategory)
+def category_deleted(sender, instance, origin=None, **kwargs):
+    # Queryset deletes (save_space_tree) refresh capacity and the layout
+    # version once for the whole batch; a deleted venue takes both with it
+    if isinstance(origin, QuerySet) or deleting(origin, Venue):
+        return
+    Venue.touch_layout(instance.venue_id)
+    if instance.path:
+        inventory.sync_capacity(instance, include_self=False)
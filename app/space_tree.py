@@ -0,0 +1,193 @@
+# app/space_tree.py
+from collections import defaultdict
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+
+from .models import Venue, SpaceCategory
+from .inventory import sync_venue_capacity
+from .capacity import venue_event_violations
+
+
+# -----------------------------
+# Node formats
+# -----------------------------
+def api_node(category, parent, is_leaf):
+    """Same shape as SpaceCategorySerializer."""
+    return {
+        'id': category.id,
+        'venue': category.venue_id,
+        'parent': category.parent_id,
+        'name': category.name,
+        'category_type': category.category_type,
+        'ticket_tier': category.ticket_tier,
+        'seats_count': category.seats_count,
+        'is_leaf': is_leaf,
+        'display_name': f"{parent.name} → {category.name}" if parent else category.name,
+    }
+
+
+def hierarchy_node(category, parent, is_leaf):
+    """Shape used by the venue layout editor (see venues.html)."""
+    return {
+        'id': category.id,
+        'name': category.name,
+        'type': category.category_type,
+        'seats': category.seats_count,
+    }
+
+
+# -----------------------------
+# Builder
+# -----------------------------
+def build_space_tree(categories, node=api_node):
+    """
+    Assembles a nested tree from a flat list of a venue's categories.
+
+    No queries are issued here: pass rows already fetched in one go
+    (a filtered queryset or a prefetched `venue.spaces.all()`). Siblings
+    keep the order of `categories`.
+    """
+    categories = list(categories)
+    by_id = {c.id: c for c in categories}
+    children = defaultdict(list)
+    for c in categories:
+        children[c.parent_id].append(c)
+
+    def build(category):
+        kids = children.get(category.id, [])
+        data = node(category, by_id.get(category.parent_id), not kids)
+        data['children'] = [build(kid) for kid in kids]
+        return data
+
+    return [build(root) for root in children[None]]
+
+
+def venue_space_tree(venue_id, node=api_node):
+    """Fetches a venue's categories in one query and returns the nested tree."""
+    categories = SpaceCategory.objects.filter(venue_id=venue_id).order_by('id')
+    return build_space_tree(categories, node)
+
+
+# -----------------------------
+# Posted node fields
+# -----------------------------
+def api_fields(node):
+    """Maps a node posted to VenueSpaceTreeAPI onto SpaceCategory fields."""
+    return {
+        'name': node['name'],
+        'category_type': node.get('category_type') or '',
+        'ticket_tier': node.get('ticket_tier') or '',
+        'seats_count': node.get('seats_count') or 0,
+    }
+
+
+def hierarchy_fields(node):
+    """Maps a node posted by the venue layout editor onto SpaceCategory fields."""
+    return {
+        'name': node['name'],
+        'category_type': node.get('type') or '',
+        'seats_count': node.get('seats') or 0,
+    }
+
+
+# -----------------------------
+# Diff-based save
+# -----------------------------
+@transaction.atomic
+def save_space_tree(venue, hierarchy, fields=api_fields):
+    """
+    Brings a venue's stored categories in line with a posted tree.
+
+    Posted nodes carrying the `id` of one of the venue's categories update
+    that row in place; nodes without a known id are inserted, level by
+    level, with bulk_create; stored categories missing from the tree are
+    deleted. Untouched rows (and their allocations) are left alone.
+    Returns counts of created/updated (edited or moved)/deleted/unchanged
+    nodes; raises
+    ValidationError (and writes nothing) if the new layout leaves less room
+    than an event has already allocated.
+    """
+    existing = {c.id: c for c in SpaceCategory.objects.filter(venue=venue)}
+    stored_parents = {pk: c.parent_id for pk, c in existing.items()}
+
+    # Flatten the posted tree into levels of (category, parent category)
+    levels = []
+    seen = set()
+    changed = set()
+    field_names = set()
+    level = [(node, None) for node in hierarchy]
+    while level:
+        planned = []
+        next_level = []
+        for node, parent in level:
+            node_id = node.get('id')
+            category = existing.get(node_id) if node_id not in seen else None
+            if category is None:
+                category = SpaceCategory(venue=venue)
+            else:
+                seen.add(node_id)
+            for field, value in fields(node).items():
+                field_names.add(field)
+                if getattr(category, field) != value:
+                    setattr(category, field, value)
+                    changed.add(category.id)
+            planned.append((category, parent))
+            next_level.extend((child, category) for child in node.get('children') or [])
+        levels.append(planned)
+        level = next_level
+
+    # Detach kept nodes from deleted parents so the delete can't cascade into them
+    deleted = set(existing) - seen
+    if deleted:
+        SpaceCategory.objects.filter(pk__in=seen, parent_id__in=deleted).update(parent=None)
+        SpaceCategory.objects.filter(pk__in=deleted).delete()
+
+    kept = [existing[pk] for pk in changed if pk in seen]
+    if kept:
+        SpaceCategory.objects.bulk_update(kept, sorted(field_names), batch_size=500)
+
+    created = 0
+    for planned in levels:
+        new = []
+        for category, parent in planned:
+            category.parent_id = parent.id if parent else None
+            if category.pk is None:
+                new.append(category)
+        if new:
+            SpaceCategory.objects.bulk_create(new, batch_size=500)
+            created += len(new)
+
+    # Paths are computed top-down from the parents' new paths (a new child
+    # of a moved node must not inherit its stored one), then new rows and
+    # moved rows are written in one bulk_update
+    indexed = []
+    for depth, planned in enumerate(levels):
+        for category, parent in planned:
+            path = f"{parent.path if parent else '/'}{category.pk}/"
+            is_new = category.pk not in stored_parents
+            if is_new or category.path != path or stored_parents[category.pk] != category.parent_id:
+                category.path = path
+                category.depth = depth
+                indexed.append(category)
+    SpaceCategory.objects.bulk_update(indexed, ['parent', 'path', 'depth'], batch_size=500)
+    moved = {category.pk for category in indexed if category.pk in stored_parents}
+    updated = moved | {category.pk for category in kept}
+
+    # Bulk writes (and the queryset delete) skip the per-row signal work,
+    # so refresh ledger capacities and the layout version (ETags) here
+    if updated or created or deleted:
+        try:
+            with transaction.atomic():
+                sync_venue_capacity(venue.id)
+        except IntegrityError:
+            # The ledger's CHECK refused a capacity below what is allocated
+            raise ValidationError([v.message for v in venue_event_violations(venue.id)])
+        Venue.touch_layout(venue.id)
+
+    return {
+        'created': created,
+        'updated': len(updated),
+        'deleted': len(deleted),
+        'unchanged': len(seen) - len(updated),
+    }
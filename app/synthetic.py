@@ -0,0 +1,195 @@
+# app/synthetic.py
+import random
+from datetime import timedelta
+
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import Venue, SpaceCategory, Event, AllocationSource, SpaceAllocation, Claim
+from .inventory import rebuild_inventory
+from .rollups import rebuild_rollups
+from .space_tree import save_space_tree
+from .tokens import make_token
+
+FIRST_NAMES = ['Aisha', 'Ben', 'Chen', 'Dara', 'Elif', 'Femi', 'Goran', 'Hana', 'Ivan', 'Jana',
+               'Kofi', 'Lena', 'Mateo', 'Nia', 'Omar', 'Priya', 'Quinn', 'Rosa', 'Sami', 'Tomas']
+LAST_NAMES = ['Ahmed', 'Brown', 'Costa', 'Dubois', 'Eze', 'Fischer', 'Garcia', 'Haddad', 'Ito',
+              'Jensen', 'Khan', 'Lopez', 'Muller', 'Novak', 'Okafor', 'Park', 'Rossi', 'Silva']
+DEPARTMENTS = ['Sales', 'Marketing', 'Operations', 'Finance', 'Hospitality', 'Media', '']
+SOURCES = ['Sponsor', 'Club Members', 'Press', 'Hospitality', 'Staff', 'Partners', 'Community']
+
+
+# -----------------------------
+# Building blocks
+# -----------------------------
+def venue_hierarchy(rng, tiers, blocks, sections):
+    """Tier → Block → Section tree; only sections hold seats."""
+    return [
+        {
+            'name': f"Tier {t}",
+            'category_type': 'Tier',
+            'ticket_tier': rng.choice(['VVIP', 'VIP', 'Regular']),
+            'children': [
+                {
+                    'name': f"T{t} Block {b}",
+                    'category_type': 'Block',
+                    'children': [
+                        {
+                            'name': f"T{t} B{b} Section {s}",
+                            'category_type': 'Section',
+                            'seats_count': rng.randint(50, 400),
+                        }
+                        for s in range(1, sections + 1)
+                    ],
+                }
+                for b in range(1, blocks + 1)
+            ],
+        }
+        for t in range(1, tiers + 1)
+    ]
+
+
+def next_id(model):
+    return (model.objects.aggregate(top=Max('pk'))['top'] or 0) + 1
+
+
+class Batch:
+    """Buffers model instances and bulk_creates them `size` at a time."""
+
+    def __init__(self, model, size):
+        self.model = model
+        self.size = size
+        self.rows = []
+        self.written = 0
+
+    def add(self, obj):
+        self.rows.append(obj)
+        if len(self.rows) >= self.size:
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            self.model.objects.bulk_create(self.rows, batch_size=self.size)
+            self.written += len(self.rows)
+            self.rows = []
+
+
+# -----------------------------
+# Generator
+# -----------------------------
+def generate_dataset(venues=2, tiers=4, blocks=25, sections=40, events=100, sources=5,
+                     allocations=200, claims=10, seed=0, batch_size=5000, log=None):
+    """
+    Writes a synthetic dataset and returns row counts.
+
+    Each venue gets tiers * blocks * sections leaf sections (plus their
+    tiers and blocks); events are spread over the venues. Every event
+    gets up to `allocations` allocations on distinct sections, each with
+    up to `claims` claims. Rows are bulk-inserted with precomputed
+    primary keys (so signed tokens can be set up front), and the ledger
+    and claim rollups are rebuilt at the end.
+    """
+    rng = random.Random(seed)
+    log = log or (lambda message: None)
+    now = timezone.now()
+
+    venue_leaves = {}
+    for v in range(venues):
+        venue = Venue.objects.create(
+            name=f"Synthetic Arena {next_id(Venue)}",
+            venue_type=rng.choice(['Indoor', 'Outdoor', 'Hybrid']),
+            total_capacity=tiers * blocks * sections * 400,
+        )
+        save_space_tree(venue, venue_hierarchy(rng, tiers, blocks, sections))
+        venue_leaves[venue.id] = list(
+            SpaceCategory.objects.filter(venue=venue).leaves().values_list('id', 'seats_count')
+        )
+        log(f"Venue {venue.name}: {len(venue_leaves[venue.id])} sections")
+
+    venue_ids = list(venue_leaves)
+    event_rows = []
+    for e in range(events):
+        start = now + timedelta(days=rng.randint(-60, 120), hours=rng.randint(10, 20))
+        event_rows.append(Event(
+            name=f"Synthetic Match {e + 1}",
+            venue_id=venue_ids[e % len(venue_ids)],
+            start_datetime=start,
+            end_datetime=start + timedelta(hours=3),
+        ))
+    # SQLite and PostgreSQL return the new pks from bulk_create
+    created_events = Event.objects.bulk_create(event_rows, batch_size=batch_size)
+
+    allocation_id = next_id(SpaceAllocation)
+    claim_id = next_id(Claim)
+    allocation_batch = Batch(SpaceAllocation, batch_size)
+    claim_batch = Batch(Claim, batch_size)
+
+    for number, event in enumerate(created_events, start=1):
+        with transaction.atomic():
+            leaves = venue_leaves[event.venue_id]
+            event_sources = AllocationSource.objects.bulk_create([
+                AllocationSource(
+                    name=name, event=event, venue_id=event.venue_id,
+                    ticket_category_id=rng.choice(leaves)[0],
+                )
+                for name in rng.sample(SOURCES, min(sources, len(SOURCES)))
+            ])
+
+            for category_id, seats in rng.sample(leaves, min(allocations, len(leaves))):
+                total = rng.randint(1, max(1, seats // 2))
+                created_at = event.start_datetime - timedelta(days=rng.randint(7, 60))
+                remaining = total
+                for _ in range(rng.randint(0, claims)):
+                    if remaining == 0:
+                        break
+                    quantity = rng.randint(1, min(4, remaining))
+                    remaining -= quantity
+                    claim_batch.add(Claim(
+                        pk=claim_id,
+                        allocation_id=allocation_id,
+                        claimant_name=f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+                        department=rng.choice(DEPARTMENTS),
+                        quantity=quantity,
+                        claimed_at=created_at + timedelta(minutes=rng.randint(1, 60 * 24 * 7)),
+                    ))
+                    claim_id += 1
+
+                allocation_batch.add(SpaceAllocation(
+                    pk=allocation_id,
+                    event=event,
+                    source=rng.choice(event_sources),
+                    category_id=category_id,
+                    total_quantity=total,
+                    remaining_quantity=remaining,
+                    referral_token=make_token(allocation_id, event.id),
+                    created_at=created_at,
+                ))
+                allocation_id += 1
+
+            # Claims reference allocations, so allocations go first
+            allocation_batch.flush()
+            claim_batch.flush()
+
+        if number % 10 == 0 or number == len(created_events):
+            log(f"Events {number}/{len(created_events)}: "
+                f"{allocation_batch.written} allocations, {claim_batch.written} claims")
+
+    # Explicit pks bypass the sequences on PostgreSQL; move them past our ids
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(no_style(), [SpaceAllocation, Claim]):
+            cursor.execute(sql)
+
+    ledger_rows = rebuild_inventory([event.id for event in created_events])
+    rollup_rows = rebuild_rollups([event.id for event in created_events])
+
+    return {
+        'venues': venues,
+        'categories': SpaceCategory.objects.filter(venue_id__in=venue_ids).count(),
+        'events': len(created_events),
+        'allocations': allocation_batch.written,
+        'claims': claim_batch.written,
+        'inventory_rows': ledger_rows,
+        'rollup_rows': rollup_rows,
+    }
@@ -1,3 +1,1230 @@
-from django.test import TestCase
+import asyncio
+import json
+import threading
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import skipUnless
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.exceptions import ValidationError
+from django.db import connection, IntegrityError, OperationalError
+from django.db.models import F
+from django.conf import settings
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .models import (
+    CustomUser, Venue, SpaceCategory, Event, AllocationSource, SpaceAllocation, Claim, EventInventory, ClaimRollup,
+    ClaimChange, IdempotencyKey,
+)
+from .reservations import reserve_seats
+from .claim_import import ImportFileError, import_claims, iter_rows
+from .space_tree import venue_space_tree, save_space_tree
+from .capacity import event_violations
+from .dashboard import get_event_grid, compute_event_grid, grid_cache_key, grid_version
+from .live import InProcessBroker, get_broker, event_channel
+from .tokens import InvalidToken, make_token, read_token
+from . import gate
+from .benchmark import run_benchmarks, measure_throughput
+from .rollups import rebuild_rollups
+from .bulk_allocation import allocate_bulk
+from .idempotency import purge_expired, release
+from .replicas import PrimaryReplicaRouter, routing, routing_state
+from .middleware import ReplicaRoutingMiddleware
+from .throttling import Bucket, take
+from .checks import check_throttle_cache, check_throttle_cache_deploy
+from .api.serializers import SpaceCategorySerializer
+
+
+def make_allocation(total_quantity=10, token='REF-TEST'):
+    venue = Venue.objects.create(name='Main Stadium', venue_type='Outdoor', total_capacity=1000)
+    category = SpaceCategory.objects.create(venue=venue, name='Block A', seats_count=100)
+    start = timezone.now()
+    event = Event.objects.create(
+        name='Final', venue=venue,
+        start_datetime=start, end_datetime=start + timedelta(hours=3)
+    )
+    source = AllocationSource.objects.create(
+        name='Sponsor', event=event, venue=venue, ticket_category=category
+    )
+    return SpaceAllocation.objects.create(
+        event=event, source=source, category=category,
+        total_quantity=total_quantity, referral_token=token
+    )
+
+
+class ReserveSeatsTests(TestCase):
+    def setUp(self):
+        self.allocation = make_allocation(total_quantity=5)
+
+    def test_reserves_and_decrements_remaining(self):
+        reservation = reserve_seats(self.allocation.id, 3, 'Alice')
+
+        self.assertFalse(reservation.sold_out)
+        self.assertEqual(reservation.reserved, 3)
+        self.assertEqual(reservation.claim.quantity, 3)
+        self.allocation.refresh_from_db()
+        self.assertEqual(self.allocation.remaining_quantity, 2)
+
+    def test_sold_out_writes_nothing(self):
+        reserve_seats(self.allocation.id, 4, 'Alice')
+        reservation = reserve_seats(self.allocation.id, 2, 'Bob')
+
+        self.assertTrue(reservation.sold_out)
+        self.assertEqual(reservation.remaining, 1)
+        self.assertEqual(Claim.objects.count(), 1)
+
+    def test_claim_api(self):
+        client = APIClient()
+        payload = {'allocation': self.allocation.id, 'claimant_name': 'Alice', 'quantity': 5}
+
+        response = client.post('/api/claims/', payload, format='json')
+        self.assertEqual(response.status_code, 201)
+
+        response = client.post('/api/claims/', payload, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['remaining'], 0)
+
+
+class ReserveSeatsConcurrencyTests(TransactionTestCase):
+    def test_concurrent_reservations_never_oversell(self):
+        allocation = make_allocation(total_quantity=10)
+        barrier = threading.Barrier(25)
+        results = []
+
+        def worker(i):
+            try:
+                barrier.wait()
+                results.append(reserve_seats(allocation.id, 1, f'Guest {i}'))
+            except OperationalError:
+                # SQLite may refuse a writer outright under contention;
+                # that is a failed booking, not an oversell.
+                pass
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(25)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        allocation.refresh_from_db()
+        booked = sum(r.reserved for r in results)
+        claimed = sum(Claim.objects.filter(allocation=allocation).values_list('quantity', flat=True))
+
+        self.assertLessEqual(booked, 10)
+        self.assertEqual(claimed, booked)
+        self.assertEqual(allocation.remaining_quantity, 10 - booked)
+
+
+class InventoryLedgerTests(TestCase):
+    def setUp(self):
+        self.allocation = make_allocation(total_quantity=10)
+
+    def get_inventory(self):
+        return EventInventory.objects.get(
+            event=self.allocation.event, category=self.allocation.category
+        )
+
+    def test_allocation_and_claim_writes_update_counters(self):
+        reserve_seats(self.allocation.id, 4, 'Alice')
+        inventory = self.get_inventory()
+
+        self.assertEqual(inventory.capacity, 100)
+        self.assertEqual(inventory.allocated, 10)
+        self.assertEqual(inventory.claimed, 4)
+        self.assertEqual(inventory.available, 90)
+
+    def test_delete_releases_counters(self):
+        reserve_seats(self.allocation.id, 4, 'Alice')
+        self.allocation.delete()
+        inventory = self.get_inventory()
+
+        self.assertEqual(inventory.allocated, 0)
+        self.assertEqual(inventory.claimed, 0)
+
+    def test_rebuild_matches_incremental_ledger(self):
+        reserve_seats(self.allocation.id, 4, 'Alice')
+        EventInventory.objects.update(allocated=0, claimed=0)
+
+        call_command('rebuild_inventory', stdout=StringIO())
+        inventory = self.get_inventory()
+
+        self.assertEqual(inventory.allocated, 10)
+        self.assertEqual(inventory.claimed, 4)
+
+
+class SpaceTreeTests(TestCase):
+    def setUp(self):
+        self.venue = Venue.objects.create(name='Arena', venue_type='Indoor', total_capacity=1000)
+        for t in range(3):
+            tier = SpaceCategory.objects.create(venue=self.venue, name=f'Tier {t}', category_type='Tier', seats_count=0)
+            for b in range(3):
+                block = SpaceCategory.objects.create(
+                    venue=self.venue, parent=tier, name=f'Block {t}{b}', category_type='Block', seats_count=0
+                )
+                for n in range(3):
+                    SpaceCategory.objects.create(
+                        venue=self.venue, parent=block, name=f'Section {t}{b}{n}',
+                        category_type='Section', seats_count=10
+                    )
+
+    def test_matches_recursive_serializer(self):
+        roots = SpaceCategory.objects.filter(venue=self.venue, parent=None).order_by('id')
+        expected = SpaceCategorySerializer(roots, many=True).data
+
+        self.assertEqual(json.loads(json.dumps(venue_space_tree(self.venue.id))), json.loads(json.dumps(expected)))
+
+    def test_space_tree_endpoints_use_constant_queries(self):
+        client = APIClient()
+        with self.assertNumQueries(2):  # layout version (ETag), categories
+            response = client.get(f'/api/venues/{self.venue.id}/space-tree/')
+        self.assertEqual(len(response.data), 3)
+        self.assertTrue(response.data[0]['children'][0]['children'][0]['is_leaf'])
+
+        Venue.objects.create(name='Hall', venue_type='Indoor', total_capacity=10)
+        with self.assertNumQueries(2):
+            response = client.get('/api/venues/', {'expand': 'space_tree'})
+        self.assertEqual(len(response.data['results'][1]['space_tree']), 3)
+
+    def test_venue_list_defers_space_tree(self):
+        client = APIClient()
+        with self.assertNumQueries(1):
+            response = client.get('/api/venues/', {'fields': 'id,name'})
+        self.assertEqual(response.data['results'], [{'id': self.venue.id, 'name': 'Arena'}])
+
+        with CaptureQueriesContext(connection) as queries:
+            client.get('/api/venues/', {'fields': 'id,name'})
+        self.assertNotIn('total_capacity', queries[0]['sql'])
+
+        response = client.get(f'/api/venues/{self.venue.id}/')
+        self.assertEqual(len(response.data['space_tree']), 3)
+
+
+class HierarchyIndexTests(TestCase):
+    def setUp(self):
+        self.venue = Venue.objects.create(name='Arena', venue_type='Indoor', total_capacity=1000)
+        self.vvip = SpaceCategory.objects.create(venue=self.venue, name='VVIP', seats_count=0)
+        self.block = SpaceCategory.objects.create(venue=self.venue, parent=self.vvip, name='Block A', seats_count=0)
+        self.s1 = SpaceCategory.objects.create(venue=self.venue, parent=self.block, name='S1', seats_count=30)
+        self.s2 = SpaceCategory.objects.create(venue=self.venue, parent=self.block, name='S2', seats_count=20)
+        self.regular = SpaceCategory.objects.create(venue=self.venue, name='Regular', seats_count=100)
+
+    def test_paths_and_queries(self):
+        self.assertEqual(self.s1.path, f'/{self.vvip.id}/{self.block.id}/{self.s1.id}/')
+        self.assertEqual(self.s1.depth, 2)
+        self.assertEqual(set(SpaceCategory.objects.descendants(self.vvip)), {self.block, self.s1, self.s2})
+        self.assertEqual(list(SpaceCategory.objects.ancestors(self.s1)), [self.vvip, self.block])
+        self.assertEqual(SpaceCategory.objects.subtree_seat_total(self.vvip), 50)
+
+    def test_reparenting_moves_subtree(self):
+        self.block.parent = self.regular
+        self.block.save()
+        self.s1.refresh_from_db()
+
+        self.assertEqual(self.s1.path, f'/{self.regular.id}/{self.block.id}/{self.s1.id}/')
+        self.assertEqual(SpaceCategory.objects.subtree_seat_total(self.vvip), 0)
+
+    def test_tier_capacity_follows_subtree(self):
+        start = timezone.now()
+        event = Event.objects.create(
+            name='Final', venue=self.venue, start_datetime=start, end_datetime=start + timedelta(hours=3)
+        )
+        source = AllocationSource.objects.create(name='S', event=event, venue=self.venue, ticket_category=self.vvip)
+        SpaceAllocation.objects.create(
+            event=event, source=source, category=self.vvip, total_quantity=10, referral_token='T'
+        )
+        self.assertEqual(EventInventory.objects.get(category=self.vvip).capacity, 50)
+
+        self.s2.seats_count = 40
+        self.s2.save()
+        self.assertEqual(EventInventory.objects.get(category=self.vvip).capacity, 70)
+
+
+class SaveSpaceTreeTests(TestCase):
+    def setUp(self):
+        self.venue = Venue.objects.create(name='Arena', venue_type='Indoor', total_capacity=1000)
+        save_space_tree(self.venue, [
+            {'name': 'VVIP', 'category_type': 'Tier', 'children': [
+                {'name': 'Block A', 'category_type': 'Block', 'seats_count': 30},
+                {'name': 'Block B', 'category_type': 'Block', 'seats_count': 20},
+            ]},
+            {'name': 'Regular', 'category_type': 'Tier', 'seats_count': 100},
+        ])
+        self.tree = venue_space_tree(self.venue.id)
+
+    def test_unchanged_tree_writes_nothing(self):
+        with self.assertNumQueries(3):  # savepoint, select, release
+            changes = save_space_tree(self.venue, self.tree)
+        self.assertEqual(changes, {'created': 0, 'updated': 0, 'deleted': 0, 'unchanged': 4})
+
+    def test_diff_keeps_ids_and_paths(self):
+        vvip, regular = self.tree
+        block_a, block_b = vvip['children']
+        block_a['seats_count'] = 25
+        # Move Block B under Regular, drop VVIP, add a section
+        regular['children'] = [block_b, {'name': 'Section 1', 'seats_count': 5}]
+        changes = save_space_tree(self.venue, [regular])
+
+        self.assertEqual(changes, {'created': 1, 'updated': 1, 'deleted': 2, 'unchanged': 1})
+        moved = SpaceCategory.objects.get(pk=block_b['id'])
+        self.assertEqual(moved.parent_id, regular['id'])
+        self.assertEqual(moved.path, f"/{regular['id']}/{moved.id}/")
+        self.assertEqual(SpaceCategory.objects.get(name='Section 1').depth, 1)
+        self.assertFalse(SpaceCategory.objects.filter(name='Block A').exists())
+
+    def test_deleting_a_subtree_takes_constant_queries(self):
+        def drop_tier(sections):
+            regular = venue_space_tree(self.venue.id)[-1]
+            save_space_tree(self.venue, [regular, {'name': 'Tier', 'children': [
+                {'name': f'Section {n}', 'seats_count': 1} for n in range(sections)
+            ]}])
+            with CaptureQueriesContext(connection) as queries:
+                changes = save_space_tree(self.venue, [regular])
+            self.assertEqual(changes['deleted'], 1 + sections)
+            return len(queries)
+
+        self.assertEqual(drop_tier(2), drop_tier(40))
+
+    def test_new_child_of_moved_node_gets_new_path(self):
+        vvip, regular = self.tree
+        block_b = vvip['children'].pop()
+        block_b['children'] = [{'name': 'Row 1', 'seats_count': 5}]
+        save_space_tree(self.venue, [vvip, regular, block_b])
+
+        row = SpaceCategory.objects.get(name='Row 1')
+        self.assertEqual(row.path, f"/{block_b['id']}/{row.id}/")
+        self.assertEqual(row.depth, 1)
+        self.assertIn(row, SpaceCategory.objects.descendants(SpaceCategory.objects.get(pk=block_b['id'])))
+
+    def test_api_reports_changes(self):
+        self.tree[1]['seats_count'] = 80
+        response = APIClient().post(f'/api/venues/{self.venue.id}/space-tree/', self.tree, format='json')
+
+        self.assertEqual(response.data['changes']['updated'], 1)
+        self.assertEqual(SpaceCategory.objects.get(name='Regular').seats_count, 80)
+
+
+class ClaimImportTests(TestCase):
+    def setUp(self):
+        self.allocation = make_allocation(total_quantity=5, token='REF-A')
+
+    def test_csv_import_reports_rejected_rows(self):
+        upload = SimpleUploadedFile('guests.csv', (
+            "Claimant Name,Department,Quantity,Referral Token\n"
+            "Alice,Police,2,REF-A\n"
+            "Bob,,x,REF-A\n"
+            "Carol,,2,REF-NOPE\n"
+            "Dan,,2,REF-A\n"
+            "Eve,,2,REF-A\n"
+        ).encode())
+        response = APIClient().post('/api/claims/import/', {'file': upload}, format='multipart')
+
+        self.assertEqual(response.data['imported_rows'], 2)
+        self.assertEqual([e['row'] for e in response.data['errors']], [3, 4, 6])
+        self.allocation.refresh_from_db()
+        self.assertEqual(self.allocation.remaining_quantity, 1)
+        self.assertEqual(EventInventory.objects.get().claimed, 4)
+
+    def test_errors_are_listed_in_row_order(self):
+        rows = [(2, {'referral_token': 'REF-NOPE', 'claimant_name': 'A', 'quantity': 1}),
+                (3, {'referral_token': 'REF-A', 'claimant_name': 'B', 'quantity': 'x'})]
+        self.assertEqual([e['row'] for e in import_claims(rows).errors], [2, 3])
+
+    def test_rows_read_before_a_file_error_are_imported(self):
+        def rows():
+            yield 2, {'referral_token': 'REF-A', 'claimant_name': 'A', 'quantity': 1}
+            yield 3, {'referral_token': 'REF-A', 'claimant_name': 'B', 'quantity': 2}
+            raise ImportFileError("The file is not UTF-8 text (stopped after line 3).")
+
+        report = import_claims(rows(), chunk_size=10)
+        self.assertEqual((report.imported_rows, report.imported_seats), (2, 3))
+        self.assertIn('line 3', report.file_error)
+
+    def test_unreadable_files_are_refused(self):
+        client = APIClient()
+        for name, content in [
+            ('guests.csv', "claimant_name,quantity\nZoë,1\n".encode('latin-1')),
+            ('guests.xlsx', b'not a workbook'),
+        ]:
+            upload = SimpleUploadedFile(name, content)
+            response = client.post('/api/claims/import/', {'file': upload, 'referral_token': 'REF-A'}, format='multipart')
+            self.assertEqual(response.status_code, 400)
+            self.assertTrue(response.data['file_error'])
+        self.assertFalse(Claim.objects.exists())
+
+    def test_xlsx_import_with_default_token(self):
+        from openpyxl import Workbook
+
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet()
+        sheet.append(['claimant_name', 'quantity'])
+        for i in range(5):
+            sheet.append([f'Guest {i}', 1])
+        buffer = BytesIO()
+        workbook.save(buffer)
+        buffer.seek(0)
+
+        report = import_claims(iter_rows(buffer, 'guests.xlsx'), default_token='REF-A', chunk_size=2)
+
+        self.assertEqual(report.imported_rows, 5)
+        self.assertEqual(Claim.objects.count(), 5)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.allocation = make_allocation(total_quantity=5)
+        reserve_seats(self.allocation.id, 2, 'Alice', 'Police')
+        self.client.force_login(get_user_model().objects.create_user('ops', password='pw'))
+
+    def test_claims_csv_streams_joined_rows(self):
+        url = reverse('export_event', args=[self.allocation.event_id, 'claims'])
+        with self.assertNumQueries(5):  # session, user, event, categories, rows
+            response = self.client.get(url)
+            lines = b''.join(response.streaming_content).decode().splitlines()
+
+        self.assertEqual(len(lines), 2)
+        self.assertIn('Alice,Police,2,Sponsor,Block A,Main Stadium,REF-TEST', lines[1])
+
+    def test_allocations_xlsx(self):
+        from openpyxl import load_workbook
+
+        url = reverse('export_event', args=[self.allocation.event_id, 'allocations'])
+        response = self.client.get(url, {'format': 'xlsx'})
+        sheet = load_workbook(BytesIO(b''.join(response.streaming_content))).active
+        rows = list(sheet.values)
+
+        self.assertEqual(rows[1][4:7], (5, 3, 2))
+
+
+class ListPaginationTests(TestCase):
+    def setUp(self):
+        self.allocation = make_allocation(total_quantity=1, token='REF-0')
+        for i in range(1, 5):
+            SpaceAllocation.objects.create(
+                event=self.allocation.event, source=self.allocation.source,
+                category=self.allocation.category, total_quantity=1, referral_token=f'REF-{i}'
+            )
+
+    def test_cursor_pages_cover_every_row_once(self):
+        client = APIClient()
+        tokens = []
+        url = '/api/allocations/?page_size=2'
+        while url:
+            with self.assertNumQueries(1):
+                page = client.get(url).data
+            tokens.extend(row['referral_token'] for row in page['results'])
+            url = page['next']
+
+        self.assertEqual(tokens, ['REF-4', 'REF-3', 'REF-2', 'REF-1', 'REF-0'])
+
+    def test_sparse_allocation_fields(self):
+        with self.assertNumQueries(1):
+            page = APIClient().get('/api/allocations/', {'fields': 'id,event_name,category'}).data
+        row = page['results'][0]
+        self.assertEqual(set(row), {'id', 'event_name', 'category'})
+        self.assertEqual(row['category']['display_name'], 'Block A')
+
+    def test_filters(self):
+        client = APIClient()
+        page = client.get('/api/allocations/', {'event': self.allocation.event_id + 1}).data
+        self.assertEqual(page['results'], [])
+
+        response = client.get('/api/allocations/', {'created_after': 'not-a-date'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.venue = Venue.objects.create(name='Arena', venue_type='Indoor', total_capacity=1000)
+        save_space_tree(self.venue, [{'name': 'VVIP', 'children': [{'name': 'Block A', 'seats_count': 10}]}])
+        self.url = f'/api/venues/{self.venue.id}/space-tree/'
+
+    def test_unchanged_layout_is_304_without_tree_walk(self):
+        client = APIClient()
+        etag = client.get(self.url)['ETag']
+
+        with self.assertNumQueries(1):
+            response = client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_layout_write_changes_etag(self):
+        client = APIClient()
+        etag = client.get(self.url)['ETag']
+        detail_etag = client.get(f'/api/venues/{self.venue.id}/')['ETag']
+        self.assertNotEqual(etag, detail_etag)
+
+        tree = venue_space_tree(self.venue.id)
+        tree[0]['children'][0]['seats_count'] = 20
+        client.post(self.url, tree, format='json')
+
+        response = client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_meta_enums_etag(self):
+        client = APIClient()
+        etag = client.get('/api/meta/enums/')['ETag']
+        with self.assertNumQueries(0):
+            response = client.get('/api/meta/enums/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+
+class EventGridCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.allocation = make_allocation(total_quantity=10)
+        self.event = Event.objects.select_related('venue').get(pk=self.allocation.event_id)
+
+    def grid_row(self):
+        return get_event_grid(self.event)[0]
+
+    def test_cached_grid_needs_no_queries(self):
+        self.assertEqual(self.grid_row()['allocated'], 10)
+        with self.assertNumQueries(0):
+            self.grid_row()
+
+    def test_claims_and_allocations_invalidate(self):
+        self.grid_row()
+        reserve_seats(self.allocation.id, 3, 'Alice')
+        self.assertEqual(self.grid_row()['claimed'], 3)
+
+        self.allocation.total_quantity = 15
+        self.allocation.save()
+        self.assertEqual(self.grid_row()['allocated'], 15)
+
+    def test_late_store_of_an_old_grid_is_not_served(self):
+        stale = compute_event_grid(self.event)
+        key = grid_cache_key(self.event.id, grid_version(self.event.id))
+        with self.captureOnCommitCallbacks(execute=True):
+            reserve_seats(self.allocation.id, 3, 'Alice')
+        # A reader that computed before the claim stores its grid afterwards
+        cache.set(key, (self.event.venue.layout_version, stale))
+        self.assertEqual(self.grid_row()['claimed'], 3)
+
+    def test_layout_change_invalidates(self):
+        self.grid_row()
+        category = self.allocation.category
+        category.seats_count = 150
+        category.save()
+        self.event.venue.refresh_from_db()
+        self.assertEqual(self.grid_row()['total'], 150)
+
+
+class AllocationSourcesPageTests(TestCase):
+    def setUp(self):
+        self.allocation = make_allocation(total_quantity=10)
+        user = get_user_model().objects.create_user('staff', password='pw')
+        self.client.force_login(user)
+
+    def add_allocations(self, count):
+        a = self.allocation
+        SpaceAllocation.objects.bulk_create(
+            SpaceAllocation(event=a.event, source=a.source, category=a.category,
+                            total_quantity=1, remaining_quantity=1, referral_token=f'REF-BULK-{i}')
+            for i in range(count)
+        )
+
+    def test_query_count_is_flat(self):
+        with CaptureQueriesContext(connection) as small:
+            self.client.get('/allocation-sources/')
+        self.add_allocations(120)
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get('/allocation-sources/')
+
+        self.assertEqual(len(small), len(large))
+        self.assertEqual(len(response.context['allocations']), 50)
+
+    def test_zone_remaining_from_ledger_and_event_filter(self):
+        other = make_allocation(total_quantity=4, token='REF-OTHER')
+        response = self.client.get(f'/allocation-sources/?event={self.allocation.event_id}')
+
+        rows = list(response.context['allocations'])
+        self.assertEqual([r.id for r in rows], [self.allocation.id])
+        self.assertEqual(rows[0].zone_remaining, 90)
+        self.assertEqual(rows[0].zone_total, 100)
+        self.assertNotEqual(other.event_id, self.allocation.event_id)
+
+    def test_allocations_count_against_the_whole_tree(self):
+        venue = Venue.objects.create(name='Hall', venue_type='Indoor', total_capacity=100)
+        save_space_tree(venue, [{'name': 'Tier', 'children': [
+            {'name': 'B1', 'seats_count': 50}, {'name': 'B2', 'seats_count': 50},
+        ]}])
+        tier, b1, b2 = SpaceCategory.objects.filter(venue=venue).order_by('id')
+        start = timezone.now()
+        event = Event.objects.create(name='Gig', venue=venue, start_datetime=start, end_datetime=start)
+
+        def post(category, quantity):
+            self.client.post('/allocation-sources/', {
+                'event': event.id, 'source_name': 'Acme', 'ticket_category': category.id,
+                'tickets_available': quantity,
+            })
+        post(tier, 100)
+        post(b1, 50)
+        post(b2, 50)
+        self.assertEqual(SpaceAllocation.objects.filter(event=event).count(), 1)
+        self.assertFalse(event_violations(event))
+
+        source = AllocationSource(name='Late', event=event, venue=venue, ticket_category=b1, tickets_allocated=1)
+        with self.assertRaisesMessage(ValidationError, 'Only 0 seats left in Tier'):
+            source.clean()
+
+        # Without a ledger row the page falls back to the tier's subtree seats
+        EventInventory.objects.filter(event=event).delete()
+        row, = self.client.get(f'/allocation-sources/?event={event.id}').context['allocations']
+        self.assertEqual((row.zone_total, row.zone_remaining), (100, 100))
+
+
+class EventGridRollupTests(TestCase):
+    def test_tiers_roll_up_their_subtree_in_one_query(self):
+        allocation = make_allocation(total_quantity=10)
+        venue = allocation.category.venue
+        tier = SpaceCategory.objects.create(venue=venue, name='VVIP', seats_count=0)
+        allocation.category.parent = tier
+        allocation.category.save()
+        block_b = SpaceCategory.objects.create(venue=venue, name='Block B', seats_count=50, parent=tier)
+        SpaceAllocation.objects.create(
+            event=allocation.event, source=allocation.source, category=block_b,
+            total_quantity=5, referral_token='REF-B'
+        )
+        reserve_seats(allocation.id, 3, 'Alice')
+
+        with self.assertNumQueries(1):
+            grid = {row['name']: row for row in compute_event_grid(allocation.event)}
+
+        self.assertEqual(
+            [grid['VVIP'][k] for k in ('total', 'allocated', 'claimed', 'available')],
+            [150, 15, 3, 135],
+        )
+        self.assertEqual(grid['Block A']['available'], 90)
+        self.assertEqual(grid['Block B']['parent_name'], 'VVIP')
+
+
+class LiveInventoryTests(TestCase):
+    def test_broker_delivers_across_threads(self):
+        broker = InProcessBroker()
+
+        async def listen():
+            messages = broker.subscribe('event-1', heartbeat=5)
+            pending = asyncio.ensure_future(anext(messages))
+            await asyncio.sleep(0)
+            threading.Thread(target=broker.publish, args=('event-1', {'claimed': 2})).start()
+            message = await asyncio.wait_for(pending, 1)
+            await messages.aclose()
+            return message
+
+        self.assertEqual(asyncio.run(listen()), {'claimed': 2})
+        self.assertEqual(dict(broker._subscribers), {})
+
+    def test_committed_claim_publishes_delta(self):
+        allocation = make_allocation(total_quantity=10)
+        with self.captureOnCommitCallbacks() as callbacks:
+            reserve_seats(allocation.id, 3, 'Alice')
+
+        async def listen():
+            messages = get_broker().subscribe(event_channel(allocation.event_id), heartbeat=5)
+            pending = asyncio.ensure_future(anext(messages))
+            await asyncio.sleep(0)
+            for callback in callbacks:
+                callback()
+            message = await asyncio.wait_for(pending, 1)
+            await messages.aclose()
+            return message
+
+        self.assertEqual(
+            asyncio.run(listen()),
+            {'type': 'inventory', 'category': allocation.category_id, 'allocated': 0, 'claimed': 3},
+        )
+
+
+class SignedTokenTests(TestCase):
+    def test_round_trip_and_tampering(self):
+        token = make_token(12345, 67)
+        self.assertEqual(read_token(token), (12345, 67))
+
+        forged = token.replace(token.split('-')[1], 'zz', 1)
+        with self.assertRaises(InvalidToken):
+            read_token(forged)
+
+    def test_new_allocations_get_signed_tokens(self):
+        allocation = make_allocation(token='')
+        self.assertEqual(read_token(allocation.referral_token), (allocation.id, allocation.event_id))
+        allocation.refresh_from_db()
+        self.assertEqual(read_token(allocation.referral_token)[0], allocation.id)
+
+    def test_redeem(self):
+        allocation = make_allocation(total_quantity=5, token='')
+        client = APIClient()
+        payload = {'referral_token': allocation.referral_token, 'claimant_name': 'Alice', 'quantity': 3}
+
+        response = client.post('/api/claims/redeem/', payload, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['allocation'], allocation.id)
+
+        response = client.post('/api/claims/redeem/', payload, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['remaining'], 2)
+
+    def test_forged_token_rejected_without_queries(self):
+        client = APIClient()
+        token = make_token(1, 1)
+        forged = token[:-1] + ('a' if token[-1] != 'a' else 'b')
+        payload = {'referral_token': forged, 'claimant_name': 'Eve', 'quantity': 1}
+        with self.assertNumQueries(0):
+            response = client.post('/api/claims/redeem/', payload, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(GATE_DELTA_LOOKBACK_SECONDS=0)
+class GateSyncTests(TestCase):
+    def setUp(self):
+        self.allocation = make_allocation(total_quantity=10)
+        self.event_id = self.allocation.event_id
+        staff = get_user_model().objects.create_user('gate', password='pw')
+        CustomUser.objects.create(username='gate', access_rights='GateStaff')
+        self.client = APIClient()
+        self.client.force_authenticate(staff)
+        self.url = f'/api/events/{self.event_id}/gate/'
+
+    def test_requires_gate_role(self):
+        self.assertEqual(APIClient().get(self.url + 'snapshot/').status_code, 401)
+        other = APIClient()
+        other.force_authenticate(get_user_model().objects.create_user('visitor'))
+        self.assertEqual(other.get(self.url + 'snapshot/').status_code, 403)
+
+    def test_snapshot_then_delta(self):
+        first = reserve_seats(self.allocation.id, 2, 'Alice').claim
+        response = self.client.get(self.url + 'snapshot/')
+        self.assertEqual(response['Content-Type'], 'application/octet-stream')
+
+        data = response.content
+        magic, _, event_id, sequence, tokens, claims, seats = gate.SNAPSHOT_HEADER.unpack_from(data)
+        self.assertEqual((magic, event_id, tokens, claims, seats), (b'GATE', self.event_id, 1, 1, 2))
+        digest, allocation_id, remaining = gate.TOKEN.unpack_from(data, gate.SNAPSHOT_HEADER.size)
+        self.assertEqual(digest, gate.token_digest('REF-TEST'))
+        self.assertEqual((allocation_id, remaining), (self.allocation.id, 8))
+
+        # Unchanged manifest: 304 on the ETag
+        etag = response['ETag']
+        self.assertEqual(self.client.get(self.url + 'snapshot/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        second = reserve_seats(self.allocation.id, 3, 'Bob').claim
+        first_id = first.id
+        first.delete()
+        data = self.client.get(self.url + 'delta/', {'since': sequence}).content
+        *_, since, latest, count = gate.DELTA_HEADER.unpack_from(data)
+        changes = list(gate.CHANGE.iter_unpack(data[gate.DELTA_HEADER.size:]))
+
+        self.assertEqual((since, count), (sequence, 2))
+        self.assertEqual(changes, [
+            (1, second.id, self.allocation.id, 3, gate.NO_DIGEST),
+            (2, first_id, self.allocation.id, 2, gate.NO_DIGEST),
+        ])
+        self.assertEqual(int(self.client.get(self.url + 'delta/', {'since': latest})['X-Gate-Sequence']), latest)
+
+    def test_token_changes_move_the_manifest(self):
+        response = self.client.get(self.url + 'snapshot/')
+        etag, sequence = response['ETag'], int(response['X-Gate-Sequence'])
+
+        added = SpaceAllocation.objects.create(
+            event_id=self.event_id, source=self.allocation.source, category=self.allocation.category,
+            total_quantity=4,
+        )
+        allocate_bulk(added.event, [['Press', self.allocation.category_id, 2]])
+        bulk = SpaceAllocation.objects.get(source__name='Press')
+        removed_id = added.id
+        added.delete()
+
+        self.assertEqual(self.client.get(self.url + 'snapshot/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        data = self.client.get(self.url + 'delta/', {'since': sequence}).content
+        changes = list(gate.CHANGE.iter_unpack(data[gate.DELTA_HEADER.size:]))
+        self.assertEqual(changes, [
+            (3, 0, removed_id, 4, gate.NO_DIGEST),  # its token is gone by now
+            (3, 0, bulk.id, 2, gate.token_digest(bulk.referral_token)),
+            (4, 0, removed_id, 0, gate.NO_DIGEST),
+        ])
+
+    @override_settings(GATE_DELTA_LOOKBACK_SECONDS=60)
+    def test_delta_resends_changes_committed_late(self):
+        early = reserve_seats(self.allocation.id, 1, 'Alice').claim
+        late = reserve_seats(self.allocation.id, 2, 'Bob').claim
+        sequence = int(self.client.get(self.url + 'snapshot/')['X-Gate-Sequence'])
+        # Alice's change numbered first but committed after the device synced
+        ClaimChange.objects.filter(claim_id=late.id).update(created_at=F('created_at') + timedelta(seconds=1))
+
+        data = self.client.get(self.url + 'delta/', {'since': sequence}).content
+        *_, latest, count = gate.DELTA_HEADER.unpack_from(data)
+        changes = list(gate.CHANGE.iter_unpack(data[gate.DELTA_HEADER.size:]))
+        # The window also re-sends the allocation's token (claim id 0)
+        self.assertEqual([change[1] for change in changes], [0, early.id, late.id])
+        self.assertEqual(latest, sequence)
+
+        ClaimChange.objects.filter(claim_id=early.id).update(created_at=F('created_at') - timedelta(minutes=5))
+        data = self.client.get(self.url + 'delta/', {'since': sequence}).content
+        self.assertEqual([change[1] for change in gate.CHANGE.iter_unpack(data[gate.DELTA_HEADER.size:])], [late.id])
+
+
+class QueryMetricsTests(TestCase):
+    def test_views_are_recorded_and_exposed(self):
+        make_allocation()
+        user = get_user_model().objects.create_user('staff', password='pw')
+        self.client.force_login(user)
+        self.client.get('/allocation-sources/')
+
+        body = self.client.get('/metrics').content.decode()
+        self.assertIn('app_sql_queries_per_request_count{view="allocation_sources_page"}', body)
+        self.assertIn('app_http_requests_total{view="allocation_sources_page",method="GET",status="200"}', body)
+
+    def test_slow_requests_log_queries(self):
+        with self.settings(METRICS_SLOW_VIEWS={'allocation_sources_page': 0}):
+            self.client.force_login(get_user_model().objects.create_user('staff', password='pw'))
+            with self.assertLogs('app.metrics', 'WARNING') as logs:
+                self.client.get('/allocation-sources/')
+        self.assertIn('SELECT', logs.output[0])
+
+
+class SyntheticDataTests(TestCase):
+    def test_generated_data_is_consistent_and_benchmarkable(self):
+        out = StringIO()
+        call_command('generate_data', venues=1, tiers=2, blocks=2, sections=3, events=2,
+                     allocations=4, claims=3, stdout=out)
+
+        self.assertEqual(SpaceCategory.objects.count(), 2 + 4 + 12)
+        self.assertEqual(SpaceAllocation.objects.count(), 8)
+        for allocation in SpaceAllocation.objects.all():
+            claimed = sum(c.quantity for c in allocation.claims.all())
+            self.assertEqual(allocation.remaining_quantity, allocation.total_quantity - claimed)
+            self.assertEqual(read_token(allocation.referral_token)[0], allocation.id)
+        self.assertEqual(
+            sum(EventInventory.objects.values_list('claimed', flat=True)),
+            sum(Claim.objects.values_list('quantity', flat=True)),
+        )
+
+        report = run_benchmarks(runs=1, warmup=0, only=['api_space_tree', 'process_claim'])
+        self.assertEqual([r['name'] for r in report['results']], ['api_space_tree', 'process_claim'])
+        self.assertEqual(report['results'][1]['status'], [302])
+        # Benchmark writes are rolled back
+        self.assertFalse(Claim.objects.filter(claimant_name='Benchmark').exists())
+
+
+class CapacityConstraintTests(TestCase):
+    def setUp(self):
+        self.allocation = make_allocation(total_quantity=60)
+        self.event = self.allocation.event
+        self.category = self.allocation.category
+
+    def test_overallocation_is_refused_on_write(self):
+        with self.assertRaisesMessage(ValidationError, 'Only 40 left in Block A'):
+            SpaceAllocation.objects.create(
+                event=self.event, source=self.allocation.source, category=self.category, total_quantity=50,
+            )
+        self.allocation.total_quantity = 101
+        with self.assertRaises(ValidationError):
+            self.allocation.save()
+        self.assertEqual(SpaceAllocation.objects.filter(event=self.event).count(), 1)
+        self.assertEqual(EventInventory.objects.get(event=self.event, category=self.category).allocated, 60)
+
+        # Writes that skip save() still meet the per-row CHECK (last: it aborts the transaction on PostgreSQL)
+        with self.assertRaises(IntegrityError):
+            EventInventory.objects.filter(event=self.event).update(allocated=F('capacity') + 1)
+
+    def test_layout_cannot_shrink_below_allocations(self):
+        tree = venue_space_tree(self.event.venue_id)
+        tree[0]['seats_count'] = 40
+        with self.assertRaises(ValidationError):
+            save_space_tree(self.event.venue, tree)
+        self.assertEqual(SpaceCategory.objects.get(pk=self.category.pk).seats_count, 100)
+
+        response = APIClient().post(f'/api/venues/{self.event.venue_id}/space-tree/', tree, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Block A', response.data['violations'][0])
+
+    def test_validate_endpoints_list_violations(self):
+        client = APIClient()
+        self.assertEqual(client.get(f'/api/events/{self.event.id}/validate/').data, {'valid': True, 'violations': []})
+
+        # Stale rows written behind the ledger's back (e.g. a raw import)
+        SpaceAllocation.objects.filter(pk=self.allocation.pk).update(total_quantity=150, remaining_quantity=150)
+        Claim.objects.bulk_create([Claim(allocation=self.allocation, claimant_name='X', quantity=200)])
+        SpaceCategory.objects.bulk_create([
+            SpaceCategory(venue=self.event.venue, parent=self.category, name='Row 1', seats_count=120)
+        ])
+
+        with self.assertNumQueries(4):
+            rules = {v.rule for v in event_violations(self.event)}
+        self.assertEqual(rules, {'parent_below_children', 'category_overallocated', 'allocation_overclaimed', 'ledger_drift'})
+
+        response = client.get(f'/api/venues/{self.event.venue_id}/validate/')
+        self.assertFalse(response.data['valid'])
+        self.assertEqual(response.data['violations'][0]['rule'], 'parent_below_children')
+
+
+class AsyncReadTests(TestCase):
+    def setUp(self):
+        self.allocation = make_allocation(total_quantity=10)
+        self.event = self.allocation.event
+        reserve_seats(self.allocation.id, 3, 'Alice')
+
+    async def test_event_endpoints(self):
+        response = await self.async_client.get(f'/api/async/events/{self.event.id}/')
+        self.assertEqual(response.json()['venue_name'], 'Main Stadium')
+        self.assertEqual((await self.async_client.get('/api/async/events/999/')).status_code, 404)
+
+        data = (await self.async_client.get(f'/api/async/events/{self.event.id}/allocations/')).json()
+        self.assertEqual((len(data['results']), data['next']), (1, None))
+        self.assertEqual(data['results'][0]['remaining_quantity'], 7)
+        self.assertEqual(data['results'][0]['event_name'], 'Final')
+
+        data = (await self.async_client.get(f'/api/async/events/{self.event.id}/dashboard/')).json()
+        self.assertEqual([s['name'] for s in data['sources']], ['Sponsor'])
+        self.assertEqual(data['grid'][0]['claimed'], 3)
+
+    async def test_event_allocations_are_paged(self):
+        # Same created_at for all: the cursor must break ties on id
+        created_at = self.allocation.created_at
+        await SpaceAllocation.objects.abulk_create([
+            SpaceAllocation(
+                event_id=self.event.id, source_id=self.allocation.source_id, category_id=self.allocation.category_id,
+                total_quantity=1, remaining_quantity=1, created_at=created_at,
+            )
+            for _ in range(4)
+        ])
+        await SpaceAllocation.objects.filter(pk=self.allocation.pk).aupdate(created_at=created_at)
+
+        seen, url = [], f'/api/async/events/{self.event.id}/allocations/?page_size=2'
+        while url:
+            data = (await self.async_client.get(url)).json()
+            self.assertLessEqual(len(data['results']), 2)
+            seen += [row['id'] for row in data['results']]
+            url = data['next']
+        self.assertEqual(seen, sorted(seen, reverse=True))
+        self.assertEqual(len(seen), 5)
+
+        response = await self.async_client.get(f'/api/async/events/{self.event.id}/allocations/?cursor=bad')
+        self.assertEqual(response.status_code, 404)
+
+    async def test_space_tree_matches_sync_and_revalidates(self):
+        venue_id = self.event.venue_id
+        expected = (await self.async_client.get(f'/api/venues/{venue_id}/space-tree/')).json()
+        response = await self.async_client.get(f'/api/async/venues/{venue_id}/space-tree/')
+        self.assertEqual(response.json(), expected)
+
+        # Matching ETag: 304 without building the tree
+        cached = await self.async_client.get(
+            f'/api/async/venues/{venue_id}/space-tree/', headers={'If-None-Match': response['ETag']},
+        )
+        self.assertEqual(cached.status_code, 304)
+
+    async def test_throughput_report(self):
+        # Any client with an async get() will do; the loadtest command uses httpx over HTTP
+        result = await measure_throughput(
+            self.async_client, f'/api/async/events/{self.event.id}/', concurrency=4, requests=12,
+        )
+        self.assertEqual(result['status'], {'200': 12})
+        self.assertGreater(result['rps'], 0)
+
+    async def test_async_queries_are_recorded(self):
+        await self.async_client.get(f'/api/async/events/{self.event.id}/')
+        body = await self.async_client.get('/metrics')
+        self.assertRegex(body.content.decode(), r'app_sql_queries_per_request_sum\{view="app.api.async_views.event_detail"\} [1-9]')
+
+
+@override_settings(DATABASE_REPLICAS=['replica_1'])
+class ReplicaRouterTests(SimpleTestCase):
+    def test_reads_use_replicas_until_the_request_writes(self):
+        router = PrimaryReplicaRouter()
+        self.assertIsNone(router.db_for_read(Event))  # outside a request: primary
+        with routing(replica_reads=True) as state:
+            self.assertEqual(router.db_for_read(Event), 'replica_1')
+            self.assertEqual(router.db_for_write(Claim), 'default')
+            self.assertTrue(state.wrote)
+            self.assertIsNone(router.db_for_read(Event))
+        with routing(replica_reads=False):
+            self.assertIsNone(router.db_for_read(Event))
+
+    def test_writes_pin_the_client_to_the_primary(self):
+        seen = []
+
+        def view(request):
+            seen.append(routing_state().replica_reads)
+            if request.method == 'POST':
+                PrimaryReplicaRouter().db_for_write(Claim)
+            return HttpResponse()
+
+        middleware = ReplicaRoutingMiddleware(view)
+        factory = RequestFactory()
+        pin = middleware(factory.post('/claims/')).cookies[ReplicaRoutingMiddleware.cookie_name]
+        self.assertEqual(pin['max-age'], settings.PRIMARY_PIN_SECONDS)
+
+        pinned = factory.get('/events/')
+        pinned.COOKIES[pin.key] = pin.value
+        self.assertNotIn(pin.key, middleware(pinned).cookies)
+        middleware(factory.get('/events/'))
+        self.assertEqual(seen, [False, False, True])
+
+
+@skipUnless(settings.DATABASE_REPLICAS, "set REPLICA_DATABASE_URLS, e.g. sqlite:///replica.sqlite3")
+class ReplicaReadTests(TransactionTestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        # Cached grids and throttle buckets from earlier tests
+        cache.clear()
+
+    def test_get_requests_read_from_a_replica(self):
+        event = make_allocation().event
+        with routing(replica_reads=True):
+            self.assertIn(Event.objects.get(pk=event.pk)._state.db, settings.DATABASE_REPLICAS)
+        response = self.client.get(f'/api/async/events/{event.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['name'], 'Final')
+
+
+class ClaimRollupTests(TestCase):
+    def setUp(self):
+        self.allocation = make_allocation(total_quantity=20)
+        self.event = self.allocation.event
+        self.url = f'/api/events/{self.event.id}/fill-rate/'
+
+    def rollup(self, level):
+        return list(ClaimRollup.objects.filter(level=level).order_by('bucket').values_list('claims', 'seats'))
+
+    def test_claims_update_every_level(self):
+        reserve_seats(self.allocation.id, 2, 'Alice')
+        reserve_seats(self.allocation.id, 3, 'Bob')
+        import_claims(iter_rows(BytesIO(b"claimant_name,quantity\nCara,4\n"), 'c.csv'),
+                      default_token=self.allocation.referral_token)
+        for level in (ClaimRollup.MINUTE, ClaimRollup.HOUR, ClaimRollup.DAY):
+            self.assertEqual(sum(c for c, _ in self.rollup(level)), 3)
+            self.assertEqual(sum(s for _, s in self.rollup(level)), 9)
+
+        # Removals count when they happen; rebuilding keeps live claims only
+        Claim.objects.filter(claimant_name='Bob').delete()
+        self.assertEqual(sum(s for _, s in self.rollup(ClaimRollup.DAY)), 6)
+        rebuild_rollups([self.event.id])
+        self.assertEqual(self.rollup(ClaimRollup.DAY), [(2, 6)])
+
+    def test_fill_rate_curve(self):
+        earlier = timezone.now() - timedelta(hours=2)
+        Claim.objects.create(allocation=self.allocation, claimant_name='Early', quantity=5, claimed_at=earlier)
+        reserve_seats(self.allocation.id, 2, 'Alice')
+
+        with self.assertNumQueries(1):
+            response = APIClient().get(self.url, {'level': 'hour'})
+        series, = response.data['series']
+        self.assertEqual(series['category'], self.allocation.category_id)
+        self.assertEqual([(p['seats'], p['total_seats']) for p in series['points']], [(5, 5), (2, 7)])
+        self.assertEqual(APIClient().get(self.url, {'level': 'week'}).status_code, 400)
+        self.assertEqual(APIClient().get(self.url, {'category': 'abc'}).status_code, 400)
+
+    def test_deleting_the_event_takes_its_history(self):
+        reserve_seats(self.allocation.id, 2, 'Alice')
+        self.event.delete()
+        self.assertFalse(ClaimRollup.objects.exists())
+
+
+class BulkAllocationTests(TestCase):
+    def setUp(self):
+        self.venue = Venue.objects.create(name='Arena', venue_type='Indoor', total_capacity=1000)
+        save_space_tree(self.venue, [
+            {'name': 'North', 'seats_count': 0, 'children': [
+                {'name': 'Block A', 'seats_count': 100},
+                {'name': 'Block B', 'seats_count': 50},
+            ]},
+        ])
+        self.a, self.b = SpaceCategory.objects.filter(name__startswith='Block').order_by('name')
+        start = timezone.now()
+        self.event = Event.objects.create(
+            name='Final', venue=self.venue, start_datetime=start, end_datetime=start + timedelta(hours=3),
+        )
+        self.url = f'/api/events/{self.event.id}/allocations/bulk/'
+
+    def test_matrix_is_created_in_one_batch(self):
+        cells = [
+            {'source': sponsor, 'category': category.id, 'quantity': 10}
+            for sponsor in ('Acme', 'Globex', 'Initech') for category in (self.a, self.b)
+        ]
+        response = APIClient().post(self.url, {'cells': cells}, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['allocations'], response.data['seats']), (6, 60))
+        self.assertEqual(AllocationSource.objects.filter(event=self.event).count(), 6)
+        allocation = SpaceAllocation.objects.get(pk=response.data['cells'][0]['allocation'])
+        self.assertEqual(read_token(allocation.referral_token)[0], allocation.id)
+        self.assertEqual(EventInventory.objects.get(event=self.event, category=self.b).allocated, 30)
+
+    def test_batch_is_rejected_as_a_whole(self):
+        cells = [['Acme', self.a.id, 60], ['Globex', self.a.id, 50], ['Initech', self.b.id, 5]]
+        response = APIClient().post(self.url, {'cells': cells}, format='json')
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual([('error' in cell) for cell in response.data['cells']], [True, True, False])
+        self.assertIn('100 left in Block A', response.data['cells'][0]['error'])
+        self.assertFalse(SpaceAllocation.objects.exists())
+        self.assertFalse(AllocationSource.objects.exists())
+
+        response = APIClient().post(self.url, {'cells': [['Acme', 999, 'ten']]}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_cells_count_against_their_ancestors(self):
+        north = SpaceCategory.objects.get(name='North')
+        SpaceAllocation.objects.create(
+            event=self.event, source=AllocationSource.objects.create(
+                name='Existing', event=self.event, venue=self.venue, ticket_category=self.b,
+            ),
+            category=self.b, total_quantity=20,
+        )
+        # North holds 150 seats, 20 of them allocated in Block B
+        cells = [['Acme', north.id, 100], ['Globex', self.a.id, 40]]
+        response = APIClient().post(self.url, {'cells': cells}, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertIn('130 left in North, the batch asks for 140', response.data['cells'][1]['error'])
+
+        cells[1][2] = 30
+        self.assertEqual(APIClient().post(self.url, {'cells': cells}, format='json').status_code, 201)
+        self.assertFalse(event_violations(self.event))
+
+
+class IdempotencyTests(TestCase):
+    def setUp(self):
+        self.allocation = make_allocation(total_quantity=10)
+
+    def test_api_retries_replay_the_first_response(self):
+        client = APIClient()
+        body = {'referral_token': 'REF-TEST', 'claimant_name': 'Alice', 'quantity': 2}
+        first = client.post('/api/claims/redeem/', body, format='json', HTTP_IDEMPOTENCY_KEY='k1')
+        retry = client.post('/api/claims/redeem/', body, format='json', HTTP_IDEMPOTENCY_KEY='k1')
+
+        self.assertEqual((first.status_code, retry.status_code), (201, 201))
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Claim.objects.count(), 1)
+
+        changed = dict(body, quantity=3)
+        self.assertEqual(
+            client.post('/api/claims/redeem/', changed, format='json', HTTP_IDEMPOTENCY_KEY='k1').status_code, 422,
+        )
+        client.post('/api/claims/redeem/', body, format='json', HTTP_IDEMPOTENCY_KEY='k2')
+        self.assertEqual(Claim.objects.count(), 2)
+
+    def test_refreshed_jwt_keeps_the_scope(self):
+        from rest_framework_simplejwt.tokens import RefreshToken
+
+        refresh = RefreshToken.for_user(get_user_model().objects.create_user('tablet'))
+        client = APIClient()
+        body = {'referral_token': 'REF-TEST', 'claimant_name': 'Alice', 'quantity': 2}
+        for token in (refresh.access_token, refresh.access_token):  # a new access token each time
+            client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+            response = client.post('/api/claims/redeem/', body, format='json', HTTP_IDEMPOTENCY_KEY='k1')
+            self.assertEqual(response.status_code, 201)
+        self.assertEqual(response['Idempotent-Replayed'], 'true')
+        self.assertEqual(Claim.objects.count(), 1)
+
+    def test_abandoned_reservation_is_taken_over(self):
+        client = APIClient()
+        body = {'referral_token': 'REF-TEST', 'claimant_name': 'Alice', 'quantity': 2}
+        # The first attempt's worker died after reserving the key (its claim rolled back)
+        client.post('/api/claims/redeem/', body, format='json', HTTP_IDEMPOTENCY_KEY='k1')
+        Claim.objects.all().delete()
+        IdempotencyKey.objects.update(status_code=None, body=b'')
+        record = IdempotencyKey.objects.get()
+
+        response = client.post('/api/claims/redeem/', body, format='json', HTTP_IDEMPOTENCY_KEY='k1')
+        self.assertEqual((response.status_code, response['Retry-After']), (409, '1'))
+
+        IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(minutes=5))
+        response = client.post('/api/claims/redeem/', body, format='json', HTTP_IDEMPOTENCY_KEY='k1')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Claim.objects.count(), 1)
+        # The dead worker's lease is gone: it can't free the new owner's key
+        release(record)
+        self.assertEqual(IdempotencyKey.objects.get().status_code, 201)
+
+    def test_form_retries_and_expiry(self):
+        user = get_user_model().objects.create_user('staff', password='pw')
+        self.client.force_login(user)
+        form = {
+            'event_id': self.allocation.event_id, 'category_id': self.allocation.category_id,
+            'source_id': self.allocation.source_id, 'quantity': 1, 'claimant_name': 'Bob',
+            'idempotency_key': 'form-1',
+        }
+        for _ in range(3):
+            response = self.client.post('/process-claim/', form)
+            self.assertEqual(response.status_code, 302)
+        self.assertEqual(Claim.objects.count(), 1)
+
+        IdempotencyKey.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(purge_expired(), 1)
+        self.client.post('/process-claim/', form)
+        self.assertEqual(Claim.objects.count(), 2)
+
+
+@override_settings(THROTTLE_RATES={'user': '3/min', 'ip': '2/min', 'event': ''})
+class ThrottleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        # Drained buckets must not throttle the tests that run next
+        self.addCleanup(cache.clear)
+        self.allocation = make_allocation(total_quantity=10)
+
+    def test_ip_limit_refuses_without_queries(self):
+        client = APIClient()
+        for _ in range(2):
+            self.assertEqual(client.get('/api/allocations/').status_code, 200)
+        with self.assertNumQueries(0):
+            response = client.get('/api/allocations/')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '30')
+        # Another address has its own bucket
+        self.assertEqual(client.get('/api/allocations/', REMOTE_ADDR='10.0.0.2').status_code, 200)
+        # A made-up session cookie is no way around the IP's
+        client.cookies[settings.SESSION_COOKIE_NAME] = 'forged'
+        self.assertEqual(client.get('/api/allocations/').status_code, 429)
+
+    def test_jwt_users_get_their_own_buckets(self):
+        from rest_framework_simplejwt.tokens import RefreshToken
+
+        client = APIClient()
+        for _ in range(2):
+            client.get('/api/allocations/')
+        for username in ('alice', 'bob'):
+            token = RefreshToken.for_user(get_user_model().objects.create_user(username)).access_token
+            client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+            statuses = [client.get('/api/allocations/').status_code for _ in range(4)]
+            self.assertEqual(statuses, [200, 200, 200, 429])
+
+    @override_settings(THROTTLE_RATES={'event': '1/min'})
+    def test_event_limit_is_shared_by_clients(self):
+        event_id = self.allocation.event_id
+        self.assertEqual(self.client.get(f'/api/events/{event_id}/fill-rate/').status_code, 200)
+        self.assertEqual(
+            self.client.get(f'/api/allocations/?event={event_id}', REMOTE_ADDR='10.0.0.2').status_code, 429,
+        )
+        self.assertEqual(self.client.get('/api/allocations/').status_code, 200)
+
+    def test_buckets_refill_and_take_all_or_nothing(self):
+        buckets = [Bucket('user', '1', 2, 60), Bucket('event', '1', 1, 60)]
+        states, denied = take(buckets, {}, now=0)
+        self.assertIsNone(denied)
+        self.assertEqual(take(buckets, states, now=30), (None, ('event', 30)))
+        states, denied = take(buckets, states, now=60)
+        self.assertIsNone(denied)
+        self.assertAlmostEqual(states['throttle:user:2/60:1'][0], 1)
+        # A new rate gets its own bucket
+        self.assertIsNone(take([Bucket('event', '1', 5, 60)], states, now=60)[1])
+
+    def test_per_worker_cache_is_flagged(self):
+        self.assertEqual([e.id for e in check_throttle_cache(None)], ['app.W001'])
+        self.assertEqual([e.id for e in check_throttle_cache_deploy(None)], ['app.E001'])
+        with override_settings(THROTTLE_RATES={'ip': ''}):
+            self.assertEqual(check_throttle_cache(None), [])
+        redis = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://'}}
+        with override_settings(CACHES=redis):
+            self.assertEqual(check_throttle_cache_deploy(None), [])
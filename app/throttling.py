@@ -0,0 +1,156 @@
+# app/throttling.py
+import hashlib
+from dataclasses import dataclass
+from time import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+KEY_PREFIX = 'throttle'
+FORM_TYPES = ('application/x-www-form-urlencoded', 'multipart/form-data')
+
+_jwt = JWTAuthentication()
+
+
+# -----------------------------
+# Rates
+# -----------------------------
+def parse_rate(rate):
+    """'600/min' -> (600, 60): a bucket of 600 tokens refilled over a minute. None/'' disables."""
+    if not rate:
+        return None
+    count, period = rate.split('/')
+    return int(count), {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}[period.strip()[0]]
+
+
+@dataclass
+class Bucket:
+    scope: str
+    ident: str
+    capacity: int
+    seconds: int
+
+    @property
+    def key(self):
+        # A changed rate starts a fresh bucket instead of inheriting a deficit
+        return f"{KEY_PREFIX}:{self.scope}:{self.capacity}/{self.seconds}:{self.ident}"
+
+    @property
+    def refill_rate(self):
+        return self.capacity / self.seconds
+
+
+# -----------------------------
+# Request identity (no ORM: runs before the session and user are loaded)
+# -----------------------------
+def _digest(value):
+    return hashlib.sha256(value.encode()).hexdigest()[:32]
+
+
+def client_ip(request):
+    """REMOTE_ADDR, or the address THROTTLE_NUM_PROXIES hops back in X-Forwarded-For."""
+    num_proxies = getattr(settings, 'THROTTLE_NUM_PROXIES', 0)
+    forwarded = request.META.get('HTTP_X_FORWARDED_FOR')
+    if num_proxies and forwarded:
+        addrs = [addr.strip() for addr in forwarded.split(',')]
+        return addrs[-min(num_proxies, len(addrs))]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def user_ident(request):
+    """
+    The user_id claim of a valid bearer token (signature and expiry are
+    checked, the user row is not loaded), else None. Session cookies
+    don't count: telling a real session from a made-up cookie takes a
+    session lookup, so those requests are limited per IP.
+    """
+    header = _jwt.get_header(request)
+    raw = _jwt.get_raw_token(header) if header else None
+    if raw is None:
+        return None
+    try:
+        return f"user:{_jwt.get_validated_token(raw)[jwt_settings.USER_ID_CLAIM]}"
+    except (InvalidToken, TokenError, KeyError):
+        return None
+
+
+def event_ident(request, kwargs):
+    """The event a request is about: the URL's event_id, ?event=, or a posted event_id/event field."""
+    event_id = kwargs.get('event_id') or request.GET.get('event')
+    if not event_id and request.method == 'POST' and request.content_type == FORM_TYPES[0]:
+        event_id = request.POST.get('event_id') or request.POST.get('event')
+    return str(event_id) if str(event_id or '').isdigit() else None
+
+
+def request_buckets(request, kwargs):
+    """
+    The buckets a request draws from: its JWT user's (or, without one,
+    its IP's) and its event's, for the scopes with a rate in THROTTLE_RATES.
+    """
+    rates = getattr(settings, 'THROTTLE_RATES', {})
+    user = user_ident(request)
+    idents = {
+        'user': user,
+        'ip': None if user else _digest(client_ip(request)),
+        'event': event_ident(request, kwargs),
+    }
+    buckets = []
+    for scope, ident in idents.items():
+        rate = parse_rate(rates.get(scope))
+        if ident and rate:
+            buckets.append(Bucket(scope, ident, *rate))
+    return buckets
+
+
+# -----------------------------
+# Token buckets (state in the default cache, shared by every worker)
+# -----------------------------
+def take(buckets, states, now):
+    """
+    Takes a token from every bucket, or from none. `states` maps cache
+    keys to (tokens, updated_at); a missing key is a full bucket. Returns
+    (new_states, None) if allowed, else (None, (scope, retry_after)) for
+    the bucket that will take longest to refill.
+    """
+    updated, denied = {}, None
+    for bucket in buckets:
+        tokens, updated_at = states.get(bucket.key) or (bucket.capacity, now)
+        tokens = min(bucket.capacity, tokens + (now - updated_at) * bucket.refill_rate)
+        if tokens < 1:
+            wait = (1 - tokens) / bucket.refill_rate
+            if denied is None or wait > denied[1]:
+                denied = (bucket.scope, wait)
+        updated[bucket.key] = (tokens - 1, now)
+    return (None, denied) if denied else (updated, None)
+
+
+def _expiry(buckets):
+    # Once a bucket has refilled, forgetting it is the same as keeping it
+    return max(bucket.seconds for bucket in buckets) + 1
+
+
+def throttle(buckets):
+    """
+    Two cache round trips for an allowed request (read all buckets, write
+    them back), one for a denied one. Concurrent requests can read the
+    same state, so a burst may overshoot by up to the number of workers;
+    the cache API has no compare-and-set.
+    """
+    if not buckets:
+        return None
+    updated, denied = take(buckets, cache.get_many([b.key for b in buckets]), time())
+    if updated:
+        cache.set_many(updated, timeout=_expiry(buckets))
+    return denied
+
+
+async def athrottle(buckets):
+    if not buckets:
+        return None
+    updated, denied = take(buckets, await cache.aget_many([b.key for b in buckets]), time())
+    if updated:
+        await cache.aset_many(updated, timeout=_expiry(buckets))
+    return denied
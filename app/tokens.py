@@ -0,0 +1,76 @@
+# app/tokens.py
+from django.core.signing import b62_decode, b62_encode
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+PREFIX = 'RT'
+KEY_SALT = 'app.tokens.referral'
+SIGNATURE_LENGTH = 20  # hex chars = 80 bits of HMAC-SHA256
+
+
+class InvalidToken(ValueError):
+    pass
+
+
+# -----------------------------
+# Signed referral tokens
+# -----------------------------
+def _signature(payload):
+    return salted_hmac(KEY_SALT, payload, algorithm='sha256').hexdigest()[:SIGNATURE_LENGTH]
+
+
+def make_token(allocation_id, event_id):
+    """
+    Returns 'RT-<allocation>-<event>-<signature>' (ids in base62).
+
+    Tokens derive from the allocation's primary key, so they are unique
+    without a lookup or retry, and only holders of SECRET_KEY can mint one.
+    """
+    payload = f"{PREFIX}-{b62_encode(allocation_id)}-{b62_encode(event_id)}"
+    return f"{payload}-{_signature(payload)}"
+
+
+def read_token(token):
+    """
+    Verifies a signed token without touching the database.
+    Returns (allocation_id, event_id) or raises InvalidToken.
+    """
+    parts = str(token).strip().split('-')
+    if len(parts) != 4 or parts[0] != PREFIX:
+        raise InvalidToken("Malformed referral token.")
+    payload = '-'.join(parts[:3])
+    if not constant_time_compare(parts[3], _signature(payload)):
+        raise InvalidToken("Invalid referral token.")
+    try:
+        return b62_decode(parts[1]), b62_decode(parts[2])
+    except ValueError:
+        raise InvalidToken("Malformed referral token.")
+
+
+def is_signed_token(token):
+    return str(token).startswith(PREFIX + '-')
+
+
+def resolve_token(token):
+    """
+    Returns the allocation id a token grants, or None. Signed tokens are
+    checked in memory; legacy 'REF-...' tokens fall back to a lookup.
+    """
+    from .models import SpaceAllocation
+
+    if is_signed_token(token):
+        return read_token(token)[0]
+    return SpaceAllocation.objects.filter(referral_token=token).values_list('pk', flat=True).first()
+
+
+def assign_tokens(allocations):
+    """
+    Sets signed tokens on saved allocations that have none (e.g. after
+    bulk_create) with one bulk UPDATE. Returns the allocations updated.
+    """
+    from .models import SpaceAllocation
+
+    pending = [a for a in allocations if not a.referral_token]
+    for allocation in pending:
+        allocation.referral_token = make_token(allocation.pk, allocation.event_id)
+    SpaceAllocation.objects.bulk_update(pending, ['referral_token'], batch_size=500)
+    return pending
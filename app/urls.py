@@ -52,6 +52,9 @@ urlpatterns = [
     
     # Event-specific Excel-style Dashboard
     path('event-dashboard/<int:event_id>/', views.event_dashboard, name='event_dashboard'),
+    path('event-dashboard/<int:event_id>/export/<str:kind>/', views.export_event, name='export_event'),
+    path('event-dashboard/<int:event_id>/live/', views.event_live, name='event_live'),
+    path('metrics', views.metrics_view, name='metrics'),
     
     # Action to process the booking/claim
     path('process-claim/', views.process_claim, name='process_claim'),
@@ -1,5 +1,6 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.db import transaction
+from django.core.exceptions import ValidationError
 from django.contrib import messages
 from django.http import JsonResponse
 from django.contrib.auth.views import LoginView
@@ -11,6 +12,9 @@ import json
 
 from .forms import VenueForm, CustomUserForm, EventForm, AllocationSourceForm
 from .models import Venue, SpaceCategory, CustomUser, Event, AllocationSource, SpaceAllocation   
+from .space_tree import venue_space_tree, hierarchy_node, hierarchy_fields, save_space_tree
+from .conditional import venue_layout_condition
+from .capacity import posted_tree_violations
 
 # ---------------------------
 # LOGIN / DASHBOARD
@@ -51,24 +55,13 @@ def calculate_seats_with_children(items):
         children = item.get('children', [])
         # Recursively calculate seats for children
         children_total = calculate_seats_with_children(children)
-        # Parent seats = own seats + children_total
-        item['seats'] = (item.get('seats') or 0) + children_total
+        # Parent seats = children_total. The editor posts back the stored
+        # (already rolled-up) parent seats, so adding them again would grow
+        # the parent on every save and defeat the layout diff.
+        item['seats'] = children_total if children else (item.get('seats') or 0)
         total += item['seats']
     return total
 
-# Recursive function to create SpaceCategory objects
-def create_recursive(items, venue, parent_obj=None):
-    for item in items:
-        category = SpaceCategory.objects.create(
-            venue=venue,
-            parent=parent_obj,
-            name=item['name'],
-            category_type=item.get('type', ''),
-            seats_count=item.get('seats') or 0
-        )
-        if item.get('children'):
-            create_recursive(item['children'], venue, parent_obj=category)
-
 @transaction.atomic
 @login_required
 def venues_page(request):
@@ -83,15 +76,16 @@ def venues_page(request):
                 try:
                     hierarchy = json.loads(json_data)
                     # Aggregate seats including subcategories
-                    total_seats = calculate_seats_with_children(hierarchy)
-
-                    if total_seats > venue.total_capacity:
-                        messages.error(request, f"Total seats ({total_seats}) exceed venue capacity ({venue.total_capacity})!")
+                    calculate_seats_with_children(hierarchy)
+                    violations = posted_tree_violations(hierarchy, venue.total_capacity, seats_key='seats')
+                    if violations:
+                        for violation in violations:
+                            messages.error(request, violation.message)
                         venue.delete()
                         return redirect('venues_page')
 
-                    # Create categories recursively
-                    create_recursive(hierarchy, venue)
+                    # Create categories, one bulk insert per level
+                    save_space_tree(venue, hierarchy, fields=hierarchy_fields)
 
                 except Exception as e:
                     messages.error(request, f"Layout error: {str(e)}")
@@ -117,34 +111,33 @@ def save_hierarchy(request, venue_id):
             hierarchy = json.loads(json_data) if json_data else []
 
             # Aggregate seats including subcategories
-            total_seats = calculate_seats_with_children(hierarchy)
-            if total_seats > venue.total_capacity:
-                messages.error(request, f"Total seats ({total_seats}) exceed venue capacity ({venue.total_capacity})!")
+            calculate_seats_with_children(hierarchy)
+            violations = posted_tree_violations(hierarchy, venue.total_capacity, seats_key='seats')
+            if violations:
+                for violation in violations:
+                    messages.error(request, violation.message)
                 return redirect('venues_page')
 
-            # Delete old categories and recreate hierarchy
-            venue.spaces.all().delete()
-            create_recursive(hierarchy, venue)
-            messages.success(request, "Venue layout updated.")
+            # Apply only what changed; untouched categories keep their allocations
+            changes = save_space_tree(venue, hierarchy, fields=hierarchy_fields)
+            messages.success(
+                request,
+                f"Venue layout updated: {changes['created']} added, "
+                f"{changes['updated']} changed, {changes['deleted']} removed."
+            )
+        except ValidationError as e:
+            for message in e.messages:
+                messages.error(request, message)
         except Exception as e:
             messages.error(request, f"Error: {str(e)}")
     return redirect('venues_page')
 
 @login_required
+@venue_layout_condition('hierarchy')
 def get_hierarchy_json(request, venue_id):
     venue = get_object_or_404(Venue, id=venue_id)
-
-    def recursive_fetch(categories):
-        return [{
-            "name": cat.name,
-            "type": cat.category_type,
-            "seats": cat.seats_count,
-            "children": recursive_fetch(cat.children.all())
-        } for cat in categories]
-
-    # Fetching only root categories (those with no parent)
-    root_cats = venue.spaces.filter(parent=None)
-    return JsonResponse(recursive_fetch(root_cats), safe=False)
+    # One flat query, nested in memory
+    return JsonResponse(venue_space_tree(venue.id, node=hierarchy_node), safe=False)
 @login_required
 def edit_venue(request, venue_id):
     venue = get_object_or_404(Venue, id=venue_id)
@@ -347,26 +340,58 @@ from .models import Event, SpaceCategory, AllocationSource, SpaceAllocation
 from .forms import AllocationSourceForm
 from django.db.models import Sum
 from django.db.models import Model, ForeignKey, Sum  # Example
+from django.db.models import F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.core.paginator import Paginator
+from uuid import uuid4
+from .idempotency import idempotent
+
+ALLOCATIONS_PER_PAGE = 50
+# Most recent events offered in the page's event dropdowns
+EVENT_CHOICES = 200
+
+
 @login_required
+@idempotent
 def allocation_sources_page(request):
-    # Fetch all allocations
     allocations = SpaceAllocation.objects.select_related(
-        'event', 'source', 'category', 'category__venue'
-    ).order_by('-created_at')
-
-    # Calculate "Zone Remaining" for each allocation row
-    for alloc in allocations:
-        # Sum up every allocation made for this specific Event and Category
-        total_allocated_in_zone = SpaceAllocation.objects.filter(
-            event=alloc.event,
-            category=alloc.category
-        ).aggregate(total=Sum('total_quantity'))['total'] or 0
-        
-        # Available in Zone = Total Seats - Sum of all Allocations
-        alloc.zone_remaining = alloc.category.seats_count - total_allocated_in_zone
-
-    events = Event.objects.select_related('venue').all()
-    categories = SpaceCategory.objects.select_related('venue').all()
+        'event', 'source', 'category'
+    ).order_by('-created_at', '-id')
+
+    selected_event = request.GET.get('event') or ''
+    if selected_event.isdigit():
+        allocations = allocations.filter(event_id=selected_event)
+    else:
+        selected_event = ''
+
+    # "Zone Remaining" (Total Seats - Sum of all Allocations) and "Zone Total"
+    # come from the inventory ledger as subqueries, so the whole page is one
+    # query however many (event, category) zones it spans; a zone without a
+    # ledger row falls back to its subtree's leaf seats, as the ledger counts
+    zone = EventInventory.objects.filter(
+        event_id=OuterRef('event_id'), category_id=OuterRef('category_id')
+    )
+    subtree_seats = SpaceCategory.objects.filter(
+        path__startswith=OuterRef('category__path')
+    ).leaves().values('venue').annotate(total=Sum('seats_count')).values('total')
+    allocations = allocations.annotate(
+        zone_total=Coalesce(
+            Subquery(zone.values('capacity')[:1]), Subquery(subtree_seats), 0,
+            output_field=IntegerField(),
+        ),
+        zone_remaining=Coalesce(
+            Subquery(zone.annotate(available=F('capacity') - F('allocated')).values('available')[:1]),
+            Subquery(subtree_seats), 0,
+            output_field=IntegerField(),
+        ),
+    )
+    page = Paginator(allocations, ALLOCATIONS_PER_PAGE).get_page(request.GET.get('page'))
+
+    # Categories are fetched per venue by the form (get_hierarchy_json) once an event is picked
+    event_fields = ('id', 'name', 'venue_id', 'venue__name')
+    events = list(Event.objects.order_by('-start_datetime').values(*event_fields)[:EVENT_CHOICES])
+    if selected_event and all(str(event['id']) != selected_event for event in events):
+        events += Event.objects.filter(pk=selected_event).values(*event_fields)
     form = AllocationSourceForm(request.POST or None)
 
     if request.method == "POST":
@@ -379,43 +404,36 @@ def allocation_sources_page(request):
             event = get_object_or_404(Event, id=event_id)
             category = get_object_or_404(SpaceCategory, id=category_id)
             
-            # Logic to check if the new allocation exceeds zone capacity
-            allocated_total = SpaceAllocation.objects.filter(
-                event=event, category=category
-            ).aggregate(total=Sum('total_quantity'))['total'] or 0
-            
-            available_seats = category.seats_count - allocated_total
-
-            if int(quantity) > available_seats:
-                messages.error(request, f"Insufficient seats. Only {available_seats} left in {category.name}.")
+            try:
+                with transaction.atomic():
+                    source, _ = AllocationSource.objects.get_or_create(
+                        name=source_name.strip(),
+                        event=event,
+                        venue=category.venue,
+                        ticket_category=category
+                    )
+                    # Checked under lock against the zone and its ancestors
+                    # (SpaceAllocation.check_capacity); refusal rolls back the source
+                    SpaceAllocation.objects.create(
+                        event=event,
+                        source=source,
+                        category=category,
+                        total_quantity=int(quantity),
+                    )
+            except ValidationError as e:
+                messages.error(request, e.messages[0])
             else:
-                source, _ = AllocationSource.objects.get_or_create(
-                    name=source_name.strip(),
-                    event=event,
-                    venue=category.venue,
-                    ticket_category=category
-                )
-                SpaceAllocation.objects.create(
-                    event=event,
-                    source=source,
-                    category=category,
-                    total_quantity=int(quantity),
-                    referral_token=f"REF-{event.id}-{category.id}-{timezone.now().timestamp()}"
-                )
                 messages.success(request, f"Allocated {quantity} seats to '{source_name}'.")
                 return redirect('allocation_sources_page')
 
-    categories_json = json.dumps({
-        c.id: {'seats': c.seats_count, 'venue_id': c.venue.id, 'name': c.name}
-        for c in categories
-    })
-
     context = {
-        'allocations': allocations,
+        'allocations': page,
+        'page': page,
         'form': form,
         'events': events,
-        'categories': categories,
-        'categories_json': categories_json,
+        'selected_event': selected_event,
+        # Resubmitting this form (e.g. a retry) replays the first result
+        'idempotency_key': uuid4().hex,
     }
     return render(request, 'allocation_sources.html', context)
 
@@ -429,44 +447,37 @@ from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_POST
 from django.contrib import messages
 from django.utils import timezone
-from .models import Event, SpaceCategory, SpaceAllocation, Claim, AllocationSource
+from .models import Event, SpaceCategory, SpaceAllocation, Claim, AllocationSource, EventInventory
+from .reservations import reserve_seats
+from .dashboard import get_event_grid
+from .exports import EXPORTS, stream_csv, write_xlsx
+from .live import get_broker, event_channel
+from . import metrics
+from django.http import FileResponse, Http404, StreamingHttpResponse
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.crypto import constant_time_compare
 
 @login_required
 def event_dashboard(request, event_id):
-    event = get_object_or_404(Event, id=event_id)
+    event = get_object_or_404(Event.objects.select_related('venue'), id=event_id)
     
     # Fetch available allocation sources for this event to populate the dropdown
     sources = AllocationSource.objects.filter(event=event)
     
-    categories = SpaceCategory.objects.filter(venue=event.venue).prefetch_related('children')
-    
-    dashboard_data = []
-    for cat in categories:
-        total = cat.seats_count
-        # Total currently allocated across all sources for this category
-        allocated = SpaceAllocation.objects.filter(
-            event=event, category=cat
-        ).aggregate(res=Sum('total_quantity'))['res'] or 0
-        
-        # Remaining overall for the venue category
-        available = total - allocated
-
-        dashboard_data.append({
-            'category': cat,
-            'total': total,
-            'allocated': allocated,
-            'available': available,
-            'is_parent': cat.parent is None
-        })
+    # Served from cache between allocation/claim writes
+    dashboard_data = get_event_grid(event)
 
     return render(request, 'dashboard_event_grid.html', {
         'event': event,
         'dashboard_data': dashboard_data,
         'sources': sources,  
+        'idempotency_key': uuid4().hex,
     })
 
 @require_POST
 @login_required
+@idempotent
 def process_claim(request):
     event_id = request.POST.get('event_id')
     category_id = request.POST.get('category_id')
@@ -480,26 +491,77 @@ def process_claim(request):
         return redirect('event_dashboard', event_id=event_id)
 
     qty = int(qty_str)
+    if qty < 1:
+        messages.error(request, "Quantity must be at least 1.")
+        return redirect('event_dashboard', event_id=event_id)
     
     # Find the specific allocation for this Category AND Source
     allocation = SpaceAllocation.objects.filter(
         event_id=event_id, 
         category_id=category_id,
         source_id=source_id
-    ).first()
+    ).select_related('source').first()
     
     if not allocation:
         messages.error(request, "This Source does not have an allocation for the selected Category.")
-    elif qty > allocation.remaining_quantity:
-        messages.error(request, f"Insufficient seats! This source only has {allocation.remaining_quantity} left.")
+        return redirect('event_dashboard', event_id=event_id)
+
+    # Take the seats atomically; a concurrent booking can't oversell the source
+    reservation = reserve_seats(allocation.id, qty, name, dept)
+    if reservation.sold_out:
+        messages.error(request, f"Insufficient seats! This source only has {reservation.remaining or 0} left.")
     else:
-        # Create the claim linked to the specific source allocation
-        Claim.objects.create(
-            allocation=allocation,
-            claimant_name=name,
-            department=dept,
-            quantity=qty
-        )
         messages.success(request, f"Successfully booked {qty} seats for {name} (Source: {allocation.source.name}).")
 
-    return redirect('event_dashboard', event_id=event_id)
\ No newline at end of file
+    return redirect('event_dashboard', event_id=event_id)
+
+
+@login_required
+def export_event(request, event_id, kind):
+    """Streams an event's claims or allocations as CSV (default) or ?format=xlsx."""
+    event = get_object_or_404(Event.objects.select_related('venue'), id=event_id)
+    if kind not in EXPORTS:
+        raise Http404("Unknown export.")
+
+    rows = EXPORTS[kind](event)
+    filename = f"event-{event.id}-{kind}"
+    if request.GET.get('format') == 'xlsx':
+        return FileResponse(write_xlsx(rows, kind), as_attachment=True, filename=f"{filename}.xlsx")
+
+    response = StreamingHttpResponse(stream_csv(rows), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{filename}.csv"'
+    return response
+
+
+@login_required
+async def event_live(request, event_id):
+    """
+    Server-sent events stream of an event's inventory deltas (see app.live).
+    Needs an ASGI server; each open dashboard holds one connection.
+    """
+    if not await Event.objects.filter(id=event_id).aexists():
+        raise Http404("Event not found.")
+
+    heartbeat = getattr(settings, 'LIVE_HEARTBEAT', 15)
+
+    async def stream():
+        yield "retry: 3000\n\n"
+        async for message in get_broker().subscribe(event_channel(event_id), heartbeat=heartbeat):
+            if message is None:
+                # Comment line keeps proxies from closing an idle connection
+                yield ": keep-alive\n\n"
+            else:
+                yield f"event: {message.get('type', 'message')}\ndata: {json.dumps(message)}\n\n"
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def metrics_view(request):
+    """Prometheus scrape target. Set METRICS_TOKEN to require a bearer token."""
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token and not constant_time_compare(request.headers.get('Authorization', ''), f"Bearer {token}"):
+        return HttpResponse(status=401)
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
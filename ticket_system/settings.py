@@ -54,8 +54,17 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.AllowAny',
     ),
+    # Keyset pagination + ?param= filters on every list API
+    'DEFAULT_PAGINATION_CLASS': 'app.api.pagination.CursorPagination',
+    'PAGE_SIZE': int(os.environ.get("API_PAGE_SIZE", 50)),
+    'DEFAULT_FILTER_BACKENDS': (
+        'app.api.filters.QueryParamFilter',
+    ),
 }
 
+# Ceiling for ?page_size= on list APIs
+API_MAX_PAGE_SIZE = int(os.environ.get("API_MAX_PAGE_SIZE", 200))
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
@@ -72,7 +81,13 @@ SPECTACULAR_SETTINGS = {
 # MIDDLEWARE
 # ======================
 MIDDLEWARE = [
+    # Outermost, so its timings and query counts cover the whole stack
+    'app.middleware.QueryMetricsMiddleware',
+    # Before the session/auth lookups so they can read from a replica
+    'app.middleware.ReplicaRoutingMiddleware',
     "corsheaders.middleware.CorsMiddleware",
+    # After CORS so 429s carry its headers, before sessions/auth so they skip the database
+    'app.middleware.ThrottleMiddleware',
     "django.middleware.common.CommonMiddleware",
 
     'django.middleware.security.SecurityMiddleware',
@@ -84,8 +99,10 @@ MIDDLEWARE = [
 ]
 
 # CORS config
-CORS_ALLOW_HEADERS = list(default_headers) + ["authorization"]
+CORS_ALLOW_HEADERS = list(default_headers) + ["authorization", "idempotency-key"]
 CORS_ALLOW_ALL_ORIGINS = True
+# Let browser clients read when to retry a 429
+CORS_EXPOSE_HEADERS = ["retry-after"]
 
 # ======================
 # URLS & TEMPLATES
@@ -120,6 +137,93 @@ DATABASES = {
     )
 }
 
+# ======================
+# READ REPLICAS (comma-separated URLs, e.g. two local SQLite files:
+# REPLICA_DATABASE_URLS=sqlite:///replica.sqlite3). GET/HEAD requests read
+# from them; writes, and clients that just wrote, use "default". Under
+# test they mirror the default database.
+# ======================
+for number, url in enumerate(filter(None, os.environ.get("REPLICA_DATABASE_URLS", "").split(",")), start=1):
+    DATABASES[f"replica_{number}"] = {
+        **dj_database_url.parse(url, conn_max_age=600),
+        "TEST": {"MIRROR": "default"},
+    }
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != "default"]
+DATABASE_ROUTERS = ["app.replicas.PrimaryReplicaRouter"]
+
+# Seconds a client keeps reading from the primary after a write
+PRIMARY_PIN_SECONDS = int(os.environ.get("PRIMARY_PIN_SECONDS", 10))
+
+# ======================
+# CACHE (locmem by default; point CACHE_BACKEND/CACHE_LOCATION at Redis or
+# Memcached in production so every worker shares it: throttling and the
+# dashboard grid versions need it, see app/checks.py, and `check --deploy`
+# fails without it)
+# ======================
+CACHES = {
+    "default": {
+        "BACKEND": os.environ.get("CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.environ.get("CACHE_LOCATION", ""),
+    }
+}
+
+# Seconds an event dashboard grid may be served from cache
+EVENT_GRID_CACHE_TIMEOUT = int(os.environ.get("EVENT_GRID_CACHE_TIMEOUT", 300))
+
+# ======================
+# LIVE DASHBOARDS (server-sent events; needs an ASGI server)
+# ======================
+# Dotted path to the pub/sub broker; the in-process one only reaches
+# clients connected to the same worker
+LIVE_BROKER = os.environ.get("LIVE_BROKER", "app.live.InProcessBroker")
+
+# Seconds between keep-alive comments on idle streams
+LIVE_HEARTBEAT = int(os.environ.get("LIVE_HEARTBEAT", 15))
+
+# ======================
+# THROTTLING (token buckets in the default cache, so share it between
+# workers; "N/period" refills N tokens per s/min/hour/day, "" disables)
+# ======================
+THROTTLE_PATHS = ("/api/", "/process-claim/")
+THROTTLE_RATES = {
+    # Per JWT user (user_id claim of a valid bearer token)
+    "user": os.environ.get("THROTTLE_USER_RATE", "1200/min"),
+    # Per client IP, for requests without a bearer token (sessions included)
+    "ip": os.environ.get("THROTTLE_IP_RATE", "600/min"),
+    # Per event, shared by every client (URL event_id, ?event= or form field)
+    "event": os.environ.get("THROTTLE_EVENT_RATE", "6000/min"),
+}
+# Trusted proxies in front of the app; the client IP is read from X-Forwarded-For
+THROTTLE_NUM_PROXIES = int(os.environ.get("THROTTLE_NUM_PROXIES", 0))
+
+# ======================
+# IDEMPOTENCY KEYS (claim/allocation POSTs; purge with purge_idempotency_keys)
+# ======================
+# Seconds a response is replayed to retries sent with the same key
+IDEMPOTENCY_KEY_TTL = int(os.environ.get("IDEMPOTENCY_KEY_TTL", 86400))
+# Seconds before a retry may take over a request that never answered (its
+# worker died); keep it above the server's request timeout
+IDEMPOTENCY_LOCK_SECONDS = int(os.environ.get("IDEMPOTENCY_LOCK_SECONDS", 60))
+
+# ======================
+# GATE SYNC (offline gate devices; see app/gate.py)
+# ======================
+# Seconds of changes re-sent before a delta's `since`: a change commits
+# after later-numbered ones when its transaction runs long, so this must
+# exceed the longest transaction that writes claims or allocations
+GATE_DELTA_LOOKBACK_SECONDS = int(os.environ.get("GATE_DELTA_LOOKBACK_SECONDS", 60))
+
+# ======================
+# METRICS (Prometheus text format at /metrics)
+# ======================
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
+# Requests slower than this (ms) log their slowest queries; override per
+# view name, e.g. {"allocation_sources_page": 200}, or None to disable
+METRICS_SLOW_REQUEST_MS = int(os.environ.get("METRICS_SLOW_REQUEST_MS", 500))
+METRICS_SLOW_VIEWS = {}
+METRICS_SLOW_QUERY_LOG = 5
+
 # ======================
 # PASSWORD VALIDATION
 # ======================